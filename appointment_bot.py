@@ -1,18 +1,40 @@
-from langchain.agents import Tool, AgentExecutor, create_react_agent
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain.prompts import PromptTemplate
-from langchain.memory import ConversationBufferMemory
-import gspread
-from oauth2client.service_account import ServiceAccountCredentials
-from datetime import datetime, timedelta
+# LangChain agents, Gemini and gspread take seconds to import, so they are
+# imported where the clients are first built (see warm_up)
+from langchain_core.tools import Tool
+from datetime import date, datetime, timedelta
+import io
 import json
-import google.generativeai as genai
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import os
+import atexit
+import time
+import asyncio
+import contextlib
 import logging
-from typing import Dict, Any, Optional
+import queue
+import threading
+from typing import Dict, Any, Optional, Iterable, Iterator, AsyncIterator, List, Sequence, Tuple
 from dotenv import load_dotenv
+from session_store import SessionStore, DEFAULT_SESSION_ID, current_session_id
+from history import HistoryManager
+from appointment_store import AppointmentStore, InMemoryAppointmentStore, SQLiteAppointmentStore
+from concurrency import ServiceSaturated
+from sheets_writer import SheetsWriteBehind
+from fast_path import FastPath
+from llm_cache import ResponseCache, prompt_fingerprint
+from metrics import AgentMetrics, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from structured_agent import STRUCTURED_PROMPT, StructuredBookingAgent
+from streaming import StreamingChatModel, StreamingAnswerHandler, iter_sse
+from availability import SlotUnavailable, parse_date, parse_time, parse_date_time, format_time
+from state_backend import RedisStateBackend, SharedAvailabilityIndex, StateBackend
+from schedule import ProviderSchedule, ScheduleConfig
+from bulk import MEDIA_TYPES, batched, bulk_format, iter_export, iter_records, normalize_import
+from llm_scheduler import LLMScheduler, ScheduledChatModel, booking_priority, llm_priority
+from recording import ConversationRecorder
+from idempotency import DedupClaim, IdempotencyCache
+from reminders import (DEFAULT_OFFSETS_MINUTES, FileSink, NotificationSink, ReminderScheduler, SMTPEmailSink,
+                       SQLiteReminderStore, WebhookSMSSink)
 load_dotenv()
 
 
@@ -20,56 +42,269 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class OptimizedAppointmentAgent:
-    def __init__(self, gemini_api_key: str, google_sheets_credentials_path: Optional[str] = None, sheet_url: Optional[str] = None):
-        """Initialize the optimized appointment scheduling agent"""
+AGENT_MODES = ("react", "structured")
+GEMINI_MODEL = "gemini-1.5-pro"
+GEMINI_TEMPERATURE = 0.1
 
-        # Initialize Gemini LLM
-        try:
-            self.llm = ChatGoogleGenerativeAI(
-                model="gemini-1.5-pro",
-                google_api_key=gemini_api_key,
-                temperature=0.1,
-                convert_system_message_to_human=True
-            )
+# Static instructions are sent on every ReAct iteration, so keep them short.
+# create_react_agent binds {tools} and {tool_names} once; only the history,
+# input and scratchpad change per call.
+AGENT_PROMPT = """You are a warm, professional appointment scheduling assistant for a healthcare practice. Help the patient book an appointment through natural conversation.
 
-            genai.configure(api_key=gemini_api_key)
-            self.gemini_model = genai.GenerativeModel('gemini-1.5-pro')
-            logger.info("✅ Gemini AI initialized successfully")
+Collect, one question at a time: name, appointment type (checkup, consultation, follow-up, urgent, specialist, dental), date, time, email and phone.
+- Parse dates and times flexibly ("tomorrow", "next Monday", "2pm"). Dates must not be in the past.
+- Check availability before offering a slot; the tools know opening hours, closures and appointment lengths. Summarize all details and get confirmation before saving.
+- To save, call save_appointment with JSON: {{"name": "John Doe", "appointment_type": "checkup", "date": "2024-12-20", "time": "14:00", "email": "john@email.com", "phone": "1234567890"}}
+- Be concise and friendly. Emojis welcome: 🏥 👤 📅 🕐 📧 ✅ ❌
 
-        except Exception as e:
-            logger.error(f"❌ Failed to initialize Gemini AI: {e}")
-            raise
+TOOLS:
+{tools}
 
-        # Initialize Google Sheets (optional)
-        self.gc = None
+To use a tool:
+Thought: Do I need to use a tool? Yes
+Action: one of [{tool_names}]
+Action Input: the tool input
+Observation: the tool result
+
+To reply to the patient:
+Thought: Do I need to use a tool? No
+Final Answer: your reply
+
+CONVERSATION SO FAR:
+{chat_history}
+
+Patient: {input}
+{agent_scratchpad}"""
+
+class OptimizedAppointmentAgent:
+    def __init__(self, gemini_api_key: str, google_sheets_credentials_path: Optional[str] = None, sheet_url: Optional[str] = None,
+                 max_sessions: int = 10000, session_ttl_seconds: float = 1800,
+                 sheets_spool_path: Optional[str] = "sheets_spool.jsonl", enable_fast_path: bool = True,
+                 response_cache: Optional[ResponseCache] = None, history_token_budget: int = 600,
+                 llm=None, store: Optional[AppointmentStore] = None, slot_hold_seconds: float = 120,
+                 gspread_client=None, agent_mode: str = "react", state_backend: Optional[StateBackend] = None,
+                 schedule: Optional[ScheduleConfig] = None, llm_scheduler: Optional[LLMScheduler] = None,
+                 fallback_model: Optional[str] = None, fallback_llm=None,
+                 recorder: Optional[ConversationRecorder] = None, idempotency: Optional[IdempotencyCache] = None,
+                 reminders: Optional[ReminderScheduler] = None):
+        """Initialize the optimized appointment scheduling agent
+
+        `llm` replaces the Gemini chat model and `gspread_client` the authorized
+        Sheets client, e.g. with scripted fakes for benchmarks. `agent_mode` is
+        "react" (multi-step tool loop) or "structured" (one JSON extraction call
+        per turn, with availability checks and saves run locally). With a
+        `state_backend`, session histories, booked slots and holds are shared
+        by every bot process using the same backend. `schedule` sets providers,
+        working hours, appointment lengths and closures (default: one provider,
+        09:00-17:00 every day). With an `llm_scheduler`, every model call is
+        rate limited to quota, prioritized and retried; overflow goes to
+        `fallback_llm` (or a Gemini `fallback_model`) when one is set. A
+        `recorder` captures turns for the replay runner (benchmarks/replay.py).
+        `idempotency` answers redelivered messages from the first delivery's
+        turn instead of running the agent (and save_appointment) again.
+        `reminders` schedules email/SMS reminders for every saved appointment
+        and is started here.
+        """
+        if agent_mode not in AGENT_MODES:
+            raise ValueError(f"Unknown agent_mode {agent_mode!r}, expected one of {', '.join(AGENT_MODES)}")
+        self.agent_mode = agent_mode
+
+        # Gemini client and agent are built on first use or by warm_up(), not here
+        self.gemini_api_key = gemini_api_key
+        self.llm_scheduler = llm_scheduler
+        self.fallback_model = fallback_model
+        self._fallback_llm = fallback_llm
+        self._llm = self._schedule_llm(llm) if llm is not None else None
+        self._agent = None
+        self._lazy_lock = threading.RLock()
+        self.ready = threading.Event()
+        self.model_name = getattr(llm, 'model', type(llm).__name__) if llm else GEMINI_MODEL
+        self.temperature = getattr(llm, 'temperature', None) if llm else GEMINI_TEMPERATURE
+
+        # Counters and histograms for /metrics; cheap enough to stay on in production
+        self.metrics = AgentMetrics()
+        self.recorder = recorder
+        self.idempotency = idempotency
+        if llm_scheduler is not None:
+            llm_scheduler.on_wait = llm_scheduler.on_wait or self.metrics.observe_llm_wait
+            llm_scheduler.on_event = llm_scheduler.on_event or self.metrics.count_llm_event
+            self.metrics.gauge("llm_quota_waiting", "LLM calls queued for rate-limit quota",
+                               lambda: llm_scheduler.waiting)
+        self.reminders = reminders
+        if reminders is not None:
+            reminders.on_dispatch = reminders.on_dispatch or self.metrics.observe_reminder_batch
+            self.metrics.gauge("reminders_pending", "Reminders scheduled and not yet sent",
+                               lambda: reminders.pending_count)
+            reminders.start()
+            atexit.register(reminders.stop)
+
+        # Initialize Google Sheets (optional); the writer thread authorizes and connects
+        sheets_client = gspread_client
         self.sheet_url = sheet_url
-        if google_sheets_credentials_path and sheet_url:
-            self.gc = self._setup_google_sheets(google_sheets_credentials_path)
-
-        # Initialize memory
-        self.memory = ConversationBufferMemory(
-            memory_key="chat_history",
-            return_messages=True,
-            k=5
+        self.sheets_writer = None
+        if sheets_client is None and google_sheets_credentials_path and sheet_url:
+            if os.path.exists(google_sheets_credentials_path):
+                sheets_client = lambda: self._setup_google_sheets(google_sheets_credentials_path)
+            else:
+                logger.warning(f"⚠️ Google Sheets credentials file not found: {google_sheets_credentials_path}")
+        if sheets_client is not None and sheet_url:
+            # Writes happen off the request path so chat latency never includes the Sheets API
+            self.sheets_writer = SheetsWriteBehind(sheets_client, sheet_url, spool_path=sheets_spool_path,
+                                                   on_append=self.metrics.observe_sheets_append)
+            self.sheets_writer.start()
+            atexit.register(self.sheets_writer.stop)
+
+        # Per-session conversation state; the LLM client, tools and agent below are shared
+        self.history_token_budget = history_token_budget
+        self.sessions = SessionStore(
+            memory_factory=self._create_memory,
+            max_sessions=max_sessions,
+            ttl_seconds=session_ttl_seconds,
+            backend=state_backend
         )
 
         # Store appointment data
-        self.appointments_cache = []
-
-        # Simplified state - let LLM manage complexity
-        self.appointment_data = {}
+        self.store = store or InMemoryAppointmentStore()
+        self.state_backend = state_backend
+        self.schedule = schedule or ScheduleConfig.default()
+        ledger_factory = None
+        if state_backend is not None:
+            ledger_factory = lambda provider: SharedAvailabilityIndex(
+                state_backend, default_duration=self.schedule.default_duration, slot_step=self.schedule.slot_step,
+                hold_ttl=slot_hold_seconds, namespace=provider.id
+            )
+        self.availability = ProviderSchedule(self.schedule, ledger_factory, hold_ttl=slot_hold_seconds)
+        self._warm_load_availability()
 
-        # Initialize tools and agent
+        # Initialize tools and the templated booking flow; the agent itself is lazy
         self.tools = self._create_tools()
-        self.agent = self._create_agent()
+        self.tool_map = {tool.name: tool for tool in self.tools}
+        self.booking_flow = FastPath(
+            check_slot=self._check_slot_conflict,
+            save=self.tool_map['save_appointment'].func
+        )
 
-    def _setup_google_sheets(self, credentials_path: str) -> Optional[gspread.Client]:
-        """Setup Google Sheets connection"""
+        # Structured turns (emails, phones, dates, "yes") are answered locally without the LLM
+        self.fast_path = self.booking_flow if enable_fast_path else None
+        # Answers to first-turn messages that needed no tools, e.g. greetings and FAQs
+        self.response_cache = response_cache
+        self._prompt_fingerprint = prompt_fingerprint(
+            STRUCTURED_PROMPT if self.agent_mode == "structured" else AGENT_PROMPT,
+            [f"{tool.name}: {tool.description}" for tool in self.tools]
+        )
+
+        self._turn_stats_lock = threading.Lock()
+        self.turns_total = 0
+        self.turns_local = 0
+
+        self.metrics.gauge("active_sessions", "Conversations held in memory", lambda: len(self.sessions))
+        self.metrics.gauge("slot_holds", "Slots held for sessions awaiting confirmation", self.availability.holds_count)
+        if self.sheets_writer:
+            self.metrics.gauge("sheets_queue_depth", "Rows waiting for the Sheets writer",
+                               lambda: self.sheets_writer.stats()['queue_depth'])
+
+    @property
+    def llm(self):
+        """Chat model, created on first use"""
+        if self._llm is None:
+            with self._lazy_lock:
+                if self._llm is None:
+                    self._llm = self._schedule_llm(self._create_llm())
+        return self._llm
+
+    def _schedule_llm(self, llm):
+        """Route the model through the LLM scheduler, if one is configured"""
+        if self.llm_scheduler is None:
+            return llm
+        fallback = self._fallback_llm
+        if fallback is None and self.fallback_model:
+            fallback = self._create_llm(self.fallback_model)
+        return ScheduledChatModel(primary=llm, fallback=fallback, scheduler=self.llm_scheduler)
+
+    @property
+    def agent(self):
+        """Agent executor (or structured agent), created on first use"""
+        if self._agent is None:
+            with self._lazy_lock:
+                if self._agent is None:
+                    self._agent = self._create_agent()
+        return self._agent
+
+    def _create_llm(self, model: str = GEMINI_MODEL):
+        """Initialize Gemini LLM"""
         try:
-            if not os.path.exists(credentials_path):
-                logger.warning(f"⚠️ Google Sheets credentials file not found: {credentials_path}")
-                return None
+            from langchain_google_genai import ChatGoogleGenerativeAI
+
+            llm = ChatGoogleGenerativeAI(
+                model=model,
+                google_api_key=self.gemini_api_key,
+                temperature=GEMINI_TEMPERATURE,
+                convert_system_message_to_human=True
+            )
+            logger.info(f"✅ Gemini AI ({model}) initialized successfully")
+            return llm
+
+        except Exception as e:
+            logger.error(f"❌ Failed to initialize Gemini AI: {e}")
+            raise
+
+    def warm_up(self):
+        """Build the LLM client and agent, then open the Gemini connection, ahead of the first chat
+
+        Safe to call more than once. `ready` is set once the agent is built (or
+        failed to build, since it is retried on first use); the connection is
+        warmed afterwards so a slow network never holds readiness back.
+        """
+        started = time.perf_counter()
+        try:
+            self.agent  # builds the LLM client too
+            logger.info(f"✅ Agent ready in {(time.perf_counter() - started) * 1000:.0f} ms")
+        except Exception as e:
+            logger.warning(f"⚠️ Agent warm-up incomplete, finishing on first use: {e}")
+            return
+        finally:
+            self.ready.set()
+
+        client = getattr(getattr(self._llm, 'primary', self._llm), 'client', None)
+        if client is None or not hasattr(client, 'count_tokens'):
+            return
+        try:
+            # Free call that sets up the gRPC channel later generate calls reuse
+            client.count_tokens("ping")
+            logger.info(f"✅ Gemini connection warmed in {(time.perf_counter() - started) * 1000:.0f} ms")
+        except Exception as e:
+            logger.warning(f"⚠️ Could not warm the Gemini connection: {e}")
+
+    def start_warm_up(self) -> threading.Thread:
+        """Run warm_up on a background thread so the server can answer /health immediately"""
+        thread = threading.Thread(target=self.warm_up, name="agent-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _create_memory(self) -> HistoryManager:
+        """Create token-bounded chat history for a single conversation"""
+        return HistoryManager(token_budget=self.history_token_budget)
+
+    def _warm_load_availability(self):
+        """Rebuild the in-memory slot index from the persistent store"""
+        started = time.perf_counter()
+
+        def slots():
+            for date, time_, duration, provider in self.store.iter_slots():
+                try:
+                    yield parse_date(date), parse_time(time_), duration, provider
+                except ValueError:
+                    logger.warning(f"⚠️ Skipping stored appointment with unreadable slot: {date} {time_}")
+
+        # A shared backend receives these in pipelined batches
+        loaded = self.availability.add_many(slots())
+        logger.info(f"✅ Loaded {loaded} booked slots in {(time.perf_counter() - started) * 1000:.0f} ms")
+
+    def _setup_google_sheets(self, credentials_path: str):
+        """Setup Google Sheets connection; runs on the Sheets writer thread, which retries failures"""
+        try:
+            import gspread
+            from oauth2client.service_account import ServiceAccountCredentials
 
             scope = [
                 'https://spreadsheets.google.com/feeds',
@@ -84,30 +319,30 @@ class OptimizedAppointmentAgent:
 
         except Exception as e:
             logger.warning(f"⚠️ Google Sheets setup failed: {e}")
-            return None
+            raise
+
+    @staticmethod
+    def _sheet_row(data: dict) -> List[Any]:
+        return [
+            data.get('name') or '',
+            data.get('appointment_type') or '',
+            data.get('date') or '',
+            data.get('time') or '',
+            data.get('email') or '',
+            data.get('phone') or '',
+            data.get('created_at') or '',
+            data.get('status') or ''
+        ]
 
     def _append_to_google_sheets(self, data: dict):
-        """Append appointment data to Google Sheets"""
+        """Queue appointment data for the background Google Sheets writer"""
         try:
-            if self.gc and self.sheet_url:
-                sh = self.gc.open_by_url(self.sheet_url)
-                worksheet = sh.sheet1
-
-                worksheet.append_row([
-                    data.get('name', ''),
-                    data.get('appointment_type', ''),
-                    data.get('date', ''),
-                    data.get('time', ''),
-                    data.get('email', ''),
-                    data.get('phone', ''),
-                    data.get('created_at', ''),
-                    data.get('status', '')
-                ])
-                logger.info("✅ Appointment appended to Google Sheets.")
+            if self.sheets_writer:
+                self.sheets_writer.enqueue(self._sheet_row(data))
             else:
                 logger.warning("⚠️ Google Sheets client not configured. Skipping append.")
         except Exception as e:
-            logger.error(f"❌ Failed to append to Google Sheets: {e}")
+            logger.error(f"❌ Failed to queue Google Sheets append: {e}")
 
     def _create_tools(self):
         """Create tools for appointment management - Keep only essential Python operations"""
@@ -115,17 +350,54 @@ class OptimizedAppointmentAgent:
         def check_availability(date_time: str) -> str:
             """Check if the requested time slot is available"""
             try:
-                # Simple availability check against existing appointments
-                for appointment in self.appointments_cache:
-                    if (appointment.get('date') in date_time and
-                        appointment.get('time') in date_time):
-                        return f"❌ Time slot {date_time} is already booked. Please choose another time."
+                day, start = parse_date_time(date_time)
+            except ValueError:
+                return f"⚠️ Could not read '{date_time}'. Please use format 'YYYY-MM-DD HH:MM'."
 
-                return f"✅ Time slot {date_time} is available!"
+            try:
+                slot = f"{day.isoformat()} {format_time(start)}"
+                owner = current_session_id.get()
+                appointment_type = self._session_appointment_type()
+                # Hold the slot for this session so a concurrent booking cannot take it before confirmation
+                if self.availability.hold(day, start, owner=owner, appointment_type=appointment_type):
+                    return f"✅ Time slot {slot} is available! It is held for you while you confirm."
+
+                alternatives = self.availability.next_free_slots(
+                    datetime.combine(day, datetime.min.time()) + timedelta(minutes=start),
+                    owner=owner,
+                    appointment_type=appointment_type
+                )
+                suggestion = ", ".join(slot.strftime("%Y-%m-%d %H:%M") for slot in alternatives)
+                reason = (self.availability.closed_reason(day, start, appointment_type=appointment_type)
+                          or f"Time slot {slot} is already booked.")
+                return f"❌ {reason} Please choose another time." + (
+                    f" Next available: {suggestion}" if suggestion else ""
+                )
 
             except Exception as e:
+                # The index and holds decide bookings, so an error must never read as "available"
                 logger.error(f"Error checking availability: {e}")
-                return f"✅ Time slot appears available"
+                return f"⚠️ Could not check availability for {date_time} right now. Please try again in a moment."
+
+        def find_available_slots(date_time: str) -> str:
+            """List the next free slots at or after a date or date and time"""
+            try:
+                try:
+                    day, start = parse_date_time(date_time)
+                except ValueError:
+                    day, start = parse_date(date_time), 0
+                after = max(
+                    datetime.combine(day, datetime.min.time()) + timedelta(minutes=start),
+                    datetime.now()
+                )
+                slots = self.availability.next_free_slots(after, owner=current_session_id.get(),
+                                                          appointment_type=self._session_appointment_type())
+                if not slots:
+                    return "❌ No free slots found in the next 30 days."
+                return "✅ Next available slots: " + ", ".join(slot.strftime("%Y-%m-%d %H:%M") for slot in slots)
+
+            except ValueError:
+                return f"⚠️ Could not read '{date_time}'. Please use format 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM'."
 
         def save_appointment(appointment_json: str) -> str:
             """Save complete appointment data as JSON string with fields: name, appointment_type, date, time, email, phone"""
@@ -139,15 +411,45 @@ class OptimizedAppointmentAgent:
                 if missing_fields:
                     return f"❌ Cannot save appointment. Missing: {', '.join(missing_fields)}"
 
+                # Normalize date and time so the index and Sheets agree on the slot
+                day = parse_date(str(data['date']))
+                start = parse_time(str(data['time']))
+                data['date'] = day.isoformat()
+                data['time'] = format_time(start)
+
+                data['duration_minutes'] = self._appointment_duration(data)
+
+                # Compare-and-set: books with the first provider nobody else booked or holds
+                try:
+                    provider = self.availability.confirm(day, start, data['duration_minutes'],
+                                                         owner=current_session_id.get(),
+                                                         appointment_type=data['appointment_type'])
+                except SlotUnavailable:
+                    reason = (self.availability.closed_reason(day, start, data['duration_minutes'], data['appointment_type'])
+                              or f"Time slot {data['date']} {data['time']} is already booked.")
+                    return f"❌ {reason} Please choose another time."
+                data['provider'] = provider
+
                 # Add metadata
                 data['created_at'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
                 data['status'] = 'Confirmed'
 
-                # Save to cache
-                self.appointments_cache.append(data)
-
-                # Save to Google Sheets
+                # The store's overlap check is the final word, e.g. across processes sharing the file
+                try:
+                    self.store.save(data)
+                except SlotUnavailable:
+                    self.availability.remove(day, start, provider=provider)
+                    return f"❌ Time slot {data['date']} {data['time']} is already booked. Please choose another time."
+                except Exception:
+                    self.availability.remove(day, start, provider=provider)
+                    raise
+
+                # Mirror to Google Sheets
                 self._append_to_google_sheets(data)
+                if self.recorder:
+                    self.recorder.booked(current_session_id.get(), data)
+                if self.reminders:
+                    self.reminders.schedule(data)
 
                 logger.info(f"✅ Appointment saved for {data.get('name')}")
                 return f"✅ Appointment successfully saved for {data.get('name')}!"
@@ -166,6 +468,11 @@ class OptimizedAppointmentAgent:
                 description="Check if appointment time is available. Use format: 'YYYY-MM-DD HH:MM'",
                 func=check_availability
             ),
+            Tool(
+                name="find_available_slots",
+                description="Find the next free appointment slots at or after a date. Use format: 'YYYY-MM-DD' or 'YYYY-MM-DD HH:MM'",
+                func=find_available_slots
+            ),
             Tool(
                 name="save_appointment",
                 description="Save complete appointment data as JSON string with fields: name, appointment_type, date, time, email, phone",
@@ -178,134 +485,632 @@ class OptimizedAppointmentAgent:
             )
         ]
 
+    def _session_appointment_type(self) -> Optional[str]:
+        """Appointment type collected so far in the current turn's session, for slot lengths and providers"""
+        session = self.sessions.peek(current_session_id.get() or DEFAULT_SESSION_ID)
+        return session.appointment_data.get('appointment_type') if session else None
+
+    def _appointment_duration(self, data: Dict[str, Any]) -> int:
+        """Minutes from the model's appointment JSON if usable, otherwise the appointment type's length"""
+        default = self.schedule.duration_for(data.get('appointment_type'))
+        value = data.get('duration_minutes')
+        if value in (None, ""):
+            return default
+        try:
+            duration = int(float(value))
+        except (TypeError, ValueError):
+            duration = 0
+        if not 0 < duration <= 24 * 60:
+            logger.warning(f"⚠️ Ignoring unusable duration {value!r}, using {default} minutes")
+            return default
+        return duration
+
+    def _check_slot_conflict(self, date: str, time: str) -> Optional[str]:
+        """None if the slot is free, otherwise a message with alternatives"""
+        day, start = parse_date(date), parse_time(time)
+        owner = current_session_id.get()
+        appointment_type = self._session_appointment_type()
+        if self.availability.hold(day, start, owner=owner, appointment_type=appointment_type):
+            return None
+        alternatives = self.availability.next_free_slots(
+            datetime.combine(day, datetime.min.time()) + timedelta(minutes=start),
+            owner=owner,
+            appointment_type=appointment_type
+        )
+        suggestion = ", ".join(slot.strftime("%Y-%m-%d %H:%M") for slot in alternatives)
+        reason = (self.availability.closed_reason(day, start, appointment_type=appointment_type)
+                  or f"{date} at {time} is already booked.")
+        return f"❌ {reason}" + (
+            f" Next available: {suggestion}. Which time would you prefer?" if suggestion else " Please choose another time."
+        )
+
     def _create_agent(self):
-        """Create the LangChain agent with comprehensive prompt"""
+        """Create the LangChain agent with a compact ReAct prompt, or the single-call structured agent"""
+        if self.agent_mode == "structured":
+            return StructuredBookingAgent(
+                llm=self.llm,
+                flow=self.booking_flow,
+                find_slots=self.tool_map['find_available_slots'].func
+            )
+
+        from langchain.agents import AgentExecutor, create_react_agent
+        from langchain_core.prompts import PromptTemplate
 
         prompt_template = PromptTemplate(
             input_variables=["input", "agent_scratchpad", "tools", "tool_names", "chat_history"],
-            template="""You are a friendly, professional appointment scheduling assistant for a healthcare practice. Your role is to help users book appointments through natural conversation while gathering all necessary information.
-
-## Your Personality:
-- Warm, empathetic, and professional
-- Patient and understanding
-- Clear in communication
-- Efficient but not rushed
-
-## Conversation Flow:
-1. **Greeting**: Warmly introduce yourself and ask how you can help
-2. **Information Collection**: Gather user details conversationally
-3. **Appointment Details**: Understand their needs and preferences
-4. **Booking Process**: Guide them through scheduling
-5. **Confirmation**: Confirm all details before finalizing
-
-CORE RESPONSIBILITIES:
-1. Extract and validate patient information from natural conversation
-2. Guide patients through the appointment booking process
-3. Handle date/time parsing and validation intelligently
-4. Maintain a friendly, professional healthcare assistant persona
-5. Ensure all required information is collected before booking
-
-AVAILABLE TOOLS:
-{tools}
-
-TOOL NAMES: {tool_names}
-
-CONVERSATION CONTEXT:
-{chat_history}
-
-INTELLIGENT INFORMATION EXTRACTION RULES:
-- Extract names from phrases like "My name is...", "I'm...", "This is...", or standalone name inputs
-- Parse dates flexibly: "tomorrow", "next Monday", "December 20th", "12/20/2024", relative terms
-- Parse times flexibly: "2pm", "14:00", "2:30 PM", "afternoon", "morning"
-- Identify appointment types: checkup, consultation, follow-up, urgent, specialist, dental, etc.
-- Extract email addresses and phone numbers automatically from user input
-- Handle confirmation responses: "yes", "correct", "looks good", "confirm"
-
-CONVERSATION FLOW MANAGEMENT:
-1. Greeting: Welcome patient warmly and ask for their name
-2. Information Collection: Gather name, appointment type, preferred date/time, email, phone
-3. Confirmation: Summarize all details and ask for confirmation
-4. Booking: Use save_appointment tool with complete JSON data
-5. Completion: Provide confirmation with all appointment details
-
-RESPONSE GUIDELINES:
-- Be conversational and natural, not robotic
-- Ask for one piece of information at a time if missing
-- Validate dates (not in the past, reasonable business hours)
-- Always confirm details before saving
-- Handle errors gracefully with helpful suggestions
-- Use emojis appropriately for healthcare context: 🏥 👤 📅 🕐 📧 ✅ ❌
-
-CRITICAL: Always use the tools when needed. For saving appointments, format data as JSON:
-{{"name": "John Doe", "appointment_type": "checkup", "date": "2024-12-20", "time": "14:00", "email": "john@email.com", "phone": "1234567890"}}
-
-Current user input: {input}
-
-Think step by step:
-1. What information do I have so far?
-2. What information is still needed?
-3. How should I respond to guide the conversation forward?
-4. Do I need to use any tools?
-
-{agent_scratchpad}"""
+            template=AGENT_PROMPT
         )
 
+        # Streaming wrapper lets callback handlers see final-answer tokens as they arrive
         agent = create_react_agent(
-            llm=self.llm,
+            llm=StreamingChatModel(inner=self.llm),
             tools=self.tools,
             prompt=prompt_template
         )
 
+        # Memory is supplied per call from the session store, so one executor serves every conversation
         return AgentExecutor(
             agent=agent,
             tools=self.tools,
-            memory=self.memory,
             verbose=True,
             max_iterations=5,
             handle_parsing_errors=True,
-            return_intermediate_steps=False
+            return_intermediate_steps=True
         )
 
-    def process_message(self, user_message: str) -> str:
-        """Process user message using the LLM agent"""
+    def process_message(self, user_message: str, session_id: str = DEFAULT_SESSION_ID, callbacks=None,
+                        idempotency_key: Optional[str] = None) -> str:
+        """Process user message using the LLM agent
+
+        A redelivery of a message (same `idempotency_key`, or the same text as
+        the session's latest message when content matching is enabled) gets
+        the first delivery's reply.
+        """
+        claim = self._claim_turn(session_id, user_message, idempotency_key)
+        if claim and not claim.leader:
+            return claim.result()
+
+        trace = self.metrics.start_turn(session_id)
+        recording, callbacks = self._start_recording(session_id, user_message, callbacks)
+        output = None
         try:
-            logger.info(f"Processing message: {user_message}")
+            logger.info(f"Processing message for session {session_id}: {user_message}")
+            session = self.sessions.begin_turn(session_id)
+            # Tools read the session from context to attribute slot holds
+            session_token = current_session_id.set(session.session_id)
+            priority_token = None
 
-            # Let the LLM agent handle everything
-            response = self.agent.invoke({
-                "input": user_message,
-                "chat_history": self.memory.chat_memory.messages
-            })
-
-            return response.get("output", "I apologize, but I'm having trouble processing your request. Could you please try again?")
+            try:
+                with session.lock:
+                    try:
+                        self.sessions.load(session)
+                        priority_token = llm_priority.set(booking_priority(session.appointment_data))
+                        output, cache_key = self._answer_locally(session, user_message, trace)
+
+                        if output is None:
+                            # Let the LLM agent handle everything else
+                            response = self.agent.invoke(self._agent_inputs(session, user_message),
+                                                         config={"callbacks": [trace, *(callbacks or [])]})
+                            output = self._finish_llm_turn(session, user_message, response, cache_key)
+
+                        self._remember_turn(session, user_message, output)
+                    finally:
+                        # Inside the local lock, so the next local turn takes its own shared lock
+                        self.sessions.unlock(session)
+            finally:
+                if priority_token is not None:
+                    llm_priority.reset(priority_token)
+                current_session_id.reset(session_token)
+                self.sessions.end_turn(session)
+
+            return output
+
+        except ServiceSaturated as e:
+            trace.path = "rejected"
+            logger.warning(f"⚠️ Turn rejected, LLM is saturated: {e}")
+            output = "We are handling a lot of conversations right now. Please send your message again in a moment."
+            return output
+        except Exception as e:
+            trace.path = "error"
+            logger.error(f"Error processing message: {e}")
+            output = "I apologize, but I encountered an error. Could you please repeat your request?"
+            return output
+        finally:
+            if claim:
+                self.idempotency.complete(claim, output, keep=trace.path not in ("error", "rejected"))
+            self.metrics.finish_turn(trace)
+            if recording:
+                self.recorder.finish_turn(recording, output, trace.path, trace.duration)
+
+    async def aprocess_message(self, user_message: str, session_id: str = DEFAULT_SESSION_ID, llm_slot=None,
+                               callbacks=None, idempotency_key: Optional[str] = None) -> str:
+        """Async variant of process_message for the ASGI server
+
+        `llm_slot` is an async context manager held only around the agent call,
+        so turns answered locally never wait for LLM capacity. Saturation and
+        timeouts propagate so the server can answer 429/503; a redelivery
+        waiting on a first delivery that failed that way gets ServiceSaturated.
+        Session, store and cache I/O run in worker threads. Once the turn has an
+        answer it is saved and returned even if the caller cancels meanwhile,
+        so a timeout never reports a turn that was already recorded as failed.
+        """
+        claim = self._claim_turn(session_id, user_message, idempotency_key)
+        if claim and not claim.leader:
+            return await claim.aresult()
+
+        trace = self.metrics.start_turn(session_id)
+        recording, callbacks = self._start_recording(session_id, user_message, callbacks)
+        output = None
+        try:
+            logger.info(f"Processing message for session {session_id}: {user_message}")
+            session = self.sessions.begin_turn(session_id)
+            session_token = current_session_id.set(session.session_id)
+            priority_token = None
 
+            try:
+                async with session.async_lock:
+                    try:
+                        # Finish taking the shared lock even if cancelled, so the finally below releases it
+                        _, cancelled = await self._run_to_completion(self.sessions.load, session)
+                        if cancelled:
+                            raise asyncio.CancelledError()
+                        priority_token = llm_priority.set(booking_priority(session.appointment_data))
+                        # The fast path may book, so it always finishes once started
+                        (output, cache_key), cancelled = await self._run_to_completion(
+                            self._answer_locally, session, user_message, trace
+                        )
+
+                        if output is None:
+                            if cancelled:
+                                raise asyncio.CancelledError()
+                            agent = await self._aget_agent()
+                            async with (llm_slot or contextlib.nullcontext()):
+                                response = await agent.ainvoke(self._agent_inputs(session, user_message),
+                                                               config={"callbacks": [trace, *(callbacks or [])]})
+                            output, _ = await self._run_to_completion(self._finish_llm_turn, session, user_message,
+                                                                      response, cache_key)
+
+                        await self._run_to_completion(self._remember_turn, session, user_message, output)
+                    finally:
+                        await self._run_to_completion(self.sessions.unlock, session)
+            finally:
+                if priority_token is not None:
+                    llm_priority.reset(priority_token)
+                current_session_id.reset(session_token)
+                self.sessions.end_turn(session)
+
+            return output
+
+        except (ServiceSaturated, asyncio.TimeoutError, asyncio.CancelledError):
+            trace.path = "rejected"
+            raise
         except Exception as e:
+            trace.path = "error"
             logger.error(f"Error processing message: {e}")
-            return "I apologize, but I encountered an error. Could you please repeat your request?"
+            output = "I apologize, but I encountered an error. Could you please repeat your request?"
+            return output
+        finally:
+            if claim:
+                self.idempotency.complete(claim, output, keep=trace.path not in ("error", "rejected"))
+            self.metrics.finish_turn(trace)
+            if recording:
+                self.recorder.finish_turn(recording, output, trace.path, trace.duration)
+
+    @staticmethod
+    async def _run_to_completion(func, *args) -> Tuple[Any, bool]:
+        """Run a blocking step in a worker thread and let it finish even if the turn is cancelled
+
+        Returns the step's result and whether a cancellation arrived while it ran.
+        """
+        step = asyncio.ensure_future(asyncio.to_thread(func, *args))
+        try:
+            return await asyncio.shield(step), False
+        except asyncio.CancelledError:
+            return await step, True
+
+    async def _aget_agent(self):
+        """The agent, built in a worker thread on first use so the event loop never waits on its lock"""
+        if self._agent is not None:
+            return self._agent
+        return await asyncio.to_thread(lambda: self.agent)
+
+    def stream_message(self, user_message: str, session_id: str = DEFAULT_SESSION_ID,
+                       idempotency_key: Optional[str] = None) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """Yield ('status' | 'token' | 'done', data) events while the turn runs in a worker thread"""
+        events: "queue.Queue[Optional[Tuple[str, Dict[str, Any]]]]" = queue.Queue()
+        handler = StreamingAnswerHandler(lambda event, data: events.put((event, data)))
+
+        def run():
+            try:
+                output = self.process_message(user_message, session_id, callbacks=[handler],
+                                              idempotency_key=idempotency_key)
+                events.put(('done', {'response': output, 'session_id': session_id}))
+            finally:
+                events.put(None)
+
+        threading.Thread(target=run, name="chat-stream", daemon=True).start()
+        while True:
+            event = events.get()
+            if event is None:
+                return
+            yield event
+
+    async def astream_message(self, user_message: str, session_id: str = DEFAULT_SESSION_ID, llm_slot=None,
+                              timeout: Optional[float] = None,
+                              idempotency_key: Optional[str] = None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """Async counterpart of stream_message; saturation and timeouts arrive as 'error' events"""
+        loop = asyncio.get_running_loop()
+        events: "asyncio.Queue[Optional[Tuple[str, Dict[str, Any]]]]" = asyncio.Queue()
+        # Sync callback handlers may run on executor threads, so hop back onto the loop
+        handler = StreamingAnswerHandler(lambda event, data: loop.call_soon_threadsafe(events.put_nowait, (event, data)))
+
+        task = asyncio.create_task(asyncio.wait_for(
+            self.aprocess_message(user_message, session_id, llm_slot=llm_slot, callbacks=[handler],
+                                  idempotency_key=idempotency_key),
+            timeout=timeout
+        ))
+        task.add_done_callback(lambda _: events.put_nowait(None))
 
-    def reset_conversation(self):
-        """Reset conversation state"""
-        self.memory.clear()
-        self.appointment_data = {}
+        try:
+            while True:
+                event = await events.get()
+                if event is None:
+                    break
+                yield event
 
-# Flask app creation function
-def create_appointment_bot(gemini_api_key: str, google_creds_path: Optional[str] = None, sheet_url: Optional[str] = None):
-    """Create and configure the appointment bot Flask app"""
+            try:
+                output = task.result()
+            except ServiceSaturated:
+                yield 'error', {'status': 429, 'error': 'We are handling a lot of conversations right now. Please try again in a moment.'}
+                return
+            except asyncio.TimeoutError:
+                yield 'error', {'status': 503, 'error': 'The assistant took too long to respond. Please try again.'}
+                return
+            yield 'done', {'response': output, 'session_id': session_id}
+        finally:
+            if not task.done():
+                # Client went away mid-stream
+                task.cancel()
+
+    def _claim_turn(self, session_id: str, user_message: str, idempotency_key: Optional[str]) -> Optional[DedupClaim]:
+        """Claim this delivery for a new turn, or attach it to the first delivery of the same message"""
+        if self.idempotency is None or not self.idempotency.covers(idempotency_key):
+            return None
+        claim = self.idempotency.claim(session_id or DEFAULT_SESSION_ID, user_message, idempotency_key)
+        if not claim.leader:
+            outcome = "replayed" if claim.future.done() else "attached"
+            logger.info(f"🔁 Duplicate delivery for session {session_id} {outcome}")
+            self.metrics.count_duplicate(outcome)
+        return claim
+
+    def _start_recording(self, session_id: str, user_message: str, callbacks):
+        """Recording handler for this turn (or None) and the callbacks with it added"""
+        recording = self.recorder.start_turn(session_id, user_message, self.agent_mode) if self.recorder else None
+        return recording, [*(callbacks or []), recording] if recording else callbacks
+
+    def _answer_locally(self, session, user_message: str, trace=None):
+        """Try the fast path, then the response cache; returns (output or None, cache key)"""
+        output = self.fast_path.handle(session.appointment_data, user_message) if self.fast_path else None
+        self._count_turn(local=output is not None)
+        if output is not None and trace:
+            trace.path = "fast_path"
+
+        cache_key = self._response_cache_key(session, user_message) if output is None else None
+        if cache_key:
+            output = self.response_cache.get(cache_key)
+            if output is not None:
+                if self.agent_mode == "react":
+                    self.booking_flow.learn(session.appointment_data, user_message)
+                if trace:
+                    trace.path = "cache"
+        return output, cache_key
+
+    @staticmethod
+    def _agent_inputs(session, user_message: str) -> Dict[str, Any]:
+        return {
+            "input": user_message,
+            "chat_history": session.memory.render(session.appointment_data),
+            # Only the structured agent reads this; it updates the session's fields in place
+            "appointment_data": session.appointment_data
+        }
+
+    def _finish_llm_turn(self, session, user_message: str, response: Dict[str, Any], cache_key: Optional[str]) -> str:
+        output = response.get("output", "I apologize, but I'm having trouble processing your request. Could you please try again?")
+        if self.agent_mode == "react":
+            # The structured agent fills the session's fields itself; the ReAct agent only talks
+            self.booking_flow.learn(session.appointment_data, user_message, [
+                (action.tool, action.tool_input, observation)
+                for action, observation in response.get("intermediate_steps") or []
+            ])
+
+        # Tool results (availability, current time) go stale, so only plain answers are reused
+        if cache_key and not response.get("intermediate_steps"):
+            self.response_cache.set(cache_key, output)
+        return output
+
+    def _remember_turn(self, session, user_message: str, output: str):
+        session.memory.add_turn(user_message, output)
+        session.touch()
+        self.sessions.save(session)
+
+    def _response_cache_key(self, session, user_message: str) -> Optional[str]:
+        """Cache key for this turn, or None when the answer depends on conversation state"""
+        if self.response_cache is None:
+            return None
+        if len(session.memory) or session.appointment_data:
+            return None
+        # Answers mention relative dates ("tomorrow"), so they only hold for the day they were given
+        return self.response_cache.make_key(
+            user_message,
+            model=f"{self.model_name}:{self.agent_mode}",
+            temperature=self.temperature,
+            context=f"{self._prompt_fingerprint}:{date.today().isoformat()}"
+        )
 
+    def _count_turn(self, local: bool):
+        with self._turn_stats_lock:
+            self.turns_total += 1
+            if local:
+                self.turns_local += 1
+
+    def fast_path_stats(self) -> Dict[str, Any]:
+        """Share of turns answered without calling the LLM"""
+        return {
+            'enabled': self.fast_path is not None,
+            'turns_total': self.turns_total,
+            'turns_local': self.turns_local,
+            'local_fraction': round(self.turns_local / self.turns_total, 4) if self.turns_total else 0.0
+        }
+
+    def reset_conversation(self, session_id: str = DEFAULT_SESSION_ID) -> bool:
+        """Reset conversation state for a single session"""
+        if self.recorder:
+            self.recorder.reset(session_id)
+        if self.idempotency:
+            self.idempotency.forget_session(session_id)
+        return self.sessions.reset(session_id)
+
+    def import_appointments(self, lines: Iterable[str], fmt: str = "csv", batch_size: int = 1000,
+                            max_errors: int = 100) -> Dict[str, Any]:
+        """Book existing appointments from CSV or JSON lines in fixed-size batches
+
+        Rows are validated as they stream in, booked against the availability
+        index with the same compare-and-set as conversational bookings (so
+        overlaps with each other, stored appointments and live holds are
+        rejected), saved with one store transaction per batch and mirrored
+        with one Sheets append per batch. Memory stays bounded by batch_size.
+        """
+        started = time.perf_counter()
+        report = {'rows': 0, 'imported': 0, 'invalid': 0, 'conflicts': 0, 'errors': []}
+
+        def reject(line_number: int, reason: str, key: str):
+            report[key] += 1
+            if len(report['errors']) < max_errors:
+                report['errors'].append({'line': line_number, 'error': reason})
+
+        for batch in batched(iter_records(lines, fmt), batch_size):
+            created_at = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+            booked: List[Tuple[int, Dict[str, Any], Any, int]] = []
+            for line_number, record in batch:
+                report['rows'] += 1
+                try:
+                    data = normalize_import(record, created_at)
+                    day, start = date.fromisoformat(data['date']), parse_time(data['time'])
+                    data['duration_minutes'] = data['duration_minutes'] or self.schedule.duration_for(data['appointment_type'])
+                    data['provider'] = self.availability.confirm(day, start, data['duration_minutes'],
+                                                                 appointment_type=data['appointment_type'],
+                                                                 provider=data['provider'])
+                except SlotUnavailable as e:
+                    reject(line_number, str(e), 'conflicts')
+                    continue
+                except ValueError as e:
+                    reject(line_number, str(e), 'invalid')
+                    continue
+                booked.append((line_number, data, day, start))
+
+            try:
+                rejected = {id(data) for data in self.store.save_many([data for _, data, _, _ in booked])}
+            except Exception:
+                for _, data, day, start in booked:
+                    self.availability.remove(day, start, provider=data['provider'])
+                raise
+
+            saved = []
+            for line_number, data, day, start in booked:
+                if id(data) in rejected:
+                    # Booked by another process sharing the store
+                    self.availability.remove(day, start, provider=data['provider'])
+                    reject(line_number, f"{data['date']} {data['time']} is already booked", 'conflicts')
+                else:
+                    saved.append(data)
+            report['imported'] += len(saved)
+
+            if saved and self.sheets_writer:
+                self.sheets_writer.write_rows([self._sheet_row(data) for data in saved])
+            if saved and self.reminders:
+                self.reminders.schedule_many(saved)
+
+        report['duration_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        logger.info(f"✅ Imported {report['imported']} of {report['rows']} appointments "
+                    f"({report['conflicts']} conflicts, {report['invalid']} invalid) in {report['duration_ms']:.0f} ms")
+        return report
+
+    def export_appointments(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                            fmt: str = "csv") -> Iterator[str]:
+        """Appointments in a date range (inclusive), encoded one line at a time"""
+        start_date = parse_date(start_date).isoformat() if start_date else None
+        end_date = parse_date(end_date).isoformat() if end_date else None
+        return iter_export(self.store.iter_appointments(start_date, end_date), fmt)
+
+def build_appointment_agent(gemini_api_key: str, google_creds_path: Optional[str] = None, sheet_url: Optional[str] = None,
+                            sheets_spool_path: Optional[str] = "sheets_spool.jsonl",
+                            response_cache_path: Optional[str] = None, response_cache_ttl: float = 3600,
+                            appointments_db_path: Optional[str] = "appointments.db",
+                            state_backend_url: Optional[str] = None, schedule_config_path: Optional[str] = None,
+                            llm_requests_per_minute: Optional[float] = None,
+                            llm_tokens_per_minute: Optional[float] = None,
+                            llm_fallback_queue_depth: Optional[int] = None,
+                            record_path: Optional[str] = None, record_sample_rate: float = 1.0,
+                            dedup_ttl: float = 600, dedup_content_ttl: float = 0,
+                            reminder_sinks: Optional[List[NotificationSink]] = None,
+                            reminder_db_path: Optional[str] = "reminders.db",
+                            reminder_offsets_minutes: Sequence[float] = DEFAULT_OFFSETS_MINUTES,
+                            reminder_max_concurrency: int = 4,
+                            **agent_options) -> OptimizedAppointmentAgent:
+    """Create the agent shared by the Flask and ASGI servers
+
+    `state_backend_url` (e.g. redis://localhost:6379/0) shares sessions and
+    slots between processes; `schedule_config_path` points to a JSON schedule
+    (see sample_schedule.json). Setting an LLM quota (requests and/or tokens
+    per minute) or a fallback model puts an LLMScheduler in front of Gemini;
+    `llm_fallback_queue_depth` is how many queued calls divert non-booking
+    turns to the fallback. `record_path` appends sampled conversations to a
+    JSON-lines corpus for benchmarks/replay.py. Redelivered chat messages are
+    answered from the first delivery for `dedup_ttl` seconds when they carry
+    an idempotency key, and for `dedup_content_ttl` seconds when matched by
+    text (off by default: a patient repeating "yes" is not a redelivery). With `reminder_sinks`, a ReminderScheduler sends
+    reminders `reminder_offsets_minutes` before each appointment, keeping
+    pending ones in `reminder_db_path`. Extra keyword arguments (e.g. `llm`,
+    `gspread_client`, `enable_fast_path`) go straight to OptimizedAppointmentAgent.
+    """
     try:
+        if state_backend_url and 'state_backend' not in agent_options:
+            agent_options['state_backend'] = RedisStateBackend.from_url(state_backend_url)
+        if schedule_config_path and 'schedule' not in agent_options:
+            agent_options['schedule'] = ScheduleConfig.from_file(schedule_config_path)
+        wants_scheduler = llm_requests_per_minute or llm_tokens_per_minute or agent_options.get('fallback_model')
+        if wants_scheduler and 'llm_scheduler' not in agent_options:
+            agent_options['llm_scheduler'] = LLMScheduler(
+                requests_per_minute=llm_requests_per_minute,
+                tokens_per_minute=llm_tokens_per_minute,
+                fallback_queue_depth=llm_fallback_queue_depth
+            )
+        if record_path and 'recorder' not in agent_options:
+            agent_options['recorder'] = ConversationRecorder(record_path, sample_rate=record_sample_rate)
+            atexit.register(agent_options['recorder'].close)
+        if (dedup_ttl or dedup_content_ttl) and 'idempotency' not in agent_options:
+            agent_options['idempotency'] = IdempotencyCache(ttl_seconds=dedup_ttl,
+                                                            content_ttl_seconds=dedup_content_ttl)
+        if reminder_sinks and 'reminders' not in agent_options:
+            agent_options['reminders'] = ReminderScheduler(
+                reminder_sinks,
+                store=SQLiteReminderStore(reminder_db_path) if reminder_db_path else None,
+                offsets_minutes=reminder_offsets_minutes,
+                max_concurrency=reminder_max_concurrency
+            )
         agent = OptimizedAppointmentAgent(
             gemini_api_key=gemini_api_key,
             google_sheets_credentials_path=google_creds_path,
-            sheet_url=sheet_url
+            sheet_url=sheet_url,
+            sheets_spool_path=sheets_spool_path,
+            response_cache=ResponseCache(ttl_seconds=response_cache_ttl, sqlite_path=response_cache_path),
+            store=SQLiteAppointmentStore(appointments_db_path) if appointments_db_path else None,
+            **agent_options
         )
+        # Serve /health right away; LangChain, Gemini and Sheets connect in the background
+        agent.start_warm_up()
         logger.info("🤖 Optimized appointment agent initialized successfully")
+        return agent
     except Exception as e:
         logger.error(f"❌ Failed to initialize appointment agent: {e}")
         raise
 
+
+def reminder_sinks_from_env() -> List[NotificationSink]:
+    """Email via SMTP_HOST and SMS via SMS_WEBHOOK_URL; REMINDER_OUTBOX_PATH writes either to a file instead"""
+    sinks: List[NotificationSink] = []
+    outbox_path = os.getenv("REMINDER_OUTBOX_PATH")
+    if os.getenv("SMTP_HOST"):
+        sinks.append(SMTPEmailSink(
+            host=os.getenv("SMTP_HOST"),
+            port=int(os.getenv("SMTP_PORT", 25)),
+            sender=os.getenv("SMTP_SENDER", "appointments@localhost"),
+            username=os.getenv("SMTP_USERNAME") or None,
+            password=os.getenv("SMTP_PASSWORD") or None,
+            starttls=os.getenv("SMTP_STARTTLS", "False").lower() == "true"
+        ))
+    elif outbox_path:
+        sinks.append(FileSink(outbox_path, channel='email'))
+    if os.getenv("SMS_WEBHOOK_URL"):
+        sinks.append(WebhookSMSSink(os.getenv("SMS_WEBHOOK_URL"), token=os.getenv("SMS_WEBHOOK_TOKEN") or None))
+    elif outbox_path:
+        sinks.append(FileSink(outbox_path, channel='sms'))
+    return sinks
+
+
+def agent_settings_from_env() -> Dict[str, Any]:
+    """build_appointment_agent keyword arguments from environment variables"""
+    return {
+        'gemini_api_key': os.getenv("GEMINI_API_KEY"),
+        'google_creds_path': os.getenv("GOOGLE_CREDENTIALS_PATH"),
+        'sheet_url': os.getenv("GOOGLE_SHEET_URL"),
+        'sheets_spool_path': os.getenv("SHEETS_SPOOL_PATH", "sheets_spool.jsonl"),
+        'response_cache_path': os.getenv("LLM_CACHE_PATH") or None,
+        'response_cache_ttl': float(os.getenv("LLM_CACHE_TTL", 3600)),
+        'appointments_db_path': os.getenv("APPOINTMENTS_DB_PATH", "appointments.db") or None,
+        'agent_mode': os.getenv("AGENT_MODE", "react"),
+        'state_backend_url': os.getenv("REDIS_URL") or None,
+        'schedule_config_path': os.getenv("SCHEDULE_CONFIG_PATH") or None,
+        'llm_requests_per_minute': float(os.getenv("LLM_REQUESTS_PER_MINUTE", 0)) or None,
+        'llm_tokens_per_minute': float(os.getenv("LLM_TOKENS_PER_MINUTE", 0)) or None,
+        'llm_fallback_queue_depth': int(os.getenv("LLM_FALLBACK_QUEUE_DEPTH", 0)) or None,
+        'fallback_model': os.getenv("LLM_FALLBACK_MODEL") or None,
+        'record_path': os.getenv("CONVERSATION_RECORD_PATH") or None,
+        'record_sample_rate': float(os.getenv("CONVERSATION_RECORD_SAMPLE_RATE", 1.0)),
+        'dedup_ttl': float(os.getenv("WEBHOOK_DEDUP_TTL", 600)),
+        'dedup_content_ttl': float(os.getenv("WEBHOOK_DEDUP_CONTENT_TTL", 0)),
+        'reminder_sinks': reminder_sinks_from_env(),
+        'reminder_db_path': os.getenv("REMINDER_DB_PATH", "reminders.db") or None,
+        'reminder_offsets_minutes': [float(minutes) for minutes in
+                                     os.getenv("REMINDER_OFFSETS_MINUTES", "1440,120").split(",") if minutes.strip()],
+        'reminder_max_concurrency': int(os.getenv("REMINDER_MAX_CONCURRENCY", 4))
+    }
+
+
+def agent_health(agent: OptimizedAppointmentAgent) -> Dict[str, Any]:
+    """Health payload shared by the Flask and ASGI servers"""
+    return {
+        'status': 'healthy',
+        'model': agent.model_name,
+        'framework': 'langchain-optimized',
+        'agent_mode': agent.agent_mode,
+        'state_backend': type(agent.state_backend).__name__ if agent.state_backend else None,
+        'ready': agent.ready.is_set(),
+        'sheets_enabled': agent.sheets_writer is not None,
+        'sheets_queue': agent.sheets_writer.stats() if agent.sheets_writer else None,
+        'appointments_stored': agent.store.count(),
+        'slot_holds': agent.availability.holds_count(),
+        'providers': [provider.id for provider in agent.schedule.providers],
+        'sessions': agent.sessions.stats(),
+        'fast_path': agent.fast_path_stats(),
+        'response_cache': agent.response_cache.stats() if agent.response_cache else None,
+        'llm_scheduler': agent.llm_scheduler.stats() if agent.llm_scheduler else None,
+        'dedup': agent.idempotency.stats() if agent.idempotency else None,
+        'reminders': agent.reminders.stats() if agent.reminders else None,
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+# Flask app creation function
+def create_appointment_bot(gemini_api_key: str, **agent_kwargs):
+    """Create and configure the appointment bot Flask app"""
+
+    agent = build_appointment_agent(gemini_api_key, **agent_kwargs)
+
     app = Flask(__name__)
     CORS(app, origins=["*"])
 
+    def _get_session_id(data: dict) -> str:
+        """Session id from the JSON body or X-Session-ID header"""
+        session_id = data.get('session_id') or request.headers.get('X-Session-ID')
+        return str(session_id).strip()[:128] if session_id else DEFAULT_SESSION_ID
+
+    def _get_idempotency_key(data: dict) -> Optional[str]:
+        """Delivery id from the Idempotency-Key header or the body's message_id, if the platform sends one"""
+        key = request.headers.get('Idempotency-Key') or data.get('message_id') or data.get('idempotency_key')
+        key = str(key).strip()[:256] if key else ""
+        return key or None
+
     @app.route('/webhook/chat', methods=['POST'])
     def chat_webhook():
         """Main webhook endpoint for chat messages"""
@@ -318,10 +1123,13 @@ def create_appointment_bot(gemini_api_key: str, google_creds_path: Optional[str]
             if not message:
                 return jsonify({'error': 'Empty message'}), 400
 
-            response = agent.process_message(message)
+            session_id = _get_session_id(data)
+            response = agent.process_message(message, session_id=session_id,
+                                             idempotency_key=_get_idempotency_key(data))
 
             return jsonify({
                 'response': response,
+                'session_id': session_id,
                 'timestamp': datetime.now().isoformat(),
                 'status': 'success'
             })
@@ -334,6 +1142,25 @@ def create_appointment_bot(gemini_api_key: str, google_creds_path: Optional[str]
                 'status': 'error'
             }), 500
 
+    @app.route('/webhook/chat/stream', methods=['POST'])
+    def chat_stream():
+        """Server-Sent Events variant of /webhook/chat: status, token and done events"""
+        data = request.get_json(silent=True)
+        if not data or 'message' not in data:
+            return jsonify({'error': 'Missing message in request'}), 400
+
+        message = str(data['message']).strip()
+        if not message:
+            return jsonify({'error': 'Empty message'}), 400
+
+        session_id = _get_session_id(data)
+        return Response(
+            stream_with_context(iter_sse(agent.stream_message(message, session_id=session_id,
+                                                              idempotency_key=_get_idempotency_key(data)))),
+            mimetype='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
     @app.route('/test', methods=['POST'])
     def test_chat():
         """Test endpoint for direct message testing"""
@@ -343,10 +1170,13 @@ def create_appointment_bot(gemini_api_key: str, google_creds_path: Optional[str]
                 return jsonify({'error': 'Missing message in request'}), 400
 
             message = data['message'].strip()
-            response = agent.process_message(message)
+            session_id = _get_session_id(data)
+            response = agent.process_message(message, session_id=session_id,
+                                             idempotency_key=_get_idempotency_key(data))
 
             return jsonify({
                 'response': response,
+                'session_id': session_id,
                 'timestamp': datetime.now().isoformat()
             })
 
@@ -361,14 +1191,7 @@ def create_appointment_bot(gemini_api_key: str, google_creds_path: Optional[str]
     def health_check():
         """Health check endpoint"""
         try:
-            return jsonify({
-                'status': 'healthy',
-                'model': 'gemini-1.5-pro',
-                'framework': 'langchain-optimized',
-                'sheets_enabled': agent.gc is not None,
-                'appointments_in_cache': len(agent.appointments_cache),
-                'timestamp': datetime.now().isoformat()
-            })
+            return jsonify(agent_health(agent))
         except Exception as e:
             logger.error(f"Health check failed: {e}")
             return jsonify({
@@ -381,11 +1204,13 @@ def create_appointment_bot(gemini_api_key: str, google_creds_path: Optional[str]
     def reset_conversation():
         """Reset conversation state"""
         try:
-            agent.reset_conversation()
+            session_id = _get_session_id(request.get_json(silent=True) or {})
+            agent.reset_conversation(session_id)
 
             return jsonify({
                 'status': 'success',
                 'message': 'Conversation reset successfully',
+                'session_id': session_id,
                 'timestamp': datetime.now().isoformat()
             })
         except Exception as e:
@@ -408,32 +1233,66 @@ def create_appointment_bot(gemini_api_key: str, google_creds_path: Optional[str]
             'timestamp': datetime.now().isoformat()
         })
 
+    @app.route('/appointments/import', methods=['POST'])
+    def import_appointments():
+        """Bulk import from a CSV (with header) or JSON-lines request body, read as a stream"""
+        try:
+            fmt = bulk_format(request.args.get('format'), request.content_type)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        try:
+            lines = io.TextIOWrapper(request.stream, encoding='utf-8-sig', newline='')
+            report = agent.import_appointments(lines, fmt)
+            return jsonify({**report, 'status': 'success', 'timestamp': datetime.now().isoformat()})
+        except Exception as e:
+            logger.error(f"Import error: {e}")
+            return jsonify({
+                'status': 'error',
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }), 500
+
+    @app.route('/appointments/export', methods=['GET'])
+    def export_appointments():
+        """Stream appointments between ?start= and ?end= (inclusive) as CSV or JSON lines"""
+        try:
+            fmt = bulk_format(request.args.get('format'))
+            rows = agent.export_appointments(request.args.get('start'), request.args.get('end'), fmt)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return Response(
+            stream_with_context(rows),
+            content_type=MEDIA_TYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename="appointments.{fmt}"'}
+        )
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Prometheus scrape endpoint"""
+        return Response(agent.metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+    app.extensions['appointment_agent'] = agent
     return app
 
 if __name__ == '__main__':
 
 
-    gemini_api_key = os.getenv("GEMINI_API_KEY")
-
-    google_creds_path = os.getenv("GOOGLE_CREDENTIALS_PATH")
-    sheet_url = os.getenv("GOOGLE_SHEET_URL")
+    settings = agent_settings_from_env()
 
     
     flask_host = os.getenv("FLASK_HOST", "0.0.0.0") 
     flask_port = int(os.getenv("FLASK_PORT", 5000)) 
     flask_debug = os.getenv("FLASK_DEBUG", "True").lower() == "true" 
 
-    if not gemini_api_key:
+    if not settings['gemini_api_key']:
         logger.error("❌ GEMINI_API_KEY environment variable not set. Please check your .env file.")
         
         import sys
         sys.exit(1)
 
     
-    app = create_appointment_bot(
-        gemini_api_key=gemini_api_key,
-        google_creds_path=google_creds_path,
-        sheet_url=sheet_url
-    )
+    app = create_appointment_bot(**settings)
     
     app.run(debug=flask_debug, host=flask_host, port=flask_port)
\ No newline at end of file
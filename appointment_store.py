@@ -0,0 +1,230 @@
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from availability import DEFAULT_DURATION_MINUTES, SlotUnavailable, parse_time
+
+
+APPOINTMENT_COLUMNS = ['name', 'appointment_type', 'date', 'time', 'duration_minutes', 'email', 'phone',
+                       'created_at', 'status', 'provider']
+
+# Start of a stored 'HH:MM' time in minutes after midnight
+_START_MINUTES_SQL = "(CAST(substr(time, 1, 2) AS INTEGER) * 60 + CAST(substr(time, 4, 2) AS INTEGER))"
+
+
+def _span(appointment: Dict[str, Any]) -> Tuple[int, int]:
+    """(start, end) of an appointment in minutes after midnight"""
+    start = parse_time(str(appointment['time']))
+    return start, start + int(appointment.get('duration_minutes') or DEFAULT_DURATION_MINUTES)
+
+
+class AppointmentStore(ABC):
+    """Persistent copy of booked appointments; Google Sheets is only a mirror of this"""
+
+    @abstractmethod
+    def save(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        """Persist a normalized appointment; raises SlotUnavailable if it overlaps a confirmed one
+
+        Overlap is checked per provider and day, so the store holds the line
+        even when availability indexes in different processes disagree.
+        """
+
+    def save_many(self, appointments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Persist a batch of appointments; returns the ones rejected because their slot is taken"""
+        rejected = []
+        for appointment in appointments:
+            try:
+                self.save(appointment)
+            except SlotUnavailable:
+                rejected.append(appointment)
+        return rejected
+
+    @abstractmethod
+    def iter_slots(self) -> Iterator[Tuple[str, str, Optional[int], Optional[str]]]:
+        """(date, time, duration_minutes, provider) of every confirmed appointment, for index warm-up"""
+
+    @abstractmethod
+    def iter_appointments(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        """Appointments ordered by date and time, optionally limited to a date range (inclusive)"""
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    def close(self):
+        pass
+
+
+class InMemoryAppointmentStore(AppointmentStore):
+    """Process-local store for tests and deployments without a database file"""
+
+    def __init__(self):
+        self._appointments: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        # (date, provider) -> (start, end) of each confirmed appointment that day
+        self._spans: Dict[Tuple[str, str], List[Tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+
+    def save(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        key = (appointment['date'], appointment['time'], appointment.get('provider') or '')
+        confirmed = appointment.get('status') == 'Confirmed'
+        start, end = _span(appointment)
+        with self._lock:
+            spans = self._spans.setdefault((key[0], key[2]), [])
+            if key in self._appointments or confirmed and any(s < end and start < e for s, e in spans):
+                raise SlotUnavailable(f"{key[0]} {key[1]} is already booked")
+            self._appointments[key] = dict(appointment)
+            if confirmed:
+                spans.append((start, end))
+        return appointment
+
+    def iter_slots(self) -> Iterator[Tuple[str, str, Optional[int], Optional[str]]]:
+        with self._lock:
+            appointments = list(self._appointments.values())
+        for appointment in appointments:
+            yield appointment['date'], appointment['time'], appointment.get('duration_minutes'), appointment.get('provider')
+
+    def iter_appointments(self, start_date: Optional[str] = None, end_date: Optional[str] = None) -> Iterator[Dict[str, Any]]:
+        with self._lock:
+            keys = sorted(self._appointments)
+        for key in keys:
+            if (start_date and key[0] < start_date) or (end_date and key[0] > end_date):
+                continue
+            yield dict(self._appointments[key])
+
+    def count(self) -> int:
+        return len(self._appointments)
+
+
+class SQLiteAppointmentStore(AppointmentStore):
+    """SQLite store in WAL mode; each insert checks for overlaps inside its own write transaction
+
+    BEGIN IMMEDIATE takes the database write lock before the overlap query,
+    so processes sharing the file cannot both book overlapping ranges. The
+    unique slot index stays as a backstop for identical start times.
+    """
+
+    def __init__(self, path: str = "appointments.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._lock = threading.Lock()
+
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS appointments (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT NOT NULL,
+                    appointment_type TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    duration_minutes INTEGER,
+                    email TEXT,
+                    phone TEXT,
+                    created_at TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'Confirmed',
+                    provider TEXT
+                );
+                CREATE INDEX IF NOT EXISTS idx_appointments_date_time ON appointments(date, time);
+                CREATE INDEX IF NOT EXISTS idx_appointments_email ON appointments(email);
+            """)
+            # Databases created before providers existed: add the column and key slots by provider
+            columns = {row['name'] for row in self._conn.execute("PRAGMA table_info(appointments)")}
+            if 'provider' not in columns:
+                self._conn.execute("ALTER TABLE appointments ADD COLUMN provider TEXT")
+            self._conn.executescript("""
+                DROP INDEX IF EXISTS idx_appointments_slot;
+                CREATE UNIQUE INDEX IF NOT EXISTS idx_appointments_provider_slot
+                    ON appointments(IFNULL(provider, ''), date, time) WHERE status = 'Confirmed';
+            """)
+
+    def save(self, appointment: Dict[str, Any]) -> Dict[str, Any]:
+        if self.save_many([appointment]):
+            raise SlotUnavailable(f"{appointment['date']} {appointment['time']} is already booked")
+        return appointment
+
+    def save_many(self, appointments: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        # One transaction per batch: a single fsync instead of one per row
+        insert = (f"INSERT INTO appointments ({', '.join(APPOINTMENT_COLUMNS)}) "
+                  f"VALUES ({', '.join('?' for _ in APPOINTMENT_COLUMNS)})")
+        rejected = []
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for appointment in appointments:
+                    if appointment.get('status') == 'Confirmed' and self._overlaps(appointment):
+                        rejected.append(appointment)
+                        continue
+                    try:
+                        cursor = self._conn.execute(insert, [appointment.get(column) for column in APPOINTMENT_COLUMNS])
+                    except sqlite3.IntegrityError:
+                        rejected.append(appointment)
+                        continue
+                    appointment['id'] = cursor.lastrowid
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return rejected
+
+    def _overlaps(self, appointment: Dict[str, Any]) -> bool:
+        """Whether a confirmed appointment of the same provider overlaps this one; caller holds the transaction"""
+        start, end = _span(appointment)
+        row = self._conn.execute(
+            f"SELECT 1 FROM appointments WHERE status = 'Confirmed' AND IFNULL(provider, '') = ? AND date = ? "
+            f"AND {_START_MINUTES_SQL} < ? AND {_START_MINUTES_SQL} + IFNULL(duration_minutes, ?) > ? LIMIT 1",
+            (appointment.get('provider') or '', appointment['date'], end, DEFAULT_DURATION_MINUTES, start)
+        ).fetchone()
+        return row is not None
+
+    def iter_slots(self, batch_size: int = 5000) -> Iterator[Tuple[str, str, Optional[int], Optional[str]]]:
+        # Own cursor on a read-only pass; WAL lets this run alongside writers
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(
+                "SELECT date, time, duration_minutes, provider FROM appointments WHERE status = 'Confirmed'"
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+        finally:
+            conn.close()
+
+    def iter_appointments(self, start_date: Optional[str] = None, end_date: Optional[str] = None,
+                          batch_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        conditions, params = [], []
+        if start_date:
+            conditions.append("date >= ?")
+            params.append(start_date)
+        if end_date:
+            conditions.append("date <= ?")
+            params.append(end_date)
+        where = f"WHERE {' AND '.join(conditions)} " if conditions else ""
+
+        conn = sqlite3.connect(self.path)
+        conn.row_factory = sqlite3.Row
+        try:
+            cursor = conn.execute(
+                f"SELECT id, {', '.join(APPOINTMENT_COLUMNS)} FROM appointments {where}ORDER BY date, time", params
+            )
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield dict(row)
+        finally:
+            conn.close()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM appointments WHERE status = 'Confirmed'").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,291 @@
+import asyncio
+import io
+import logging
+import os
+import tempfile
+from datetime import datetime
+from typing import Optional
+
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from appointment_bot import agent_health, agent_settings_from_env, build_appointment_agent
+from bulk import MEDIA_TYPES, bulk_format
+from concurrency import ConcurrencyLimiter, ServiceSaturated
+from metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE
+from session_store import DEFAULT_SESSION_ID
+from streaming import format_sse
+
+
+logger = logging.getLogger(__name__)
+
+
+def create_async_appointment_bot(gemini_api_key: str, max_concurrent_llm_calls: int = 32,
+                                 max_waiting_llm_calls: int = 256, request_timeout: float = 30.0,
+                                 **agent_kwargs) -> Starlette:
+    """Create the ASGI app: same routes as the Flask app, non-blocking agent calls"""
+
+    agent = build_appointment_agent(gemini_api_key, **agent_kwargs)
+    limiter = ConcurrencyLimiter(
+        max_in_flight=max_concurrent_llm_calls,
+        max_waiting=max_waiting_llm_calls,
+        acquire_timeout=request_timeout
+    )
+    agent.metrics.gauge("llm_in_flight", "LLM calls currently running", lambda: limiter.in_flight)
+    agent.metrics.gauge("llm_waiting", "Turns queued for an LLM slot", lambda: limiter.waiting)
+
+    async def _read_json(request: Request) -> dict:
+        try:
+            data = await request.json()
+        except ValueError:
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _get_session_id(request: Request, data: dict) -> str:
+        """Session id from the JSON body or X-Session-ID header"""
+        session_id = data.get('session_id') or request.headers.get('X-Session-ID')
+        return str(session_id).strip()[:128] if session_id else DEFAULT_SESSION_ID
+
+    def _get_idempotency_key(request: Request, data: dict) -> Optional[str]:
+        """Delivery id from the Idempotency-Key header or the body's message_id, if the platform sends one"""
+        key = request.headers.get('Idempotency-Key') or data.get('message_id') or data.get('idempotency_key')
+        key = str(key).strip()[:256] if key else ""
+        return key or None
+
+    def _busy(message: str, status_code: int) -> JSONResponse:
+        return JSONResponse({
+            'error': message,
+            'timestamp': datetime.now().isoformat(),
+            'status': 'error'
+        }, status_code=status_code, headers={'Retry-After': '2'})
+
+    async def _run_turn(message: str, session_id: str, idempotency_key: Optional[str] = None) -> str:
+        return await asyncio.wait_for(
+            agent.aprocess_message(message, session_id=session_id, llm_slot=limiter, idempotency_key=idempotency_key),
+            timeout=request_timeout
+        )
+
+    async def chat_webhook(request: Request):
+        """Main webhook endpoint for chat messages"""
+        try:
+            data = await _read_json(request)
+            if not data or 'message' not in data:
+                return JSONResponse({'error': 'Missing message in request'}, status_code=400)
+
+            message = str(data['message']).strip()
+            if not message:
+                return JSONResponse({'error': 'Empty message'}, status_code=400)
+
+            session_id = _get_session_id(request, data)
+            response = await _run_turn(message, session_id, _get_idempotency_key(request, data))
+
+            return JSONResponse({
+                'response': response,
+                'session_id': session_id,
+                'timestamp': datetime.now().isoformat(),
+                'status': 'success'
+            })
+
+        except ServiceSaturated:
+            return _busy('We are handling a lot of conversations right now. Please try again in a moment.', 429)
+        except asyncio.TimeoutError:
+            return _busy('The assistant took too long to respond. Please try again.', 503)
+        except Exception as e:
+            logger.error(f"Webhook error: {e}")
+            return JSONResponse({
+                'error': 'I apologize, but I\'m experiencing technical difficulties. Please try again.',
+                'timestamp': datetime.now().isoformat(),
+                'status': 'error'
+            }, status_code=500)
+
+    async def chat_stream(request: Request):
+        """Server-Sent Events variant of /webhook/chat: status, token and done events"""
+        data = await _read_json(request)
+        if not data or 'message' not in data:
+            return JSONResponse({'error': 'Missing message in request'}, status_code=400)
+
+        message = str(data['message']).strip()
+        if not message:
+            return JSONResponse({'error': 'Empty message'}, status_code=400)
+
+        session_id = _get_session_id(request, data)
+        idempotency_key = _get_idempotency_key(request, data)
+
+        async def events():
+            async for event, payload in agent.astream_message(message, session_id=session_id, llm_slot=limiter,
+                                                              timeout=request_timeout,
+                                                              idempotency_key=idempotency_key):
+                yield format_sse(event, payload)
+
+        return StreamingResponse(
+            events(),
+            media_type='text/event-stream',
+            headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+        )
+
+    async def test_chat(request: Request):
+        """Test endpoint for direct message testing"""
+        try:
+            data = await _read_json(request)
+            if not data or 'message' not in data:
+                return JSONResponse({'error': 'Missing message in request'}, status_code=400)
+
+            message = str(data['message']).strip()
+            session_id = _get_session_id(request, data)
+            response = await _run_turn(message, session_id, _get_idempotency_key(request, data))
+
+            return JSONResponse({
+                'response': response,
+                'session_id': session_id,
+                'timestamp': datetime.now().isoformat()
+            })
+
+        except ServiceSaturated:
+            return _busy('Service is busy. Please try again in a moment.', 429)
+        except asyncio.TimeoutError:
+            return _busy('Service temporarily unavailable. Please try again.', 503)
+        except Exception as e:
+            logger.error(f"Test endpoint error: {e}")
+            return JSONResponse({
+                'error': 'Service temporarily unavailable. Please try again.',
+                'timestamp': datetime.now().isoformat()
+            }, status_code=500)
+
+    async def health_check(request: Request):
+        """Health check endpoint"""
+        try:
+            health = agent_health(agent)
+            health['llm_concurrency'] = limiter.stats()
+            return JSONResponse(health)
+        except Exception as e:
+            logger.error(f"Health check failed: {e}")
+            return JSONResponse({
+                'status': 'unhealthy',
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }, status_code=500)
+
+    async def import_appointments(request: Request):
+        """Bulk import from a CSV (with header) or JSON-lines request body"""
+        try:
+            fmt = bulk_format(request.query_params.get('format'), request.headers.get('content-type'))
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        try:
+            # Spill large uploads to disk, then validate and book off the event loop
+            with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as body:
+                async for chunk in request.stream():
+                    body.write(chunk)
+                body.seek(0)
+                lines = io.TextIOWrapper(body, encoding='utf-8-sig', newline='')
+                report = await run_in_threadpool(agent.import_appointments, lines, fmt)
+            return JSONResponse({**report, 'status': 'success', 'timestamp': datetime.now().isoformat()})
+        except Exception as e:
+            logger.error(f"Import error: {e}")
+            return JSONResponse({
+                'status': 'error',
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }, status_code=500)
+
+    async def export_appointments(request: Request):
+        """Stream appointments between ?start= and ?end= (inclusive) as CSV or JSON lines"""
+        try:
+            fmt = bulk_format(request.query_params.get('format'))
+            rows = agent.export_appointments(request.query_params.get('start'), request.query_params.get('end'), fmt)
+        except ValueError as e:
+            return JSONResponse({'error': str(e)}, status_code=400)
+
+        # A plain iterator is consumed on the threadpool, so SQLite reads never block the loop
+        return StreamingResponse(
+            rows,
+            media_type=MEDIA_TYPES[fmt],
+            headers={'Content-Disposition': f'attachment; filename="appointments.{fmt}"'}
+        )
+
+    async def metrics(request: Request):
+        """Prometheus scrape endpoint"""
+        return Response(agent.metrics.render(), headers={'Content-Type': METRICS_CONTENT_TYPE})
+
+    async def reset_conversation(request: Request):
+        """Reset conversation state"""
+        try:
+            session_id = _get_session_id(request, await _read_json(request))
+            session = agent.sessions.peek(session_id)
+            if session is None:
+                await run_in_threadpool(agent.reset_conversation, session_id)
+            else:
+                # Wait for a turn in progress instead of blocking the event loop on its thread lock
+                async with session.async_lock:
+                    await run_in_threadpool(agent.reset_conversation, session_id)
+
+            return JSONResponse({
+                'status': 'success',
+                'message': 'Conversation reset successfully',
+                'session_id': session_id,
+                'timestamp': datetime.now().isoformat()
+            })
+        except Exception as e:
+            logger.error(f"Reset error: {e}")
+            return JSONResponse({
+                'status': 'error',
+                'error': str(e),
+                'timestamp': datetime.now().isoformat()
+            }, status_code=500)
+
+    async def home(request: Request):
+        """Home endpoint"""
+        return JSONResponse({
+            'message': 'Optimized Healthcare Appointment Bot API - LLM-Driven',
+            'version': '5.0',
+            'framework': 'langchain + gemini-1.5-pro',
+            'optimization': 'Maximum LLM delegation',
+            'server': 'asgi',
+            'status': 'running',
+            'timestamp': datetime.now().isoformat()
+        })
+
+    app = Starlette(
+        routes=[
+            Route('/webhook/chat', chat_webhook, methods=['POST']),
+            Route('/webhook/chat/stream', chat_stream, methods=['POST']),
+            Route('/test', test_chat, methods=['POST']),
+            Route('/health', health_check, methods=['GET']),
+            Route('/metrics', metrics, methods=['GET']),
+            Route('/appointments/import', import_appointments, methods=['POST']),
+            Route('/appointments/export', export_appointments, methods=['GET']),
+            Route('/reset', reset_conversation, methods=['POST']),
+            Route('/', home, methods=['GET']),
+        ],
+        middleware=[
+            Middleware(CORSMiddleware, allow_origins=["*"], allow_methods=["*"], allow_headers=["*"])
+        ]
+    )
+    app.state.agent = agent
+    app.state.llm_limiter = limiter
+    return app
+
+
+if __name__ == '__main__':
+    import sys
+    import uvicorn
+
+    settings = agent_settings_from_env()
+    if not settings['gemini_api_key']:
+        logger.error("❌ GEMINI_API_KEY environment variable not set. Please check your .env file.")
+        sys.exit(1)
+
+    app = create_async_appointment_bot(
+        max_concurrent_llm_calls=int(os.getenv("LLM_MAX_CONCURRENCY", 32)),
+        max_waiting_llm_calls=int(os.getenv("LLM_MAX_WAITING", 256)),
+        request_timeout=float(os.getenv("REQUEST_TIMEOUT", 30)),
+        **settings
+    )
+
+    uvicorn.run(app, host=os.getenv("FLASK_HOST", "0.0.0.0"), port=int(os.getenv("FLASK_PORT", 5000)))
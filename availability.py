@@ -0,0 +1,252 @@
+import re
+import threading
+import time
+from bisect import bisect_left, insort
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
+
+DEFAULT_DURATION_MINUTES = 30
+
+_DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%d-%m-%Y", "%B %d %Y", "%b %d %Y")
+_TIME_RE = re.compile(r"^(\d{1,2})(?::(\d{2}))?\s*([ap]\.?m\.?)?$", re.IGNORECASE)
+_DATE_TIME_RE = re.compile(r"(\d{4}-\d{2}-\d{2})[ T]+(\d{1,2}(?::\d{2})?\s*(?:[ap]\.?m\.?)?)", re.IGNORECASE)
+
+
+class SlotUnavailable(Exception):
+    """Raised when a booking overlaps an existing appointment"""
+
+
+def parse_date(value: str) -> date:
+    """Parse a calendar date from the formats the bot accepts"""
+    value = value.strip().replace(",", "")
+    if len(value) == 10 and value[4] == "-" and value[7] == "-":
+        # ISO dates dominate (stored rows, bulk imports); skip strptime for them
+        try:
+            return date.fromisoformat(value)
+        except ValueError:
+            pass
+    for fmt in _DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt).date()
+        except ValueError:
+            continue
+    raise ValueError(f"Unrecognized date: {value!r}")
+
+
+def parse_time(value: str) -> int:
+    """Parse a clock time into minutes after midnight"""
+    match = _TIME_RE.match(value.strip())
+    if not match:
+        raise ValueError(f"Unrecognized time: {value!r}")
+
+    hour = int(match.group(1))
+    minute = int(match.group(2) or 0)
+    meridiem = (match.group(3) or "").lower().replace(".", "")
+    if meridiem:
+        if not 1 <= hour <= 12:
+            raise ValueError(f"Unrecognized time: {value!r}")
+        hour = hour % 12 + (12 if meridiem == "pm" else 0)
+    elif match.group(2) is None:
+        # A bare number like "14" is ambiguous enough to reject
+        raise ValueError(f"Unrecognized time: {value!r}")
+
+    if hour > 23 or minute > 59:
+        raise ValueError(f"Unrecognized time: {value!r}")
+    return hour * 60 + minute
+
+
+def parse_date_time(value: str) -> Tuple[date, int]:
+    """Parse 'YYYY-MM-DD HH:MM' (or a 12-hour time) into (date, minutes)"""
+    match = _DATE_TIME_RE.search(value)
+    if not match:
+        raise ValueError(f"Expected 'YYYY-MM-DD HH:MM', got {value!r}")
+    return parse_date(match.group(1)), parse_time(match.group(2))
+
+
+def format_time(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class AvailabilityIndex:
+    """Booked intervals per day, kept sorted by start time for O(log n) overlap checks
+
+    Also tracks short-lived holds: `hold` reserves a slot for one owner (a
+    session) when availability is checked, and `confirm` books it with a
+    compare-and-set that fails if anyone else booked or holds the slot.
+    All operations for a day run under that day's lock stripe, so bookings
+    on different days never contend.
+    """
+
+    def __init__(self, default_duration: int = DEFAULT_DURATION_MINUTES, day_start: int = 9 * 60,
+                 day_end: int = 17 * 60, slot_step: int = 30, hold_ttl: float = 120, lock_stripes: int = 64):
+        self.default_duration = default_duration
+        self.day_start = day_start
+        self.day_end = day_end
+        self.slot_step = slot_step
+        self.hold_ttl = hold_ttl
+
+        # day -> parallel sorted lists of interval starts and ends (minutes after midnight)
+        self._starts: Dict[date, List[int]] = {}
+        self._ends: Dict[date, List[int]] = {}
+        # Longest interval per day bounds how far back an overlap scan has to look
+        self._max_duration: Dict[date, int] = {}
+        # day -> owner -> (start, end, expires_at); one hold per owner per day
+        self._holds: Dict[date, Dict[str, Tuple[int, int, float]]] = {}
+
+        self._locks = [threading.Lock() for _ in range(lock_stripes)]
+        self._counts = [0] * lock_stripes
+
+    def _stripe(self, day: date) -> int:
+        return day.toordinal() % len(self._locks)
+
+    def _conflicts(self, day: date, start: int, end: int) -> List[Tuple[int, int]]:
+        starts = self._starts.get(day)
+        if not starts:
+            return []
+        ends = self._ends[day]
+        earliest_start = start - self._max_duration[day]
+
+        conflicts = []
+        # Every interval starting before `end` is left of this index
+        i = bisect_left(starts, end) - 1
+        while i >= 0 and starts[i] > earliest_start:
+            if ends[i] > start:
+                conflicts.append((starts[i], ends[i]))
+            i -= 1
+        return conflicts
+
+    def _held_by_other(self, day: date, start: int, end: int, owner: Optional[str], now: float) -> bool:
+        holds = self._holds.get(day)
+        if not holds:
+            return False
+        held = False
+        for holder, (hold_start, hold_end, expires_at) in list(holds.items()):
+            if expires_at <= now:
+                del holds[holder]
+            elif holder != owner and hold_start < end and hold_end > start:
+                held = True
+        return held
+
+    def _insert(self, day: date, start: int, duration: int):
+        starts = self._starts.setdefault(day, [])
+        ends = self._ends.setdefault(day, [])
+        i = bisect_left(starts, start)
+        starts.insert(i, start)
+        ends.insert(i, start + duration)
+        self._max_duration[day] = max(self._max_duration.get(day, 0), duration)
+        self._counts[self._stripe(day)] += 1
+
+    def conflicts(self, day: date, start: int, duration: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Booked (start, end) intervals overlapping the requested slot"""
+        end = start + (duration or self.default_duration)
+        with self._locks[self._stripe(day)]:
+            return self._conflicts(day, start, end)
+
+    def is_available(self, day: date, start: int, duration: Optional[int] = None, owner: Optional[str] = None) -> bool:
+        """Free of bookings and of holds by anyone other than `owner`"""
+        end = start + (duration or self.default_duration)
+        with self._locks[self._stripe(day)]:
+            return not self._conflicts(day, start, end) and not self._held_by_other(day, start, end, owner, time.monotonic())
+
+    def hold(self, day: date, start: int, duration: Optional[int] = None, owner: str = "", ttl: Optional[float] = None) -> bool:
+        """Reserve a free slot for `owner` for a short time; False if booked or held by someone else"""
+        end = start + (duration or self.default_duration)
+        now = time.monotonic()
+        with self._locks[self._stripe(day)]:
+            if self._conflicts(day, start, end) or self._held_by_other(day, start, end, owner, now):
+                return False
+            self._holds.setdefault(day, {})[owner] = (start, end, now + (ttl or self.hold_ttl))
+            return True
+
+    def release(self, day: date, owner: str):
+        with self._locks[self._stripe(day)]:
+            holds = self._holds.get(day)
+            if holds:
+                holds.pop(owner, None)
+
+    def confirm(self, day: date, start: int, duration: Optional[int] = None, owner: Optional[str] = None):
+        """Compare-and-set booking: succeeds only if no booking or foreign hold overlaps
+
+        The owner's own hold (if any) is consumed. Raises SlotUnavailable otherwise.
+        """
+        duration = duration or self.default_duration
+        end = start + duration
+        with self._locks[self._stripe(day)]:
+            if self._conflicts(day, start, end) or self._held_by_other(day, start, end, owner, time.monotonic()):
+                raise SlotUnavailable(f"{day.isoformat()} {format_time(start)} is no longer available")
+            self._insert(day, start, duration)
+            holds = self._holds.get(day)
+            if holds and owner is not None:
+                holds.pop(owner, None)
+
+    def add(self, day: date, start: int, duration: Optional[int] = None, force: bool = False):
+        """Record a booking; raises SlotUnavailable on overlap unless force is set"""
+        duration = duration or self.default_duration
+        with self._locks[self._stripe(day)]:
+            if not force and self._conflicts(day, start, start + duration):
+                raise SlotUnavailable(f"{day.isoformat()} {format_time(start)} overlaps an existing appointment")
+            self._insert(day, start, duration)
+
+    def add_many(self, slots: Iterable[Tuple[date, int, Optional[int]]]) -> int:
+        """Record existing bookings without overlap checks, e.g. when warm-loading from the store"""
+        loaded = 0
+        for day, start, duration in slots:
+            self.add(day, start, duration, force=True)
+            loaded += 1
+        return loaded
+
+    def remove(self, day: date, start: int) -> bool:
+        """Drop the booking that starts at the given time, if any"""
+        with self._locks[self._stripe(day)]:
+            starts = self._starts.get(day)
+            if not starts:
+                return False
+            i = bisect_left(starts, start)
+            if i == len(starts) or starts[i] != start:
+                return False
+            del starts[i]
+            del self._ends[day][i]
+            self._counts[self._stripe(day)] -= 1
+            return True
+
+    def add_appointment(self, appointment: dict, force: bool = False):
+        """Index an appointment dict with 'date', 'time' and optional 'duration_minutes'"""
+        day = parse_date(str(appointment['date']))
+        start = parse_time(str(appointment['time']))
+        duration = int(appointment.get('duration_minutes') or self.default_duration)
+        self.add(day, start, duration, force=force)
+
+    def next_free_slots(self, after: datetime, count: int = 3, duration: Optional[int] = None,
+                        max_days: int = 30, owner: Optional[str] = None) -> List[datetime]:
+        """Earliest free, unheld slots on the business-hours grid at or after `after`"""
+        duration = duration or self.default_duration
+        found: List[datetime] = []
+        day = after.date()
+        first_minute = after.hour * 60 + after.minute
+        now = time.monotonic()
+
+        for offset in range(max_days):
+            current = day + timedelta(days=offset)
+            start = self.day_start
+            if offset == 0 and first_minute > start:
+                # Round up to the next grid line
+                steps = -(-(first_minute - self.day_start) // self.slot_step)
+                start = self.day_start + steps * self.slot_step
+
+            with self._locks[self._stripe(current)]:
+                while start + duration <= self.day_end:
+                    end = start + duration
+                    if not self._conflicts(current, start, end) and not self._held_by_other(current, start, end, owner, now):
+                        found.append(datetime.combine(current, datetime.min.time()) + timedelta(minutes=start))
+                        if len(found) >= count:
+                            return found
+                    start += self.slot_step
+        return found
+
+    def holds_count(self) -> int:
+        now = time.monotonic()
+        return sum(1 for holds in list(self._holds.values()) for (_, _, expires_at) in list(holds.values()) if expires_at > now)
+
+    def __len__(self) -> int:
+        return sum(self._counts)
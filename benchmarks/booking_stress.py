@@ -0,0 +1,93 @@
+"""Concurrent booking stress test: many sessions racing for the same few slots
+
+Usage: python benchmarks/booking_stress.py [--workers 64] [--attempts 2000] [--slots 8]
+
+Each attempt plays one session: check_availability (which places a hold) and,
+if the slot was offered, save_appointment. A share of attempts skip the check
+and save blindly to exercise the compare-and-set path. Exits non-zero if any
+slot ends up booked twice in the index or the SQLite store.
+"""
+import argparse
+import logging
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_community.chat_models.fake import FakeListChatModel
+
+from appointment_bot import OptimizedAppointmentAgent
+from appointment_store import SQLiteAppointmentStore
+from session_store import current_session_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int, default=64)
+    parser.add_argument("--attempts", type=int, default=2000)
+    parser.add_argument("--slots", type=int, default=8)
+    parser.add_argument("--blind-ratio", type=float, default=0.25, help="share of attempts that save without checking")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    db_path = os.path.join(tempfile.mkdtemp(prefix="booking-stress-"), "appointments.db")
+    agent = OptimizedAppointmentAgent(
+        gemini_api_key="benchmark",
+        llm=FakeListChatModel(responses=["Final Answer: ok"]),
+        store=SQLiteAppointmentStore(db_path)
+    )
+    tools = {tool.name: tool.func for tool in agent.tools}
+
+    slots = [("2031-03-%02d" % (1 + i // 16), "%02d:%02d" % (9 + (i % 16) // 2, 30 * (i % 2))) for i in range(args.slots)]
+    booked = Counter()
+    booked_lock = threading.Lock()
+    start_line = threading.Barrier(min(args.workers, args.attempts))
+
+    def attempt(i: int):
+        if i < args.workers:
+            start_line.wait()
+        current_session_id.set(f"stress-{i}")
+        date, time_ = random.choice(slots)
+
+        if random.random() >= args.blind_ratio:
+            if not tools['check_availability'](f"{date} {time_}").startswith("✅"):
+                return
+        result = tools['save_appointment'](
+            f'{{"name": "Patient {i}", "appointment_type": "checkup", "date": "{date}", "time": "{time_}"}}'
+        )
+        if result.startswith("✅"):
+            with booked_lock:
+                booked[(date, time_)] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as pool:
+        list(pool.map(attempt, range(args.attempts)))
+    elapsed = time.perf_counter() - started
+
+    conn = sqlite3.connect(db_path)
+    stored = Counter(conn.execute("SELECT date, time FROM appointments").fetchall())
+    double_in_store = {slot: n for slot, n in stored.items() if n > 1}
+    double_reported = {slot: n for slot, n in booked.items() if n > 1}
+
+    print(f"attempts:           {args.attempts} over {args.slots} slots with {args.workers} workers")
+    print(f"elapsed:            {elapsed:.2f}s ({args.attempts / elapsed:.0f} attempts/s)")
+    print(f"successful saves:   {sum(booked.values())}")
+    print(f"rows in store:      {sum(stored.values())}")
+    print(f"slots in index:     {len(agent.availability)}")
+    print(f"double bookings:    {len(double_in_store) + len(double_reported)}")
+
+    if double_in_store or double_reported or sum(stored.values()) != sum(booked.values()):
+        print("FAIL: slot booked more than once or store out of sync")
+        sys.exit(1)
+    print("OK: zero double-bookings")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,351 @@
+"""Offline stand-ins for Gemini and Google Sheets used by the benchmarks
+
+ScriptedChatModel answers like the ReAct agent's Gemini model would: it reads
+the rendered prompt, decides on a tool call or a final answer, and waits a
+configurable latency first so the server sees realistic LLM timing without
+spending quota. ReplayChatModel plays back responses from a recorded corpus.
+FakeGspreadClient records the rows the Sheets writer appends, FakeSMTPServer
+the reminder emails sent to it.
+"""
+import asyncio
+import json
+import random
+import re
+import socketserver
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from fast_path import QUESTIONS, REQUIRED_FIELDS, FastPathExtractor, format_summary
+from history import SUMMARY_FIELDS
+from recording import prompt_digest
+
+
+_OBSERVATION_RE = re.compile(r"Observation: (.*?)(?:\nThought:|$)", re.S)
+_COLLECTED_RE = re.compile(r"^Collected: (.*?)(?:; still needed:.*)?$", re.M)
+_LABEL_FIELDS = {label: field for field, label in SUMMARY_FIELDS}
+_extractor = FastPathExtractor()
+
+
+def _final(text: str) -> str:
+    return f"Thought: Do I need to use a tool? No\nFinal Answer: {text}"
+
+
+def _action(tool: str, tool_input: str) -> str:
+    return f"Thought: Do I need to use a tool? Yes\nAction: {tool}\nAction Input: {tool_input}"
+
+
+def _collected_details(history: str) -> Dict[str, str]:
+    """Appointment fields mentioned so far, from the summary line and past user turns"""
+    details: Dict[str, str] = {}
+    match = _COLLECTED_RE.search(history)
+    if match:
+        for pair in match.group(1).split(", "):
+            label, _, value = pair.partition("=")
+            if label in _LABEL_FIELDS and value:
+                details[_LABEL_FIELDS[label]] = value
+    for line in history.splitlines():
+        if line.startswith("User: "):
+            details.update(_extractor.extract(line[len("User: "):]).fields)
+    return details
+
+
+def booking_script(prompt: str) -> str:
+    """Default policy: collect details, check the slot, confirm, then save
+
+    Tool observations are echoed back as the final answer, so each tool call
+    costs exactly two LLM calls, like a well-behaved Gemini run.
+    """
+    history, _, turn = prompt.rpartition("Patient: ")
+    message, _, scratchpad = turn.partition("\n")
+
+    observations = _OBSERVATION_RE.findall(scratchpad)
+    if observations:
+        return _final(observations[-1].strip())
+
+    extraction = _extractor.extract(message)
+    details = _collected_details(history)
+    details.update(extraction.fields)
+
+    missing = [field for field in REQUIRED_FIELDS if not details.get(field)]
+    if extraction.confirmation and not missing:
+        return _action("save_appointment", json.dumps({field: details[field] for field in REQUIRED_FIELDS}))
+    if 'date' in extraction.fields and details.get('time') or 'time' in extraction.fields and details.get('date'):
+        return _action("check_availability", f"{details['date']} {details['time']}")
+    if re.search(r"\b(available|availability|openings?|slots?)\b", message, re.I) and details.get('date'):
+        return _action("find_available_slots", details['date'])
+    if missing:
+        return _final(f"Thanks! {QUESTIONS[missing[0]]}")
+    return _final(f"Here's a summary of your appointment:\n{format_summary(details)}\n\nShall I confirm this booking?")
+
+
+def structured_script(prompt: str) -> str:
+    """Policy for the structured agent mode: the JSON extraction a well-behaved model returns"""
+    awaiting = re.search(r"^Last question asked: (\w+)", prompt, re.M)
+    message = prompt.rpartition("Patient: ")[2].rpartition("\nJSON:")[0]
+    extraction = _extractor.extract(message, awaiting=awaiting.group(1) if awaiting else None)
+
+    if re.search(r"\b(available|availability|openings?|slots?)\b", message, re.I):
+        intent = "find_slots"
+    elif extraction.fields or extraction.confirmation is not None:
+        intent = "details"
+    else:
+        intent = "question"
+    return json.dumps({
+        'fields': extraction.fields,
+        'confirm': extraction.confirmation,
+        'intent': intent,
+        'reply': "Happy to help! I can book checkups, consultations, follow-ups and more." if intent == "question" else ""
+    })
+
+
+class ResourceExhausted(Exception):
+    """Stands in for google.api_core.exceptions.ResourceExhausted (HTTP 429)"""
+
+
+class ScriptedChatModel(BaseChatModel):
+    """Fake ChatGoogleGenerativeAI with scripted ReAct replies and simulated latency
+
+    `script` maps the rendered prompt to the raw model reply (defaults to
+    booking_script; use structured_script for the structured agent mode). Each call sleeps `latency` seconds plus up to `jitter`
+    seconds, then fails with a 429 ResourceExhausted with probability
+    `failure_rate`. `calls`, `failures` and `tool_calls` count what the agent asked for.
+    """
+
+    latency: float = 0.2
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+    script: Callable[[str], str] = booking_script
+    seed: Optional[int] = None
+    calls: int = 0
+    failures: int = 0
+    tool_calls: Dict[str, int] = {}
+    _lock: Any = None
+    _random: Any = None
+
+    class Config:
+        underscore_attrs_are_private = True
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._lock = threading.Lock()
+        self._random = random.Random(self.seed)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {'model': 'scripted-fake', 'latency': self.latency}
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        with self._lock:
+            if self.failure_rate and self._random.random() < self.failure_rate:
+                self.failures += 1
+                raise ResourceExhausted("429 Quota exceeded for generate_content requests per minute")
+        reply = self.script("\n".join(str(message.content) for message in messages))
+        action = re.search(r"^Action: (\w+)", reply, re.M)
+        with self._lock:
+            self.calls += 1
+            if action:
+                self.tool_calls[action.group(1)] = self.tool_calls.get(action.group(1), 0) + 1
+        return reply
+
+    def _delay(self) -> float:
+        with self._lock:
+            return self.latency + self._random.uniform(0, self.jitter)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs: Any) -> ChatResult:
+        time.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self._delay())
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._reply(messages)))])
+
+
+class ReplayChatModel(BaseChatModel):
+    """Answers with the LLM responses recorded for the current turn, in order
+
+    Call `load_turn` with a turn's recorded `llm` entries before replaying it.
+    Calls beyond the recording get `unscripted_reply` and count as
+    `unscripted`; `prompt_changes` counts calls whose prompt fingerprint
+    differs from the recorded one. Each call sleeps its recorded time times
+    `latency_scale` (0 replays instantly).
+    """
+
+    latency_scale: float = 0.0
+    unscripted_reply: str = "Thought: Do I need to use a tool? No\nFinal Answer: (no recorded response)"
+    calls: int = 0
+    unscripted: int = 0
+    prompt_changes: int = 0
+    _pending: Any = None
+
+    class Config:
+        underscore_attrs_are_private = True
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._pending = deque()
+
+    @property
+    def _llm_type(self) -> str:
+        return "replay-fake"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return {'model': 'replay-fake'}
+
+    def load_turn(self, responses: List[Dict[str, Any]]):
+        # In place: wrappers such as StreamingChatModel hold a copy sharing this deque
+        self._pending.clear()
+        self._pending.extend(responses)
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs: Any) -> ChatResult:
+        self.calls += 1
+        if not self._pending:
+            self.unscripted += 1
+            reply = self.unscripted_reply
+        else:
+            recorded = self._pending.popleft()
+            if recorded.get('prompt') and recorded['prompt'] != prompt_digest(messages):
+                self.prompt_changes += 1
+            time.sleep(recorded.get('ms', 0) / 1000 * self.latency_scale)
+            reply = recorded['text']
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+
+class FakeWorksheet:
+    """Records appended rows; `append_rows` blocks for `latency` like the Sheets API"""
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rows: List[List[Any]] = []
+        self.calls = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def append_rows(self, values: List[List[Any]], value_input_option: Optional[str] = None, **kwargs: Any):
+        time.sleep(self.latency)
+        with self._lock:
+            self.calls += 1
+            if self._random.random() < self.failure_rate:
+                self.failures += 1
+                raise ConnectionError("simulated Sheets API failure")
+            self.rows.extend(values)
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet: FakeWorksheet):
+        self.sheet1 = worksheet
+
+
+class FakeGspreadClient:
+    """Minimal gspread.Client: every URL opens the same recording worksheet"""
+
+    def __init__(self, latency: float = 0.05, failure_rate: float = 0.0, seed: Optional[int] = None):
+        self.worksheet = FakeWorksheet(latency=latency, failure_rate=failure_rate, seed=seed)
+
+    def open_by_url(self, url: str) -> FakeSpreadsheet:
+        return FakeSpreadsheet(self.worksheet)
+
+
+class FakeSMTPServer:
+    """Local SMTP stand-in for smtplib; `messages` holds (sender, recipients, data) of every accepted email
+
+    Speaks just enough SMTP (EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT).
+    Each DATA waits `latency` seconds; recipients in `refuse` get a 550.
+    Port 0 picks a free port, see `port` after construction.
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.0, refuse: Iterable[str] = ()):
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            def handle(self):
+                fake._session(self.rfile, self.wfile)
+
+        self.latency = latency
+        self.refuse = set(refuse)
+        self.messages: List[Tuple[str, List[str], str]] = []
+        self.connections = 0
+        self.max_connections = 0
+        self._active = 0
+        self._lock = threading.Lock()
+        self._server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self.host, self.port = self._server.server_address[:2]
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> "FakeSMTPServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-smtp", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _session(self, rfile, wfile):
+        def reply(line: str):
+            wfile.write((line + "\r\n").encode("ascii"))
+            wfile.flush()
+
+        with self._lock:
+            self.connections += 1
+            self._active += 1
+            self.max_connections = max(self.max_connections, self._active)
+        try:
+            reply("220 fake-smtp ready")
+            sender, recipients = "", []
+            while True:
+                line = rfile.readline()
+                if not line:
+                    break
+                command = line.decode("utf-8", errors="replace").strip()
+                verb = command[:4].upper()
+                if verb in ("EHLO", "HELO"):
+                    reply("250 fake-smtp")
+                elif verb == "MAIL":
+                    sender, recipients = command[10:].strip(" <>"), []
+                    reply("250 OK")
+                elif verb == "RCPT":
+                    address = command[8:].strip(" <>")
+                    if address in self.refuse:
+                        reply("550 No such user")
+                    else:
+                        recipients.append(address)
+                        reply("250 OK")
+                elif verb == "DATA":
+                    reply("354 End data with <CR><LF>.<CR><LF>")
+                    data = []
+                    while True:
+                        line = rfile.readline()
+                        if not line or line in (b".\r\n", b".\n"):
+                            break
+                        data.append(line)
+                    time.sleep(self.latency)
+                    with self._lock:
+                        self.messages.append((sender, recipients, b"".join(data).decode("utf-8", errors="replace")))
+                    reply("250 OK queued")
+                elif verb in ("RSET", "NOOP"):
+                    reply("250 OK")
+                elif verb == "QUIT":
+                    reply("221 Bye")
+                    break
+                else:
+                    reply("502 Command not implemented")
+        finally:
+            with self._lock:
+                self._active -= 1
@@ -0,0 +1,375 @@
+"""Offline load test: multi-turn bookings against the Flask or ASGI app with fake Gemini and Sheets
+
+Usage: python benchmarks/load_test.py [--server flask|asgi] [--conversations 200] [--concurrency 16]
+                                      [--llm-latency 0.2] [--no-fast-path] [--agent-mode react|structured]
+                                      [--llm-failure-rate 0.1] [--llm-rpm 600] [--fallback-queue-depth 8]
+                                      [--record corpus.jsonl]
+                                      [--output run.json]
+                                      [--compare baseline.json] [--max-regression 10]
+
+Each conversation books its own slot over seven chat turns, then resets its
+session; /health is probed after every conversation. Reports throughput,
+p50/p95/p99 latency per endpoint, LLM calls per booking and memory growth.
+Results are written as JSON with the run configuration, and --compare prints
+the difference against an earlier run (exit status 1 when a latency or
+LLM-call metric regressed by more than --max-regression percent).
+"""
+import argparse
+import asyncio
+import gc
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeGspreadClient, ScriptedChatModel, booking_script, structured_script
+from llm_scheduler import LLMScheduler
+
+NAMES = ["Alex Morgan", "Jamie Rivera", "Sam Patel", "Taylor Brooks", "Jordan Lee", "Casey Nguyen",
+         "Riley Evans", "Morgan Diaz", "Avery Chen", "Quinn Foster"]
+TYPES = ["checkup", "consultation", "follow-up", "vaccination"]
+SLOTS_PER_DAY = 16
+ENDPOINTS = ['/webhook/chat', '/reset', '/health']
+
+# Metrics where a higher value is a regression, compared by --compare
+COMPARED_METRICS = [
+    ('throughput_turns_per_s', False),
+    ('llm_calls_per_booking', True),
+    ('/webhook/chat.p50_ms', True),
+    ('/webhook/chat.p95_ms', True),
+    ('/webhook/chat.p99_ms', True),
+    ('/health.p95_ms', True),
+    ('memory.rss_growth_mb', True),
+]
+
+
+def conversation(index: int, first_day: date) -> List[str]:
+    """Chat turns for one booking; every conversation gets a distinct slot"""
+    day = first_day + timedelta(days=index // SLOTS_PER_DAY)
+    minutes = 9 * 60 + (index % SLOTS_PER_DAY) * 30
+    name = f"{NAMES[index % len(NAMES)]}"
+    return [
+        "Hi, I'd like to book an appointment",
+        f"My name is {name}",
+        f"I need a {TYPES[index % len(TYPES)]}",
+        f"{day.isoformat()} at {minutes // 60:02d}:{minutes % 60:02d}",
+        f"{name.split()[0].lower()}{index}@example.com",
+        f"555-{index // 10000 % 1000:03d}-{index % 10000:04d}",
+        "yes",
+    ]
+
+
+def percentile(values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not values:
+        return 0.0
+    rank = max(1, min(len(values), int(round(pct / 100 * len(values) + 0.5))))
+    return values[rank - 1]
+
+
+def rss_mb() -> float:
+    """Current resident set size, falling back to peak RSS where /proc is unavailable"""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 2 ** 20 if sys.platform == "darwin" else peak / 1024
+
+
+class Recorder:
+    """Thread-safe latency samples per endpoint plus error counts"""
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {endpoint: [] for endpoint in ENDPOINTS}
+        self.errors: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def record(self, endpoint: str, seconds: float, status: int):
+        with self._lock:
+            self.samples[endpoint].append(seconds)
+            if status != 200:
+                key = f"{endpoint} {status}"
+                self.errors[key] = self.errors.get(key, 0) + 1
+
+    def summary(self) -> Dict[str, Dict[str, float]]:
+        result = {}
+        for endpoint, samples in self.samples.items():
+            ordered = sorted(samples)
+            result[endpoint] = {
+                'count': len(ordered),
+                'mean_ms': round(sum(ordered) / len(ordered) * 1000, 3) if ordered else 0.0,
+                'p50_ms': round(percentile(ordered, 50) * 1000, 3),
+                'p95_ms': round(percentile(ordered, 95) * 1000, 3),
+                'p99_ms': round(percentile(ordered, 99) * 1000, 3),
+                'max_ms': round(ordered[-1] * 1000, 3) if ordered else 0.0,
+            }
+        return result
+
+
+def run_flask(app, turns: Callable[[int], List[str]], conversations: int, concurrency: int, recorder: Recorder):
+    """Drive the Flask app in-process from a thread pool, like the threaded dev server"""
+
+    def call(client, method: str, endpoint: str, body: Optional[dict] = None):
+        started = time.perf_counter()
+        response = client.open(endpoint, method=method, json=body)
+        recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+
+    def converse(index: int):
+        client = app.test_client()
+        session_id = f"load-{index}"
+        for message in turns(index):
+            call(client, 'POST', '/webhook/chat', {'message': message, 'session_id': session_id})
+        call(client, 'POST', '/reset', {'session_id': session_id})
+        call(client, 'GET', '/health')
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(converse, range(conversations)))
+
+
+def run_asgi(app, turns: Callable[[int], List[str]], conversations: int, concurrency: int, recorder: Recorder):
+    """Drive the Starlette app in-process over httpx's ASGI transport"""
+    import httpx
+
+    async def main():
+        semaphore = asyncio.Semaphore(concurrency)
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://load-test", timeout=None) as client:
+
+            async def call(method: str, endpoint: str, body: Optional[dict] = None):
+                started = time.perf_counter()
+                response = await client.request(method, endpoint, json=body)
+                recorder.record(endpoint, time.perf_counter() - started, response.status_code)
+
+            async def converse(index: int):
+                async with semaphore:
+                    session_id = f"load-{index}"
+                    for message in turns(index):
+                        await call('POST', '/webhook/chat', {'message': message, 'session_id': session_id})
+                    await call('POST', '/reset', {'session_id': session_id})
+                    await call('GET', '/health')
+
+            await asyncio.gather(*(converse(index) for index in range(conversations)))
+
+    asyncio.run(main())
+
+
+def build_app(args, llm: ScriptedChatModel, sheets: FakeGspreadClient, workdir: str,
+              fallback: Optional[ScriptedChatModel] = None):
+    agent_kwargs = dict(
+        google_creds_path=None,
+        sheet_url="https://docs.google.com/spreadsheets/d/load-test",
+        sheets_spool_path=os.path.join(workdir, "sheets_spool.jsonl"),
+        response_cache_path=None,
+        appointments_db_path=os.path.join(workdir, "appointments.db"),
+        llm=llm,
+        gspread_client=sheets,
+        enable_fast_path=not args.no_fast_path,
+        agent_mode=args.agent_mode,
+        max_sessions=max(10000, args.conversations),
+        record_path=args.record,
+    )
+    if args.llm_scheduler or args.llm_rpm or args.fallback_queue_depth:
+        agent_kwargs['llm_scheduler'] = LLMScheduler(requests_per_minute=args.llm_rpm,
+                                                     fallback_queue_depth=args.fallback_queue_depth,
+                                                     max_queue=max(256, args.concurrency * 2))
+        agent_kwargs['fallback_llm'] = fallback
+    if args.server == 'asgi':
+        from asgi_app import create_async_appointment_bot
+        app = create_async_appointment_bot(
+            "load-test",
+            max_concurrent_llm_calls=args.max_llm_concurrency,
+            max_waiting_llm_calls=max(256, args.concurrency * 2),
+            request_timeout=args.request_timeout,
+            **agent_kwargs
+        )
+        return app, app.state.agent
+
+    from appointment_bot import create_appointment_bot
+    app = create_appointment_bot("load-test", **agent_kwargs)
+    return app, app.extensions['appointment_agent']
+
+
+def run(args) -> Dict[str, Any]:
+    workdir = tempfile.mkdtemp(prefix="load-test-")
+    script = structured_script if args.agent_mode == 'structured' else booking_script
+    llm = ScriptedChatModel(latency=args.llm_latency, jitter=args.llm_jitter, seed=args.seed, script=script,
+                            failure_rate=args.llm_failure_rate)
+    # The cheaper fallback answers the same script, faster and without quota errors
+    fallback = ScriptedChatModel(latency=args.llm_latency / 2, seed=args.seed, script=script) \
+        if args.fallback_queue_depth else None
+    sheets = FakeGspreadClient(latency=args.sheets_latency, failure_rate=args.sheets_failure_rate, seed=args.seed)
+    app, agent = build_app(args, llm, sheets, workdir, fallback)
+    agent.agent.verbose = False
+
+    first_day = date.today() + timedelta(days=1)
+    turns = lambda index: conversation(index, first_day)
+    recorder = Recorder()
+
+    gc.collect()
+    rss_start = rss_mb()
+    started = time.perf_counter()
+    runner = run_asgi if args.server == 'asgi' else run_flask
+    runner(app, turns, args.conversations, args.concurrency, recorder)
+    duration = time.perf_counter() - started
+    gc.collect()
+    rss_end = rss_mb()
+
+    # Drain the write-behind queue so Sheets numbers cover the whole run
+    if agent.sheets_writer:
+        agent.sheets_writer.stop()
+
+    chat_turns = len(recorder.samples['/webhook/chat'])
+    bookings = agent.store.count()
+    endpoints = recorder.summary()
+    return {
+        'config': {
+            'server': args.server,
+            'conversations': args.conversations,
+            'concurrency': args.concurrency,
+            'llm_latency': args.llm_latency,
+            'llm_jitter': args.llm_jitter,
+            'sheets_latency': args.sheets_latency,
+            'sheets_failure_rate': args.sheets_failure_rate,
+            'llm_failure_rate': args.llm_failure_rate,
+            'llm_rpm': args.llm_rpm,
+            'fallback_queue_depth': args.fallback_queue_depth,
+            'fast_path': not args.no_fast_path,
+            'agent_mode': args.agent_mode,
+            'seed': args.seed,
+            'python': platform.python_version(),
+        },
+        'duration_s': round(duration, 3),
+        'chat_turns': chat_turns,
+        'throughput_turns_per_s': round(chat_turns / duration, 2),
+        'bookings': bookings,
+        'bookings_per_s': round(bookings / duration, 2),
+        'booking_failures': args.conversations - bookings,
+        'errors': recorder.errors,
+        'endpoints': endpoints,
+        'llm_calls': llm.calls,
+        'llm_calls_per_booking': round(llm.calls / bookings, 3) if bookings else None,
+        'tool_calls': dict(llm.tool_calls),
+        'llm_failures': llm.failures,
+        'fallback_llm_calls': fallback.calls if fallback else 0,
+        'llm_scheduler': agent.llm_scheduler.stats() if agent.llm_scheduler else None,
+        'local_turn_fraction': agent.fast_path_stats()['local_fraction'],
+        'sheets': {'rows_written': len(sheets.worksheet.rows), 'api_calls': sheets.worksheet.calls},
+        'memory': {
+            'rss_start_mb': round(rss_start, 2),
+            'rss_end_mb': round(rss_end, 2),
+            'rss_growth_mb': round(rss_end - rss_start, 2),
+            'growth_per_conversation_kb': round((rss_end - rss_start) * 1024 / args.conversations, 2),
+        },
+    }
+
+
+def metric(results: Dict[str, Any], name: str) -> Optional[float]:
+    """Look up 'a.b' paths; endpoint names contain slashes but no dots"""
+    head, _, tail = name.partition('.')
+    value = results.get('endpoints', {}).get(head) if head.startswith('/') else results.get(head)
+    return value.get(tail) if tail and isinstance(value, dict) else value
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], max_regression: float) -> List[str]:
+    """Print a side-by-side table and return the metrics that regressed beyond the threshold"""
+    if current['config'] != baseline.get('config'):
+        print("⚠️ Run configurations differ; deltas may not be meaningful")
+
+    regressions = []
+    print(f"\n{'metric':<28} {'baseline':>12} {'current':>12} {'change':>9}")
+    for name, higher_is_worse in COMPARED_METRICS:
+        old, new = metric(baseline, name), metric(current, name)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        worse = change if higher_is_worse else -change
+        flag = "  ❌" if worse > max_regression and not name.startswith('memory') else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<28} {old:>12.2f} {new:>12.2f} {change:>8.1f}%{flag}")
+    return regressions
+
+
+def print_report(results: Dict[str, Any]):
+    config = results['config']
+    print(f"{config['server']} server, {config['conversations']} conversations at concurrency "
+          f"{config['concurrency']}, LLM latency {config['llm_latency'] * 1000:.0f} ms, "
+          f"fast path {'on' if config['fast_path'] else 'off'}, {config['agent_mode']} agent")
+    print(f"{results['chat_turns']} chat turns in {results['duration_s']:.2f}s: "
+          f"{results['throughput_turns_per_s']} turns/s, {results['bookings_per_s']} bookings/s")
+    print(f"\n{'endpoint':<16} {'count':>6} {'p50_ms':>9} {'p95_ms':>9} {'p99_ms':>9} {'max_ms':>9}")
+    for endpoint, stats in results['endpoints'].items():
+        print(f"{endpoint:<16} {stats['count']:>6} {stats['p50_ms']:>9.1f} {stats['p95_ms']:>9.1f} "
+              f"{stats['p99_ms']:>9.1f} {stats['max_ms']:>9.1f}")
+    print(f"\nbookings: {results['bookings']} (failed {results['booking_failures']}), "
+          f"LLM calls: {results['llm_calls']} ({results['llm_calls_per_booking']} per booking), "
+          f"answered locally: {results['local_turn_fraction']:.0%}")
+    print(f"tool calls: {results['tool_calls'] or 'none'}")
+    if results['llm_failures'] or results['llm_scheduler']:
+        print(f"llm: {results['llm_failures']} injected 429s, {results['fallback_llm_calls']} fallback calls, "
+              f"scheduler {results['llm_scheduler']}")
+    print(f"sheets: {results['sheets']['rows_written']} rows in {results['sheets']['api_calls']} API calls")
+    memory = results['memory']
+    print(f"memory: RSS {memory['rss_start_mb']:.1f} -> {memory['rss_end_mb']:.1f} MB "
+          f"({memory['growth_per_conversation_kb']:.1f} KB per conversation)")
+    if results['errors']:
+        print(f"errors: {results['errors']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=['flask', 'asgi'], default='flask')
+    parser.add_argument("--conversations", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="seconds per fake LLM call")
+    parser.add_argument("--llm-jitter", type=float, default=0.05, help="extra random seconds per LLM call")
+    parser.add_argument("--sheets-latency", type=float, default=0.05, help="seconds per fake append_rows call")
+    parser.add_argument("--sheets-failure-rate", type=float, default=0.0)
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="share of fake LLM calls failing with 429")
+    parser.add_argument("--llm-scheduler", action="store_true", help="route LLM calls through an LLMScheduler")
+    parser.add_argument("--llm-rpm", type=float, help="scheduler requests-per-minute quota (implies --llm-scheduler)")
+    parser.add_argument("--fallback-queue-depth", type=int,
+                        help="queued calls before overflow goes to a faster fake fallback model")
+    parser.add_argument("--max-llm-concurrency", type=int, default=32, help="ASGI in-flight LLM call limit")
+    parser.add_argument("--request-timeout", type=float, default=30.0, help="ASGI per-turn timeout")
+    parser.add_argument("--no-fast-path", action="store_true", help="send every turn to the (fake) LLM")
+    parser.add_argument("--agent-mode", choices=['react', 'structured'], default='react')
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", help="write results as JSON to this file")
+    parser.add_argument("--record", help="record the conversations to this corpus for benchmarks/replay.py")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare against")
+    parser.add_argument("--max-regression", type=float, default=10.0, help="percent allowed before --compare fails")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    results = run(args)
+    print_report(results)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(results, handle, indent=2)
+        print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            baseline = json.load(handle)
+        regressions = compare(results, baseline, args.max_regression)
+        if regressions:
+            print(f"\n❌ Regressed by more than {args.max_regression}%: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
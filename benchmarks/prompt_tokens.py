@@ -0,0 +1,73 @@
+"""Prompt size per turn over a long conversation, using a recording fake LLM
+
+Usage: python benchmarks/prompt_tokens.py [--turns 40] [--budget 600]
+
+Prints the estimated prompt tokens sent to the model on each turn next to
+what an unbounded history would have added, plus history render time.
+"""
+import argparse
+import logging
+import os
+import sys
+import time
+from typing import Any, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from appointment_bot import OptimizedAppointmentAgent
+from history import estimate_tokens
+
+
+class RecordingChatModel(BaseChatModel):
+    """Answers every call directly and remembers how big each prompt was"""
+
+    prompt_tokens: List[int] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "recording-fake"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs: Any) -> ChatResult:
+        self.prompt_tokens.append(sum(estimate_tokens(str(m.content)) for m in messages))
+        reply = "Thought: Do I need to use a tool? No\nFinal Answer: Thanks for sharing that! Could you tell me a bit more about what you need?"
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=reply))])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--turns", type=int, default=40)
+    parser.add_argument("--budget", type=int, default=600, help="history token budget")
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    llm = RecordingChatModel(prompt_tokens=[])
+    agent = OptimizedAppointmentAgent(
+        gemini_api_key="benchmark",
+        llm=llm,
+        enable_fast_path=False,
+        history_token_budget=args.budget
+    )
+    agent.agent.verbose = False
+
+    unbounded_tokens = 0
+    print(f"{'turn':>4}  {'prompt_tokens':>13}  {'unbounded_history':>17}  {'render_us':>9}")
+    for turn in range(1, args.turns + 1):
+        message = f"I was wondering about option number {turn}, and whether it suits my schedule next week"
+        session = agent.sessions.get("benchmark")
+
+        started = time.perf_counter()
+        session.memory.render(session.appointment_data)
+        render_us = (time.perf_counter() - started) * 1e6
+
+        reply = agent.process_message(message, session_id="benchmark")
+        unbounded_tokens += estimate_tokens(f"User: {message}\nAssistant: {reply}")
+        print(f"{turn:>4}  {llm.prompt_tokens[-1]:>13}  {unbounded_tokens:>17}  {render_us:>9.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+"""Reminder scheduler at scale: schedule, persist, reload and dispatch 100k reminders
+
+Usage: python benchmarks/reminder_stress.py [--reminders 100000] [--sink file|smtp] [--smtp-latency 0.001]
+                                            [--batch-size 100] [--max-concurrency 4] [--no-store]
+
+Books one email and one SMS reminder per synthetic appointment, all due about
+an hour from now, and schedules them in import-sized batches. A second
+scheduler then starts from the SQLite store (as after a restart) with its
+clock moved forward so everything is due, and dispatches to a FileSink or,
+for email, to a local FakeSMTPServer. Exits non-zero if any reminder was
+lost or sent twice, or if more sink batches ran at once than allowed.
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import FakeSMTPServer
+from reminders import FileSink, ReminderScheduler, SMTPEmailSink, SQLiteReminderStore
+
+OFFSET_MINUTES = 60
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reminders", type=int, default=100000)
+    parser.add_argument("--sink", choices=['file', 'smtp'], default='file', help="email sink (SMS always goes to a file)")
+    parser.add_argument("--smtp-latency", type=float, default=0.001, help="seconds the fake SMTP server takes per email")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--max-concurrency", type=int, default=4)
+    parser.add_argument("--import-batch", type=int, default=1000, help="appointments per schedule_many call")
+    parser.add_argument("--no-store", action="store_true", help="keep reminders in memory only (no reload step)")
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    workdir = tempfile.mkdtemp(prefix="reminder-stress-")
+    db_path = None if args.no_store else os.path.join(workdir, "reminders.db")
+    outbox_path = os.path.join(workdir, "outbox.jsonl")
+
+    smtp_server = FakeSMTPServer(latency=args.smtp_latency).start() if args.sink == 'smtp' else None
+
+    def sinks():
+        email = (SMTPEmailSink(smtp_server.host, smtp_server.port) if smtp_server
+                 else FileSink(outbox_path, channel='email'))
+        return [email, FileSink(outbox_path, channel='sms')]
+
+    # Appointments a little over an hour out, so their reminders are due in a few minutes
+    base = datetime.now().replace(second=0, microsecond=0) + timedelta(minutes=OFFSET_MINUTES + 5)
+    count = args.reminders // 2
+    appointments = [{
+        'name': f"Patient {i}", 'appointment_type': "Checkup", 'provider': f"p{i}",
+        'date': (base + timedelta(minutes=i % 2)).date().isoformat(),
+        'time': (base + timedelta(minutes=i % 2)).strftime("%H:%M"),
+        'email': f"patient{i}@example.com", 'phone': f"+1555{i:07d}", 'status': 'Confirmed'
+    } for i in range(count)]
+
+    skew = [0.0]
+    clock = lambda: time.time() + skew[0]
+
+    def scheduler():
+        return ReminderScheduler(sinks(), store=SQLiteReminderStore(db_path) if db_path else None,
+                                 offsets_minutes=[OFFSET_MINUTES], batch_size=args.batch_size,
+                                 max_concurrency=args.max_concurrency, clock=clock)
+
+    first = scheduler()
+    started = time.perf_counter()
+    scheduled = 0
+    for start in range(0, count, args.import_batch):
+        scheduled += first.schedule_many(appointments[start:start + args.import_batch])
+    schedule_s = time.perf_counter() - started
+    again = first.schedule_many(appointments[:args.import_batch])
+
+    if db_path:
+        first.stop()
+        dispatcher = scheduler()
+    else:
+        dispatcher = first
+
+    # Jump to just after the last reminder is due and before the first appointment starts
+    last_due = base + timedelta(minutes=1) - timedelta(minutes=OFFSET_MINUTES)
+    skew[0] = (last_due + timedelta(seconds=5)).timestamp() - time.time()
+    started = time.perf_counter()
+    dispatcher.start()
+    loaded_s = None
+    max_in_flight = 0
+    while True:
+        stats = dispatcher.stats()
+        if loaded_s is None and (stats['pending'] or stats['sent']):
+            loaded_s = time.perf_counter() - started
+        max_in_flight = max(max_in_flight, stats['in_flight_batches'])
+        if stats['sent'] + stats['failed'] + stats['expired'] >= scheduled and not stats['in_flight_batches']:
+            break
+        time.sleep(0.02)
+    dispatch_s = time.perf_counter() - started
+    stats = dispatcher.stats()
+    dispatcher.stop()
+
+    delivered = Counter()
+    if os.path.exists(outbox_path):
+        with open(outbox_path, encoding="utf-8") as outbox:
+            for line in outbox:
+                delivered[json.loads(line)['id']] += 1
+    if smtp_server:
+        for _, recipients, _ in smtp_server.messages:
+            delivered[recipients[0]] += 1
+        smtp_server.stop()
+    duplicates = sum(1 for times in delivered.values() if times > 1)
+
+    statuses = {}
+    if db_path:
+        conn = sqlite3.connect(db_path)
+        statuses = dict(conn.execute("SELECT status, COUNT(*) FROM reminders GROUP BY status").fetchall())
+        conn.close()
+
+    print(f"{scheduled} reminders for {count} appointments scheduled in {schedule_s:.2f}s "
+          f"({scheduled / schedule_s:,.0f}/s, {'SQLite store' if db_path else 'memory only'}); "
+          f"rescheduling {args.import_batch} appointments added {again}")
+    print(f"dispatcher {'reloaded the store and ' if db_path else ''}started in {loaded_s or 0:.2f}s; "
+          f"sent {stats['sent']} in {dispatch_s:.2f}s ({stats['sent'] / dispatch_s:,.0f}/s) over {stats['batches']} batches "
+          f"to {args.sink} email + file SMS")
+    print(f"failed {stats['failed']}, retried {stats['retried']}, expired {stats['expired']}, "
+          f"max batches in flight {max_in_flight}/{args.max_concurrency}"
+          + (f", max SMTP connections {smtp_server.max_connections}" if smtp_server else ""))
+    print(f"delivered {sum(delivered.values())}, distinct {len(delivered)}, duplicates {duplicates}; "
+          f"store statuses {statuses or '-'}; peak RSS {resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:.0f} MB")
+
+    lost = stats['sent'] != scheduled or sum(delivered.values()) != scheduled
+    too_many = max_in_flight > args.max_concurrency or (smtp_server and smtp_server.max_connections > args.max_concurrency)
+    if lost or duplicates or again or too_many:
+        print("❌ reminders lost, duplicated or over the concurrency limit")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
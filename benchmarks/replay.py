@@ -0,0 +1,238 @@
+"""Replay a recorded conversation corpus against the current agent and report regressions
+
+Usage: python benchmarks/replay.py corpus.jsonl [--llm recorded|scripted|live] [--workers 4]
+                                   [--agent-mode react|structured] [--latency-scale 0]
+                                   [--no-fast-path] [--no-date-shift] [--output report.json]
+
+Record a corpus by setting CONVERSATION_RECORD_PATH on the server (or with
+`load_test.py --record`). Every conversation is replayed turn by turn on a
+fresh agent in a pool of worker processes:
+
+- `recorded` answers each LLM call with the response recorded for that turn,
+  so runs are deterministic and free; a prompt change shows up as changed
+  prompt fingerprints, a flow change as extra or missing LLM calls.
+- `scripted` uses the offline ScriptedChatModel; `live` calls Gemini
+  (GEMINI_API_KEY) to see how a prompt change behaves with the real model.
+
+Reports, per conversation and in total, whether the booked fields match the
+recording, LLM calls recorded vs replayed and turn latency recorded vs
+replayed. Recorded dates are moved forward by whole weeks so old corpora
+still book future slots; relative phrases ("tomorrow") resolve against
+today. Exits with status 1 when any conversation booked different fields.
+"""
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from fakes import ReplayChatModel, ScriptedChatModel, booking_script, structured_script
+from load_test import percentile
+from llm_cache import ResponseCache
+from recording import BOOKED_FIELDS, ConversationRecorder, date_shift, load_conversations, shift_dates
+
+LLM_MODES = ('recorded', 'scripted', 'live')
+
+# Per worker process: replay settings and, in live mode, the Gemini client built by the first agent
+_WORKER: Dict[str, Any] = {}
+
+
+def _init_worker(settings: Dict[str, Any]):
+    logging.disable(logging.WARNING)
+    _WORKER.update(settings)
+
+
+def _booked(records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{field: booking.get(field) for field in BOOKED_FIELDS} for record in records
+            for booking in record.get('booked', [])]
+
+
+def _mismatches(expected: List[Dict[str, Any]], actual: List[Dict[str, Any]]) -> Dict[str, Any]:
+    if len(expected) != len(actual):
+        return {'bookings': [len(expected), len(actual)]}
+    return {f"{index}.{field}": [want[field], got[field]]
+            for index, (want, got) in enumerate(zip(expected, actual))
+            for field in BOOKED_FIELDS if want[field] != got[field]}
+
+
+def replay_conversation(conversation: Dict[str, Any]) -> Dict[str, Any]:
+    """Replay one conversation on a fresh agent; runs in a worker process"""
+    from appointment_bot import OptimizedAppointmentAgent
+    from appointment_store import InMemoryAppointmentStore
+
+    turns = conversation['turns']
+    shift = date_shift(datetime.fromisoformat(turns[0]['at']).date()) if _WORKER['date_shift'] else 0
+    agent_mode = _WORKER['agent_mode'] or turns[0].get('mode', 'react')
+
+    if _WORKER['llm'] == 'recorded':
+        llm = ReplayChatModel(latency_scale=_WORKER['latency_scale'])
+    elif _WORKER['llm'] == 'scripted':
+        llm = ScriptedChatModel(latency=0.0, script=structured_script if agent_mode == 'structured' else booking_script)
+    else:
+        llm = _WORKER.get('gemini')  # None until the first agent in this worker has built it
+
+    replayed: List[Dict[str, Any]] = []
+    agent = OptimizedAppointmentAgent(
+        _WORKER['gemini_api_key'], llm=llm, sheets_spool_path=None, store=InMemoryAppointmentStore(),
+        response_cache=ResponseCache(),
+        agent_mode=agent_mode, enable_fast_path=_WORKER['fast_path'],
+        recorder=ConversationRecorder(on_record=replayed.append)
+    )
+    result: Dict[str, Any] = {'id': conversation['id'], 'turns': len(turns), 'date_shift_days': shift}
+    try:
+        agent.agent.verbose = False
+        if _WORKER['llm'] == 'live':
+            _WORKER['gemini'] = agent.llm
+        for turn in turns:
+            message = shift_dates(turn['input'], shift)
+            if turn['path'] == 'cache':
+                # Cache hits depend on other traffic, not on the code under test, so replay them as hits
+                session = agent.sessions.get(conversation['session'])
+                cache_key = agent._response_cache_key(session, message)
+                if cache_key:
+                    agent.response_cache.set(cache_key, shift_dates(turn['output'], shift))
+            if isinstance(llm, ReplayChatModel):
+                llm.load_turn([{**call, 'text': shift_dates(call['text'], shift)} for call in turn['llm']])
+            agent.process_message(message, session_id=conversation['session'])
+    except Exception as e:
+        result['error'] = f"{type(e).__name__}: {e}"
+
+    expected = [{**booking, 'date': shift_dates(booking['date'], shift)} for booking in _booked(turns)]
+    actual = _booked(replayed)
+    result.update({
+        'expected': expected,
+        'booked': actual,
+        'correct': expected == actual and 'error' not in result,
+        'mismatches': _mismatches(expected, actual),
+        'llm_calls': {'recorded': sum(len(turn['llm']) for turn in turns),
+                      'replayed': sum(len(record['llm']) for record in replayed)},
+        'ms': {'recorded': round(sum(turn['ms'] for turn in turns), 1),
+               'replayed': round(sum(record['ms'] for record in replayed), 1)},
+        'changed_replies': sum(shift_dates(turn['output'], shift) != record['output']
+                               for turn, record in zip(turns, replayed)),
+        'changed_paths': sum(turn['path'] != record['path'] for turn, record in zip(turns, replayed)),
+        'prompt_changes': llm.prompt_changes if isinstance(llm, ReplayChatModel) else None,
+        'unscripted_llm_calls': llm.unscripted if isinstance(llm, ReplayChatModel) else None,
+    })
+    return result
+
+
+def summarize(results: List[Dict[str, Any]], duration: float) -> Dict[str, Any]:
+    recorded_calls = sum(result['llm_calls']['recorded'] for result in results)
+    replayed_calls = sum(result['llm_calls']['replayed'] for result in results)
+    bookings = sum(len(result['expected']) for result in results)
+    recorded_ms = sorted(result['ms']['recorded'] for result in results)
+    replayed_ms = sorted(result['ms']['replayed'] for result in results)
+    return {
+        'conversations': len(results),
+        'duration_s': round(duration, 3),
+        'bookings_expected': bookings,
+        'correct': sum(result['correct'] for result in results),
+        'incorrect': [result['id'] for result in results if not result['correct']],
+        'errors': sum('error' in result for result in results),
+        'llm_calls': {
+            'recorded': recorded_calls,
+            'replayed': replayed_calls,
+            'change_pct': round((replayed_calls - recorded_calls) / recorded_calls * 100, 1) if recorded_calls else None,
+            'recorded_per_booking': round(recorded_calls / bookings, 3) if bookings else None,
+            'replayed_per_booking': round(replayed_calls / bookings, 3) if bookings else None,
+        },
+        'conversation_ms': {
+            'recorded_p50': percentile(recorded_ms, 50),
+            'replayed_p50': percentile(replayed_ms, 50),
+            'recorded_p95': percentile(recorded_ms, 95),
+            'replayed_p95': percentile(replayed_ms, 95),
+        },
+        'changed_replies': sum(result['changed_replies'] for result in results),
+        'changed_paths': sum(result['changed_paths'] for result in results),
+        'prompt_changes': sum(result['prompt_changes'] or 0 for result in results),
+        'unscripted_llm_calls': sum(result['unscripted_llm_calls'] or 0 for result in results),
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    summary = report['summary']
+    config = report['config']
+    print(f"{summary['conversations']} conversations replayed with {config['llm']} LLM responses on "
+          f"{config['workers']} workers in {summary['duration_s']:.2f}s")
+    print(f"\nbookings correct: {summary['correct']}/{summary['conversations']} conversations "
+          f"({summary['bookings_expected']} bookings expected, {summary['errors']} errors)")
+    calls = summary['llm_calls']
+    print(f"LLM calls: {calls['recorded']} recorded -> {calls['replayed']} replayed "
+          f"({calls['change_pct']}%), per booking {calls['recorded_per_booking']} -> {calls['replayed_per_booking']}")
+    ms = summary['conversation_ms']
+    print(f"conversation ms: p50 {ms['recorded_p50']:.1f} -> {ms['replayed_p50']:.1f}, "
+          f"p95 {ms['recorded_p95']:.1f} -> {ms['replayed_p95']:.1f}")
+    print(f"changed replies: {summary['changed_replies']}, changed answer paths: {summary['changed_paths']}, "
+          f"changed prompts: {summary['prompt_changes']}, LLM calls beyond the recording: "
+          f"{summary['unscripted_llm_calls']}")
+
+    incorrect = [result for result in report['conversations'] if not result['correct']]
+    if incorrect:
+        print(f"\n{'conversation':<32} {'calls':>9} {'mismatch'}")
+        for result in incorrect[:20]:
+            calls = f"{result['llm_calls']['recorded']}->{result['llm_calls']['replayed']}"
+            print(f"{result['id'][:32]:<32} {calls:>9} {result.get('error') or result['mismatches']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("corpus", help="JSON-lines corpus written by ConversationRecorder")
+    parser.add_argument("--llm", choices=LLM_MODES, default='recorded')
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--agent-mode", choices=['react', 'structured'],
+                        help="agent mode to replay with (default: the recorded one)")
+    parser.add_argument("--latency-scale", type=float, default=0.0,
+                        help="sleep this fraction of each recorded LLM call's time (recorded mode)")
+    parser.add_argument("--no-fast-path", action="store_true", help="send every turn to the LLM, as recorded with it off")
+    parser.add_argument("--no-date-shift", action="store_true", help="replay recorded dates unchanged")
+    parser.add_argument("--limit", type=int, help="replay only the first N conversations")
+    parser.add_argument("--output", help="write the full report as JSON to this file")
+    args = parser.parse_args()
+
+    with open(args.corpus, encoding="utf-8") as corpus:
+        conversations = load_conversations(corpus)[:args.limit]
+    if not conversations:
+        print("No conversations in the corpus")
+        sys.exit(1)
+
+    settings = {
+        'llm': args.llm,
+        'agent_mode': args.agent_mode,
+        'latency_scale': args.latency_scale,
+        'fast_path': not args.no_fast_path,
+        'date_shift': not args.no_date_shift,
+        'gemini_api_key': os.getenv("GEMINI_API_KEY") or "replay",
+    }
+    workers = max(1, min(args.workers, len(conversations)))
+    started = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(settings,)) as pool:
+        results = list(pool.map(replay_conversation, conversations, chunksize=max(1, len(conversations) // (workers * 4))))
+    duration = time.perf_counter() - started
+
+    report = {
+        'config': {**{key: value for key, value in settings.items() if key != 'gemini_api_key'},
+                   'corpus': args.corpus, 'workers': workers},
+        'summary': summarize(results, duration),
+        'conversations': results,
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w") as handle:
+            json.dump(report, handle, indent=2)
+        print(f"\nReport written to {args.output}")
+
+    if report['summary']['incorrect']:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from appointment_store import APPOINTMENT_COLUMNS
+from availability import format_time, parse_date, parse_time
+from fast_path import normalize_field
+
+
+BULK_FORMATS = ("csv", "jsonl")
+IMPORT_REQUIRED_FIELDS = ['name', 'appointment_type', 'date', 'time']
+EXPORT_COLUMNS = ['id'] + APPOINTMENT_COLUMNS
+
+_CONTENT_TYPES = {
+    'text/csv': 'csv',
+    'application/csv': 'csv',
+    'application/x-ndjson': 'jsonl',
+    'application/jsonl': 'jsonl',
+    'application/json-lines': 'jsonl',
+}
+MEDIA_TYPES = {'csv': 'text/csv; charset=utf-8', 'jsonl': 'application/x-ndjson'}
+
+
+def bulk_format(requested: Optional[str], content_type: Optional[str] = None) -> str:
+    """Bulk format from a ?format= value or the request Content-Type; CSV by default"""
+    if requested:
+        fmt = requested.strip().lower().replace("ndjson", "jsonl")
+        if fmt not in BULK_FORMATS:
+            raise ValueError(f"Unsupported format {requested!r}, expected one of {', '.join(BULK_FORMATS)}")
+        return fmt
+    media_type = (content_type or "").split(";")[0].strip().lower()
+    return _CONTENT_TYPES.get(media_type, "csv")
+
+
+def iter_records(lines: Iterable[str], fmt: str) -> Iterator[Tuple[int, Any]]:
+    """(line number, record) pairs read lazily; unreadable JSON lines yield a ValueError as the record"""
+    if fmt == "csv":
+        reader = csv.DictReader(lines)
+        for record in reader:
+            yield reader.line_num, record
+        return
+
+    for line_number, line in enumerate(lines, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError:
+            yield line_number, ValueError("Line is not valid JSON")
+
+
+def normalize_import(record: Any, created_at: Optional[str] = None) -> Dict[str, Any]:
+    """Validate one imported appointment into the shape save_appointment stores
+
+    Unlike conversational bookings, past dates are accepted, since clinics
+    import their history along with upcoming appointments. Raises ValueError.
+    """
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("Expected an object with appointment fields")
+
+    data = {key.strip().lower(): " ".join(str(value).split()) for key, value in record.items()
+            if isinstance(key, str) and value not in (None, "")}
+    missing = [field for field in IMPORT_REQUIRED_FIELDS if not data.get(field)]
+    if missing:
+        raise ValueError(f"Missing: {', '.join(missing)}")
+
+    data['date'] = parse_date(data['date']).isoformat()
+    data['time'] = format_time(parse_time(data['time']))
+    data['appointment_type'] = normalize_field('appointment_type', data['appointment_type'])
+    for field in ('email', 'phone'):
+        if data.get(field):
+            data[field] = normalize_field(field, data[field])
+
+    if data.get('duration_minutes'):
+        try:
+            duration = int(float(data['duration_minutes']))
+        except ValueError:
+            raise ValueError(f"Unrecognized duration: {data['duration_minutes']!r}")
+        if not 0 < duration <= 24 * 60:
+            raise ValueError(f"Unrecognized duration: {data['duration_minutes']!r}")
+        data['duration_minutes'] = duration
+
+    data.setdefault('created_at', created_at or datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    data['status'] = 'Confirmed'
+    return {column: data.get(column) for column in APPOINTMENT_COLUMNS}
+
+
+def iter_export(appointments: Iterable[Dict[str, Any]], fmt: str) -> Iterator[str]:
+    """Encode appointments one line at a time, CSV with a header row or JSON lines"""
+    if fmt == "jsonl":
+        for appointment in appointments:
+            yield json.dumps({column: appointment.get(column) for column in EXPORT_COLUMNS}) + "\n"
+        return
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for appointment in appointments:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerow([appointment.get(column, "") for column in EXPORT_COLUMNS])
+        yield buffer.getvalue()
+
+
+def batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch: List[Any] = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
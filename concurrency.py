@@ -0,0 +1,61 @@
+import asyncio
+from typing import Any, Dict, Optional
+
+
+class ServiceSaturated(Exception):
+    """Raised when too many turns are already waiting for an LLM slot"""
+
+
+class ConcurrencyLimiter:
+    """Caps in-flight LLM calls and bounds how many callers may queue for one
+
+    Use as `async with limiter:`. When `max_waiting` callers are already queued
+    the next one fails fast with ServiceSaturated instead of piling up, and a
+    caller that cannot get a slot within `acquire_timeout` gets
+    asyncio.TimeoutError.
+    """
+
+    def __init__(self, max_in_flight: int = 32, max_waiting: int = 256, acquire_timeout: Optional[float] = None):
+        self.max_in_flight = max_in_flight
+        self.max_waiting = max_waiting
+        self.acquire_timeout = acquire_timeout
+        self._semaphore = asyncio.Semaphore(max_in_flight)
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    async def __aenter__(self):
+        if self.waiting >= self.max_waiting:
+            self.rejected += 1
+            raise ServiceSaturated(f"{self.waiting} requests already waiting for the LLM")
+
+        self.waiting += 1
+        try:
+            if self.acquire_timeout is None or not self._semaphore.locked():
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), self.acquire_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.in_flight -= 1
+        self._semaphore.release()
+        return False
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'max_in_flight': self.max_in_flight,
+            'max_waiting': self.max_waiting,
+            'in_flight': self.in_flight,
+            'waiting': self.waiting,
+            'rejected': self.rejected,
+            'timed_out': self.timed_out
+        }
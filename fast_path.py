@@ -0,0 +1,388 @@
+import json
+import re
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from availability import format_time, parse_date, parse_date_time, parse_time
+
+
+REQUIRED_FIELDS = ['name', 'appointment_type', 'date', 'time', 'email', 'phone']
+
+APPOINTMENT_TYPES = {
+    'checkup': ['checkup', 'check-up', 'check up', 'general checkup', 'physical'],
+    'consultation': ['consultation', 'consult'],
+    'follow-up': ['follow-up', 'follow up', 'followup'],
+    'urgent': ['urgent', 'emergency'],
+    'specialist': ['specialist'],
+    'dental': ['dental', 'dentist', 'teeth cleaning'],
+    'vaccination': ['vaccination', 'vaccine', 'flu shot'],
+}
+
+QUESTIONS = {
+    'name': "👤 Could you please tell me your full name?",
+    'appointment_type': "🏥 What type of appointment would you like? (checkup, consultation, follow-up, urgent, specialist, dental)",
+    'date': "📅 What date would you like to come in?",
+    'time': "🕐 What time works best for you?",
+    'email': "📧 What email address should we send the confirmation to?",
+    'phone': "📞 What phone number can we reach you at?",
+}
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"(?<![\w/-])(?:\+?1[\s.-]?)?\(?\d{3}\)?[\s.-]?\d{3}[\s.-]?\d{4}(?![\w/-])")
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b")
+_US_DATE_RE = re.compile(r"\b(\d{1,2})/(\d{1,2})(?:/(\d{2,4}))?\b")
+_MONTHS = ['january', 'february', 'march', 'april', 'may', 'june', 'july', 'august',
+           'september', 'october', 'november', 'december']
+_MONTH_PATTERN = r"(jan|feb|mar|apr|may|jun|jul|aug|sep|sept|oct|nov|dec)[a-z]*\.?"
+_MONTH_DAY_RE = re.compile(r"\b" + _MONTH_PATTERN + r"\s+(\d{1,2})(?:st|nd|rd|th)?(?:,?\s+(\d{4}))?\b", re.IGNORECASE)
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})(?:st|nd|rd|th)?\s+(?:of\s+)?" + _MONTH_PATTERN + r"(?:,?\s+(\d{4}))?", re.IGNORECASE)
+_WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+_RELATIVE_DATE_RE = re.compile(
+    r"\b(?:(day after tomorrow)|(today)|(tomorrow)|in\s+(\d{1,2})\s+days?|(?:(next|this)\s+)?(" + "|".join(_WEEKDAYS) + r"))\b",
+    re.IGNORECASE
+)
+_TIME_RE = re.compile(r"\b(\d{1,2}(?::\d{2})?\s*[ap]\.?m\.?|\d{1,2}:\d{2})(?![\d:])", re.IGNORECASE)
+_NOON_RE = re.compile(r"\b(noon|midday)\b", re.IGNORECASE)
+_NAME_INTRO_RE = re.compile(r"\b(?:my name is|my name's|name is|i am|i'm|this is)\s+([a-z][a-z'\-]+(?:\s+[a-z][a-z'\-]+){0,3})",
+                            re.IGNORECASE)
+_BARE_NAME_RE = re.compile(r"^[a-z][a-z'\-]+(?:\s+[a-z][a-z'\-]+){0,3}$", re.IGNORECASE)
+
+_YES = {'yes', 'y', 'yeah', 'yep', 'yup', 'sure', 'ok', 'okay', 'correct', 'confirm', 'confirmed',
+        'looks good', 'sounds good', "that's right", 'that is right', 'yes please', 'perfect', 'book it'}
+_NO = {'no', 'n', 'nope', 'not quite', 'wrong', 'incorrect', 'no thanks'}
+
+# Words that carry no information once entities have been pulled out of a message
+_FILLER = {
+    'a', 'an', 'the', 'my', 'is', 'it', 'its', "it's", 'at', 'on', 'for', 'and', 'or', 'to', 'in', 'of',
+    'please', 'thanks', 'thank', 'you', 'i', "i'd", 'me', 'would', 'like', 'want', 'need', 'book', 'booking',
+    'schedule', 'appointment', 'email', 'e-mail', 'address', 'phone', 'number', 'mobile', 'cell',
+    'date', 'time', 'type', 'name', 'works', 'how', 'about', 'can', 'we', 'do', 'make', 'that', 'maybe',
+    'around', 'by', "here's", 'sure', 'ok', 'okay', 'also', 'with', 'be', 'will', 'great',
+}
+_NON_NAME_WORDS = _FILLER | set(_WEEKDAYS) | set(_MONTHS) | {
+    'hi', 'hello', 'hey', 'yes', 'no', 'today', 'tomorrow', 'next', 'this', 'looking', 'available',
+    'interested', 'calling', 'not', 'just', 'good', 'fine', 'free', 'busy', 'sick', 'here',
+    'hoping', 'trying', 'wondering', 'going', 'afraid', 'sorry', 'new', 'returning',
+} | {alias for aliases in APPOINTMENT_TYPES.values() for alias in aliases}
+
+
+class Extraction:
+    """Fields found in one message and whether anything was left unexplained"""
+
+    __slots__ = ('fields', 'confirmation', 'residue', 'errors')
+
+    def __init__(self):
+        self.fields: Dict[str, str] = {}
+        self.confirmation: Optional[bool] = None
+        self.residue: List[str] = []
+        self.errors: List[str] = []
+
+    @property
+    def resolved(self) -> bool:
+        """True when every word of the message was accounted for"""
+        return not self.residue and (bool(self.fields) or self.confirmation is not None or bool(self.errors))
+
+
+def _resolve_year(month: int, day: int, today: date) -> date:
+    candidate = date(today.year, month, day)
+    return candidate if candidate >= today else date(today.year + 1, month, day)
+
+
+def _month_number(token: str) -> int:
+    prefix = token.lower().rstrip('.')[:3]
+    return [m[:3] for m in _MONTHS].index(prefix) + 1
+
+
+class FastPathExtractor:
+    """Deterministic extraction of structured appointment details from a message"""
+
+    def extract(self, message: str, awaiting: Optional[str] = None, today: Optional[date] = None) -> Extraction:
+        today = today or date.today()
+        result = Extraction()
+        text = message.strip()
+        consumed: List[Tuple[int, int]] = []
+
+        def take(match, group: int = 0):
+            consumed.append(match.span(group))
+
+        match = _EMAIL_RE.search(text)
+        if match:
+            result.fields['email'] = match.group(0).lower()
+            take(match)
+
+        match = _PHONE_RE.search(text)
+        if match:
+            digits = re.sub(r"\D", "", match.group(0))
+            result.fields['phone'] = digits[-10:] if len(digits) == 11 and digits.startswith('1') else digits
+            take(match)
+
+        self._extract_date(text, today, result, take)
+        self._extract_time(text, result, take)
+
+        lowered = text.lower()
+        for canonical, aliases in APPOINTMENT_TYPES.items():
+            for alias in sorted(aliases, key=len, reverse=True):
+                match = re.search(r"\b" + re.escape(alias) + r"\b", lowered)
+                if match:
+                    result.fields.setdefault('appointment_type', canonical)
+                    take(match)
+                    break
+
+        match = _NAME_INTRO_RE.search(text)
+        if match:
+            # Stop at the first non-name word so "I'm John and I need..." yields just "John"
+            name_words = []
+            for word in match.group(1).split():
+                if word.lower() in _NON_NAME_WORDS:
+                    break
+                name_words.append(word)
+            if name_words:
+                result.fields['name'] = " ".join(w.capitalize() for w in name_words)
+                consumed.append((match.start(), match.start(1) + len(" ".join(name_words))))
+
+        # Blank out everything recognized and see what is left
+        chars = list(text)
+        for start, end in consumed:
+            for i in range(start, end):
+                chars[i] = ' '
+        leftover = re.findall(r"[a-z0-9'\-]+", "".join(chars).lower())
+        leftover = [w for w in leftover if w not in _FILLER and w != '-']
+
+        phrase = " ".join(re.findall(r"[a-z']+", lowered))
+        if phrase in _YES:
+            result.confirmation = True
+            leftover = []
+        elif phrase in _NO:
+            result.confirmation = False
+            leftover = []
+        elif (awaiting == 'name' and not result.fields and _BARE_NAME_RE.match(text)
+              and not any(w.lower() in _NON_NAME_WORDS for w in text.split())):
+            result.fields['name'] = " ".join(w.capitalize() for w in text.split())
+            leftover = []
+
+        result.residue = leftover
+        return result
+
+    @staticmethod
+    def _extract_date(text: str, today: date, result: Extraction, take: Callable):
+        found: Optional[date] = None
+        try:
+            match = _ISO_DATE_RE.search(text)
+            if match:
+                found = date(int(match.group(1)), int(match.group(2)), int(match.group(3)))
+                take(match)
+            elif _US_DATE_RE.search(text):
+                match = _US_DATE_RE.search(text)
+                month, day, year = int(match.group(1)), int(match.group(2)), match.group(3)
+                if year:
+                    found = date(int(year) + (2000 if len(year) == 2 else 0), month, day)
+                else:
+                    found = _resolve_year(month, day, today)
+                take(match)
+            elif _MONTH_DAY_RE.search(text):
+                match = _MONTH_DAY_RE.search(text)
+                month, day, year = _month_number(match.group(1)), int(match.group(2)), match.group(3)
+                found = date(int(year), month, day) if year else _resolve_year(month, day, today)
+                take(match)
+            elif _DAY_MONTH_RE.search(text):
+                match = _DAY_MONTH_RE.search(text)
+                day, month, year = int(match.group(1)), _month_number(match.group(2)), match.group(3)
+                found = date(int(year), month, day) if year else _resolve_year(month, day, today)
+                take(match)
+            else:
+                match = _RELATIVE_DATE_RE.search(text)
+                if match:
+                    after_tomorrow, is_today, is_tomorrow, in_days, _, weekday = match.groups()
+                    if after_tomorrow:
+                        found = today + timedelta(days=2)
+                    elif is_today:
+                        found = today
+                    elif is_tomorrow:
+                        found = today + timedelta(days=1)
+                    elif in_days:
+                        found = today + timedelta(days=int(in_days))
+                    else:
+                        # "monday" and "next monday" both mean the next one after today
+                        ahead = (_WEEKDAYS.index(weekday.lower()) - today.weekday()) % 7 or 7
+                        found = today + timedelta(days=ahead)
+                    take(match)
+        except ValueError:
+            result.errors.append("⚠️ That doesn't look like a valid date. Could you double-check it?")
+            return
+
+        if found is None:
+            return
+        if found < today:
+            result.errors.append(f"⚠️ {found.isoformat()} is in the past. Please choose an upcoming date.")
+            return
+        result.fields['date'] = found.isoformat()
+
+    @staticmethod
+    def _extract_time(text: str, result: Extraction, take: Callable):
+        match = _TIME_RE.search(text)
+        if match:
+            try:
+                result.fields['time'] = format_time(parse_time(match.group(1)))
+            except ValueError:
+                result.errors.append("⚠️ That doesn't look like a valid time. Could you use something like 2:30 PM?")
+            take(match)
+            return
+
+        match = _NOON_RE.search(text)
+        if match:
+            result.fields['time'] = "12:00"
+            take(match)
+
+
+def normalize_field(field: str, value: str, today: Optional[date] = None) -> str:
+    """Validate and normalize one field supplied by something other than the extractor
+
+    Raises ValueError with a patient-facing message when the value is unusable.
+    """
+    value = " ".join(str(value).split())
+    if field == 'date':
+        try:
+            found = parse_date(value)
+        except ValueError:
+            raise ValueError("⚠️ That doesn't look like a valid date. Could you double-check it?")
+        if found < (today or date.today()):
+            raise ValueError(f"⚠️ {found.isoformat()} is in the past. Please choose an upcoming date.")
+        return found.isoformat()
+    if field == 'time':
+        try:
+            return format_time(parse_time(value))
+        except ValueError:
+            raise ValueError("⚠️ That doesn't look like a valid time. Could you use something like 2:30 PM?")
+    if field == 'email':
+        if not _EMAIL_RE.fullmatch(value):
+            raise ValueError("⚠️ That email address doesn't look right. Could you double-check it?")
+        return value.lower()
+    if field == 'phone':
+        digits = re.sub(r"\D", "", value)
+        if len(digits) == 11 and digits.startswith('1'):
+            digits = digits[1:]
+        if not 10 <= len(digits) <= 15:
+            raise ValueError("⚠️ That phone number doesn't look right. Could you include the area code?")
+        return digits
+    if field == 'appointment_type':
+        lowered = value.lower()
+        for canonical, aliases in APPOINTMENT_TYPES.items():
+            if lowered == canonical or lowered in aliases:
+                return canonical
+        return lowered
+    return value
+
+
+def format_summary(data: Dict[str, Any]) -> str:
+    return (
+        f"👤 Name: {data.get('name')}\n"
+        f"🏥 Appointment: {data.get('appointment_type')}\n"
+        f"📅 Date: {data.get('date')}\n"
+        f"🕐 Time: {data.get('time')}\n"
+        f"📧 Email: {data.get('email')}\n"
+        f"📞 Phone: {data.get('phone')}"
+    )
+
+
+class FastPath:
+    """Answers fully structured turns from templates without calling the LLM
+
+    `state` is the per-session appointment_data dict. Collected fields are kept
+    under their own names; `_awaiting` remembers which question was asked last.
+    """
+
+    def __init__(self, check_slot: Callable[[str, str], Optional[str]], save: Callable[[str], str],
+                 extractor: Optional[FastPathExtractor] = None):
+        # check_slot returns None when free, otherwise a message describing alternatives
+        self.check_slot = check_slot
+        self.save = save
+        self.extractor = extractor or FastPathExtractor()
+
+    def handle(self, state: Dict[str, Any], message: str, today: Optional[date] = None) -> Optional[str]:
+        """Return a templated reply, or None if the LLM should take the turn"""
+        awaiting = state.get('_awaiting')
+        extraction = self.extractor.extract(message, awaiting=awaiting, today=today)
+
+        if not extraction.resolved:
+            # Only the answer to the question we asked is trusted from a message we could not
+            # fully explain ("I'm hoping..." is not a name); the LLM takes the rest of the turn
+            if awaiting in extraction.fields:
+                state[awaiting] = extraction.fields[awaiting]
+            state.pop('_awaiting', None)
+            return None
+
+        for field, value in extraction.fields.items():
+            state[field] = value
+        return self.respond(state, extraction, awaiting)
+
+    def learn(self, state: Dict[str, Any], message: str, tool_calls: Iterable[Tuple[str, Any, Any]] = (),
+              today: Optional[date] = None):
+        """Record what an LLM turn collected, so the next structured turn can be answered locally
+
+        In react mode the LLM never writes `state`, so without this a patient
+        who gave their name to the LLM would be asked for it again. Fields come
+        from the patient's message, then from the (tool, input, observation)
+        calls the LLM made: a free slot it checked sets date and time, and a
+        successful save ends the booking.
+        """
+        for field, value in self.extractor.extract(message, today=today).fields.items():
+            state[field] = value
+
+        for tool, tool_input, observation in tool_calls:
+            if not str(observation).startswith("✅"):
+                continue
+            if tool == 'save_appointment':
+                state.clear()
+            elif tool == 'check_availability':
+                try:
+                    day, start = parse_date_time(str(tool_input))
+                except ValueError:
+                    continue
+                state['date'] = day.isoformat()
+                state['time'] = format_time(start)
+
+    def respond(self, state: Dict[str, Any], extraction: Extraction, awaiting: Optional[str]) -> Optional[str]:
+        """Templated reply for fields already merged into `state`, or None if confirmation was out of turn
+
+        Shared with the structured agent mode, where the extraction comes from the LLM.
+        """
+        if extraction.errors:
+            return extraction.errors[0]
+
+        if extraction.confirmation is not None and not extraction.fields:
+            if awaiting != 'confirmation':
+                return None
+            if not extraction.confirmation:
+                state.pop('_awaiting', None)
+                return "No problem! Which detail would you like to change?"
+            return self._book(state)
+
+        if state.get('date') and state.get('time') and ('date' in extraction.fields or 'time' in extraction.fields):
+            conflict = self.check_slot(state['date'], state['time'])
+            if conflict:
+                state.pop('time', None)
+                state['_awaiting'] = 'time'
+                return conflict
+
+        return self._next_prompt(state)
+
+    def _next_prompt(self, state: Dict[str, Any]) -> str:
+        for field in REQUIRED_FIELDS:
+            if not state.get(field):
+                state['_awaiting'] = field
+                return f"Got it, thank you! {QUESTIONS[field]}"
+
+        state['_awaiting'] = 'confirmation'
+        return f"Here's a summary of your appointment:\n{format_summary(state)}\n\nShall I confirm this booking? ✅"
+
+    def _book(self, state: Dict[str, Any]) -> str:
+        appointment = {field: state[field] for field in REQUIRED_FIELDS}
+        result = self.save(json.dumps(appointment))
+        if result.startswith("✅"):
+            state.clear()
+            return f"{result}\n{format_summary(appointment)}\n\nWe look forward to seeing you! 🏥"
+
+        # Slot taken in the meantime or validation failed: let the user pick again
+        state.pop('time', None)
+        state['_awaiting'] = 'time'
+        return f"{result} {QUESTIONS['time']}"
@@ -0,0 +1,87 @@
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional, Tuple
+
+
+SUMMARY_FIELDS = [
+    ('name', 'Name'),
+    ('appointment_type', 'Type'),
+    ('date', 'Date'),
+    ('time', 'Time'),
+    ('email', 'Email'),
+    ('phone', 'Phone'),
+]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token for English text)"""
+    return (len(text) + 3) // 4
+
+
+class HistoryManager:
+    """Per-session chat history with a token budget
+
+    Keeps at most `max_turns` recent exchanges and renders only as many of them
+    as fit in `token_budget`, newest first. Older context survives as a one-line
+    summary of the appointment fields collected so far, so prompt size stays
+    flat no matter how long the conversation runs.
+    """
+
+    def __init__(self, token_budget: int = 600, max_turns: int = 8, max_message_chars: int = 600):
+        self.token_budget = token_budget
+        self.max_message_chars = max_message_chars
+        self._turns: Deque[Tuple[str, str]] = deque(maxlen=max_turns)
+        self._rendered: Optional[Tuple[str, str]] = None
+
+    def add_turn(self, user_message: str, assistant_message: str):
+        self._turns.append((user_message[:self.max_message_chars], assistant_message[:self.max_message_chars]))
+        self._rendered = None
+
+    def clear(self):
+        self._turns.clear()
+        self._rendered = None
+
+    def to_state(self) -> List[List[str]]:
+        """Recent turns as JSON-serializable [user, assistant] pairs"""
+        return [list(turn) for turn in self._turns]
+
+    def load_state(self, turns: List[List[str]]):
+        """Replace the history with turns saved by to_state"""
+        self._turns.clear()
+        self._turns.extend((str(user_message), str(assistant_message)) for user_message, assistant_message in turns)
+        self._rendered = None
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    @staticmethod
+    def summarize(appointment_data: Dict[str, Any]) -> str:
+        collected = [f"{label}={appointment_data[field]}" for field, label in SUMMARY_FIELDS if appointment_data.get(field)]
+        missing = [label for field, label in SUMMARY_FIELDS if not appointment_data.get(field)]
+        if not collected:
+            return ""
+        summary = "Collected: " + ", ".join(collected)
+        if missing:
+            summary += "; still needed: " + ", ".join(missing)
+        return summary
+
+    def render(self, appointment_data: Optional[Dict[str, Any]] = None) -> str:
+        """Summary line plus the most recent turns that fit in the token budget"""
+        summary = self.summarize(appointment_data or {})
+        # Memoized until the next turn or a change in collected fields
+        if self._rendered and self._rendered[0] == summary:
+            return self._rendered[1]
+
+        budget = self.token_budget - estimate_tokens(summary)
+        lines = []
+        for user_message, assistant_message in reversed(self._turns):
+            turn = f"User: {user_message}\nAssistant: {assistant_message}"
+            cost = estimate_tokens(turn)
+            if cost > budget:
+                break
+            lines.append(turn)
+            budget -= cost
+
+        parts = ([summary] if summary else []) + list(reversed(lines))
+        rendered = "\n".join(parts) if parts else "(new conversation)"
+        self._rendered = (summary, rendered)
+        return rendered
@@ -0,0 +1,149 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from concurrency import ServiceSaturated
+
+
+class DedupClaim:
+    """Outcome of IdempotencyCache.claim: the leader runs the turn, everyone else waits on `future`"""
+
+    __slots__ = ('key', 'future', 'leader')
+
+    def __init__(self, key: str, future: concurrent.futures.Future, leader: bool):
+        self.key = key
+        self.future = future
+        self.leader = leader
+
+    def result(self) -> str:
+        return self.future.result()
+
+    async def aresult(self) -> str:
+        # Shielded: a duplicate timing out must not cancel the first delivery's future
+        return await asyncio.shield(asyncio.wrap_future(self.future))
+
+
+class _Entry:
+    __slots__ = ('future', 'session_id', 'ttl', 'expires_at')
+
+    def __init__(self, future: concurrent.futures.Future, session_id: str, ttl: float):
+        self.future = future
+        self.session_id = session_id
+        self.ttl = ttl
+        self.expires_at: Optional[float] = None  # set when the turn finishes
+
+
+class IdempotencyCache:
+    """Bounded TTL cache of chat replies so retried webhook deliveries never run a turn twice
+
+    Chat platforms redeliver a webhook when the reply is slower than their
+    timeout. The first delivery of a message claims the lead and runs the
+    turn; a repeat that arrives while it is still running attaches to its
+    result, and one that arrives after it finished gets the stored reply.
+
+    With an explicit key (Idempotency-Key header or message_id) any repeat
+    within `ttl_seconds` is a duplicate. Matching by text is opt-in
+    (`content_ttl_seconds` > 0): the message is hashed per session and
+    counts as a duplicate while it is still the session's latest message
+    and within the window. Text alone cannot tell a retry from a patient
+    sending the same words twice (a "yes" to "is that right?" and then to
+    "shall I book it?"), so only enable it for platforms without delivery ids.
+    Failed or rejected turns are not stored, so a later retry runs again.
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_seconds: float = 600, content_ttl_seconds: float = 0,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.content_ttl_seconds = content_ttl_seconds
+        self.clock = clock
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._latest: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.attached = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(session_id: str, message: str, idempotency_key: Optional[str] = None) -> str:
+        if idempotency_key:
+            return f"key:{session_id}:{idempotency_key}"
+        text = " ".join(message.split())
+        return "text:" + hashlib.sha256(f"{session_id}\0{text}".encode("utf-8")).hexdigest()
+
+    def covers(self, idempotency_key: Optional[str]) -> bool:
+        """Whether a delivery with this key (or none) is deduplicated at all"""
+        return bool(self.ttl_seconds if idempotency_key else self.content_ttl_seconds)
+
+    def claim(self, session_id: str, message: str, idempotency_key: Optional[str] = None) -> DedupClaim:
+        key = self.make_key(session_id, message, idempotency_key)
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at is not None and entry.expires_at <= now:
+                self._drop(key)
+                entry = None
+            if entry is not None and (idempotency_key or self._latest.get(session_id) == key):
+                self._entries.move_to_end(key)
+                if entry.future.done():
+                    self.hits += 1
+                else:
+                    self.attached += 1
+                return DedupClaim(key, entry.future, leader=False)
+
+            self.misses += 1
+            future = concurrent.futures.Future()
+            if entry is not None:
+                self._drop(key)
+            self._entries[key] = _Entry(future, session_id,
+                                        self.ttl_seconds if idempotency_key else self.content_ttl_seconds)
+            self._latest[session_id] = key
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+            return DedupClaim(key, future, leader=True)
+
+    def complete(self, claim: DedupClaim, result: Optional[str], keep: bool = True):
+        """Hand the leader's reply to waiting duplicates; store it for later ones if `keep`
+
+        A None result means the turn raised (saturation, timeout, cancellation);
+        waiting duplicates then get ServiceSaturated so the platform retries.
+        """
+        if result is None:
+            claim.future.set_exception(ServiceSaturated("The first delivery of this message did not finish"))
+        else:
+            claim.future.set_result(result)
+        with self._lock:
+            entry = self._entries.get(claim.key)
+            if entry is None or entry.future is not claim.future:
+                return
+            if keep and result is not None:
+                entry.expires_at = self.clock() + entry.ttl
+            else:
+                self._drop(claim.key)
+
+    def forget_session(self, session_id: str):
+        """After a reset, repeating the last message starts a new turn"""
+        with self._lock:
+            self._latest.pop(session_id, None)
+
+    def _drop(self, key: str):
+        entry = self._entries.pop(key)
+        if self._latest.get(entry.session_id) == key:
+            del self._latest[entry.session_id]
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'entries': len(self._entries),
+            'duplicates_replayed': self.hits,
+            'duplicates_attached': self.attached,
+            'first_deliveries': self.misses,
+            'ttl_seconds': self.ttl_seconds,
+            'content_ttl_seconds': self.content_ttl_seconds
+        }
@@ -0,0 +1,146 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCTUATION_RE = re.compile(r"[\s.!?,;:]+$")
+
+
+def normalize_prompt(text: str) -> str:
+    """Collapse case, whitespace and trailing punctuation so trivial variants share an entry"""
+    text = _WHITESPACE_RE.sub(" ", text.strip().lower())
+    return _TRAILING_PUNCTUATION_RE.sub("", text)
+
+
+def prompt_fingerprint(template: str, tool_names: Iterable[str] = ()) -> str:
+    """Short hash of a prompt template and the tools it offers, for use as a cache key context"""
+    raw = "\x1f".join([template, *sorted(tool_names)])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:16]
+
+
+class ResponseCache:
+    """Two-tier LLM response cache: in-memory LRU backed by an optional SQLite file
+
+    Entries are keyed by the normalized prompt plus model, temperature and a
+    caller-supplied context (prompt template, tools, date), so a config or
+    prompt change never serves answers produced by a different setup.
+    """
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 3600, sqlite_path: Optional[str] = None,
+                 max_disk_entries: int = 100000):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.max_disk_entries = max_disk_entries
+        self.sqlite_path = sqlite_path
+
+        self._memory: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._disk_writes = 0
+        if sqlite_path:
+            self._db = sqlite3.connect(sqlite_path, check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+                "key TEXT PRIMARY KEY, response TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS idx_llm_response_cache_created ON llm_response_cache(created_at)")
+            self._db.commit()
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @staticmethod
+    def make_key(prompt: str, model: str, temperature: Optional[float], context: str = "") -> str:
+        raw = f"{model}\x1f{temperature}\x1f{context}\x1f{normalize_prompt(prompt)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                response, created_at = entry
+                if now - created_at <= self.ttl_seconds:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return response
+                del self._memory[key]
+
+        if self._db is not None:
+            with self._db_lock:
+                row = self._db.execute(
+                    "SELECT response, created_at FROM llm_response_cache WHERE key = ?", (key,)
+                ).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                # Promote to the memory tier so the next hit skips SQLite
+                self._remember(key, row[0], row[1])
+                with self._lock:
+                    self.hits += 1
+                    self.disk_hits += 1
+                return row[0]
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def set(self, key: str, response: str):
+        created_at = time.time()
+        self._remember(key, response, created_at)
+
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO llm_response_cache (key, response, created_at) VALUES (?, ?, ?)",
+                    (key, response, created_at)
+                )
+                self._disk_writes += 1
+                # Trimming is a table scan, so only do it every so often
+                if self._disk_writes % 100 == 0:
+                    self._trim_disk(created_at)
+                self._db.commit()
+
+    def _remember(self, key: str, response: str, created_at: float):
+        with self._lock:
+            self._memory[key] = (response, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    def _trim_disk(self, now: float):
+        self._db.execute("DELETE FROM llm_response_cache WHERE created_at < ?", (now - self.ttl_seconds,))
+        self._db.execute(
+            "DELETE FROM llm_response_cache WHERE key IN ("
+            "SELECT key FROM llm_response_cache ORDER BY created_at DESC LIMIT -1 OFFSET ?)",
+            (self.max_disk_entries,)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self._db is not None:
+            with self._db_lock:
+                self._db.execute("DELETE FROM llm_response_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            'memory_entries': len(self._memory),
+            'disk_enabled': self._db is not None,
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+            'evictions': self.evictions
+        }
@@ -0,0 +1,514 @@
+import asyncio
+import concurrent.futures
+import hashlib
+import heapq
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+from langchain_core.language_models.chat_models import BaseChatModel, agenerate_from_stream, generate_from_stream
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from concurrency import ServiceSaturated
+from fast_path import REQUIRED_FIELDS
+from history import estimate_tokens
+
+
+logger = logging.getLogger(__name__)
+
+# Lower runs first when calls queue for quota
+PRIORITY_BOOKING = 0
+PRIORITY_NORMAL = 1
+PRIORITY_NEW = 2
+PRIORITY_NAMES = {PRIORITY_BOOKING: "booking", PRIORITY_NORMAL: "normal", PRIORITY_NEW: "new"}
+
+# Priority of the turn being processed; set by the agent from the session's progress
+llm_priority: ContextVar[int] = ContextVar("llm_priority", default=PRIORITY_NORMAL)
+
+_RATE_LIMIT_ERRORS = {"ResourceExhausted", "TooManyRequests", "RateLimitError"}
+_TRANSIENT_ERRORS = {"ServiceUnavailable", "DeadlineExceeded", "InternalServerError", "GatewayTimeout",
+                     "ConnectionError", "TimeoutError"}
+
+
+class RateLimited(ServiceSaturated):
+    """Raised when the LLM quota stays exhausted after every retry and fallback"""
+
+
+def booking_priority(appointment_data: Dict[str, Any]) -> int:
+    """Turns about to book go first, then conversations in progress, then new ones"""
+    collected = sum(1 for field in REQUIRED_FIELDS if appointment_data.get(field))
+    if collected >= len(REQUIRED_FIELDS) - 1:
+        return PRIORITY_BOOKING
+    return PRIORITY_NORMAL if collected else PRIORITY_NEW
+
+
+def classify_error(error: BaseException) -> Optional[str]:
+    """'rate_limited' or 'transient' for errors worth retrying, otherwise None"""
+    name = type(error).__name__
+    text = str(error).lower()
+    if name in _RATE_LIMIT_ERRORS or "429" in text or "quota" in text or "rate limit" in text:
+        return "rate_limited"
+    if name in _TRANSIENT_ERRORS or "503" in text or "temporarily unavailable" in text:
+        return "transient"
+    return None
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute up to `burst`; callers hold the scheduler lock"""
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None, clock: Callable[[], float] = time.monotonic):
+        self.rate = per_minute / 60.0
+        self.capacity = burst or max(1.0, per_minute / 6)
+        self.clock = clock
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._paused_until = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until `cost` units are available (0 if they are now)"""
+        now = self.clock()
+        self._refill(now)
+        if now < self._paused_until:
+            return self._paused_until - now
+        # A call larger than the whole bucket waits for a full bucket rather than forever
+        cost = min(cost, self.capacity)
+        return 0.0 if self._tokens >= cost else (cost - self._tokens) / self.rate
+
+    def take(self, cost: float):
+        self._tokens -= min(cost, self.capacity)
+
+    def pause(self, seconds: float):
+        """Stop admitting for a while, e.g. after the server answered 429"""
+        self._paused_until = max(self._paused_until, self.clock() + seconds)
+        self._tokens = min(self._tokens, 0.0)
+
+
+class _Waiter:
+    __slots__ = ('priority', 'seq', 'cost', 'wake')
+
+    def __init__(self, priority: int, seq: int, cost: float, wake: Callable[[], None]):
+        self.priority = priority
+        self.seq = seq
+        self.cost = cost
+        self.wake = wake
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class LLMScheduler:
+    """Admission control, coalescing and retry policy for LLM calls
+
+    Calls wait in one priority queue (lowest priority value first, FIFO within
+    a priority) and are admitted while the request and token buckets allow;
+    both are sized from the Gemini quota. Identical prompts in flight at the
+    same time share one call. Rate-limit and transient errors are retried
+    with full-jitter exponential backoff, and a 429 pauses admission for
+    everyone so the queue backs off together instead of hammering the API.
+    When `fallback_queue_depth` calls are waiting, calls that are not about
+    to book go to the fallback model instead.
+
+    Works for threads and asyncio tasks alike; `sleep` and `clock` can be
+    replaced in tests.
+    """
+
+    def __init__(self, requests_per_minute: Optional[float] = None, tokens_per_minute: Optional[float] = None,
+                 max_queue: int = 256, max_retries: int = 4, backoff_base: float = 1.0, backoff_max: float = 20.0,
+                 fallback_queue_depth: Optional[int] = None,
+                 on_wait: Optional[Callable[[str, float], None]] = None,
+                 on_event: Optional[Callable[[str], None]] = None,
+                 sleep: Callable[[float], None] = time.sleep, clock: Callable[[], float] = time.monotonic):
+        self.requests = TokenBucket(requests_per_minute, clock=clock) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute, clock=clock) if tokens_per_minute else None
+        self.max_queue = max_queue
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.fallback_queue_depth = fallback_queue_depth
+        self.on_wait = on_wait
+        self.on_event = on_event
+        self.sleep = sleep
+        self.clock = clock
+
+        self._lock = threading.Lock()
+        self._waiters: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._flights: Dict[str, concurrent.futures.Future] = {}
+
+        self.counts = {event: 0 for event in ("admitted", "coalesced", "retried", "rate_limited", "fallback",
+                                              "rejected", "failed")}
+        self._wait_total = 0.0
+
+    @property
+    def waiting(self) -> int:
+        return len(self._waiters)
+
+    def record(self, event: str):
+        with self._lock:
+            self.counts[event] += 1
+        if self.on_event:
+            self.on_event(event)
+
+    # Admission
+
+    def _enqueue(self, priority: int, cost: float, wake: Callable[[], None]) -> _Waiter:
+        with self._lock:
+            if len(self._waiters) >= self.max_queue and priority > PRIORITY_BOOKING:
+                self.counts['rejected'] += 1
+                rejected = True
+            else:
+                rejected = False
+                waiter = _Waiter(priority, next(self._seq), cost, wake)
+                heapq.heappush(self._waiters, waiter)
+        if rejected:
+            if self.on_event:
+                self.on_event("rejected")
+            raise ServiceSaturated(f"{self.max_queue} LLM calls already waiting for quota")
+        return waiter
+
+    def _try_admit(self, waiter: _Waiter) -> Optional[float]:
+        """None once admitted, otherwise how long to wait before trying again"""
+        with self._lock:
+            if self._waiters[0] is not waiter:
+                # Woken by the head when it leaves; the timeout is only a safety net
+                return 1.0
+            delay = max(bucket.wait_time(cost) for bucket, cost in self._buckets(waiter.cost))
+            if delay > 0:
+                return delay
+            for bucket, cost in self._buckets(waiter.cost):
+                bucket.take(cost)
+            heapq.heappop(self._waiters)
+            self.counts['admitted'] += 1
+            head = self._waiters[0] if self._waiters else None
+        if head:
+            head.wake()
+        return None
+
+    def _buckets(self, cost: float) -> List[Tuple[TokenBucket, float]]:
+        return [(bucket, amount) for bucket, amount in ((self.requests, 1.0), (self.tokens, cost)) if bucket]
+
+    def _abandon(self, waiter: _Waiter):
+        with self._lock:
+            if waiter not in self._waiters:
+                return
+            self._waiters.remove(waiter)
+            heapq.heapify(self._waiters)
+            head = self._waiters[0] if self._waiters else None
+        if head:
+            head.wake()
+
+    def _admitted(self, priority: int, started: float):
+        waited = self.clock() - started
+        with self._lock:
+            self._wait_total += waited
+        if self.on_wait:
+            self.on_wait(PRIORITY_NAMES.get(priority, str(priority)), waited)
+
+    def acquire(self, priority: int = PRIORITY_NORMAL, cost: float = 0.0):
+        """Block until the buckets admit a call of `cost` tokens; ServiceSaturated if the queue is full"""
+        if not self.requests and not self.tokens:
+            return
+        started = self.clock()
+        event = threading.Event()
+        waiter = self._enqueue(priority, cost, event.set)
+        try:
+            while True:
+                delay = self._try_admit(waiter)
+                if delay is None:
+                    break
+                event.wait(delay)
+                event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        self._admitted(priority, started)
+
+    async def aacquire(self, priority: int = PRIORITY_NORMAL, cost: float = 0.0):
+        if not self.requests and not self.tokens:
+            return
+        started = self.clock()
+        loop = asyncio.get_running_loop()
+        event = asyncio.Event()
+        waiter = self._enqueue(priority, cost, lambda: loop.call_soon_threadsafe(event.set))
+        try:
+            while True:
+                delay = self._try_admit(waiter)
+                if delay is None:
+                    break
+                try:
+                    await asyncio.wait_for(event.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                event.clear()
+        except BaseException:
+            self._abandon(waiter)
+            raise
+        self._admitted(priority, started)
+
+    # Coalescing
+
+    def join_flight(self, key: str) -> Tuple[concurrent.futures.Future, bool]:
+        """The in-flight future for `key`, and whether the caller leads (makes the call)"""
+        with self._lock:
+            future = self._flights.get(key)
+            if future is not None:
+                self.counts['coalesced'] += 1
+                leader = False
+            else:
+                future = concurrent.futures.Future()
+                self._flights[key] = future
+                leader = True
+        if not leader and self.on_event:
+            self.on_event("coalesced")
+        return future, leader
+
+    def end_flight(self, key: str):
+        with self._lock:
+            self._flights.pop(key, None)
+
+    # Retry policy
+
+    def should_fall_back(self, priority: int) -> bool:
+        return (self.fallback_queue_depth is not None and priority > PRIORITY_BOOKING
+                and self.waiting >= self.fallback_queue_depth)
+
+    def backoff(self, attempt: int) -> float:
+        """Full-jitter exponential backoff"""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def on_failure(self, error: BaseException, attempt: int) -> Optional[float]:
+        """Seconds to wait before retrying `error`, or None if it should propagate"""
+        kind = classify_error(error)
+        if kind is None or attempt >= self.max_retries:
+            return None
+        delay = self.backoff(attempt)
+        if kind == "rate_limited":
+            self.record("rate_limited")
+            # Everyone queued behind us would hit the same 429
+            for bucket in (self.requests, self.tokens):
+                if bucket:
+                    with self._lock:
+                        bucket.pause(delay)
+        self.record("retried")
+        logger.warning(f"⚠️ LLM call failed ({type(error).__name__}: {error}), retry {attempt + 1} in {delay:.1f}s")
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        admitted = self.counts['admitted']
+        return {
+            'waiting': self.waiting,
+            'in_flight_prompts': len(self._flights),
+            'requests_per_minute': self.requests.rate * 60 if self.requests else None,
+            'tokens_per_minute': self.tokens.rate * 60 if self.tokens else None,
+            **self.counts,
+            'avg_wait_ms': round(self._wait_total / admitted * 1000, 1) if admitted else None
+        }
+
+
+class ScheduledChatModel(BaseChatModel):
+    """Chat model wrapper that sends every call through an LLMScheduler
+
+    Drop-in for the Gemini model: `primary` does the work, `fallback` (a
+    cheaper model) takes overflow when the queue is deep and calls whose
+    retries ran out on rate limits. Streaming calls are admitted and retried
+    the same way; a stream is only retried before its first chunk.
+    """
+
+    primary: BaseChatModel
+    fallback: Optional[BaseChatModel] = None
+    scheduler: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"scheduled-{self.primary._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.primary._identifying_params
+
+    def _flight_key(self, messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> str:
+        payload = json.dumps([
+            [[message.type, message.content] for message in messages],
+            stop,
+            sorted((key, repr(value)) for key, value in kwargs.items()),
+            repr(sorted(self.primary._identifying_params.items()))
+        ], default=str)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _cost(messages: List[BaseMessage]) -> float:
+        return float(sum(estimate_tokens(str(message.content)) for message in messages))
+
+    def _models(self, priority: int) -> List[BaseChatModel]:
+        """Models to try in order"""
+        if self.fallback is None:
+            return [self.primary]
+        if self.scheduler.should_fall_back(priority):
+            self.scheduler.record("fallback")
+            return [self.fallback]
+        return [self.primary, self.fallback]
+
+    def _call(self, messages: List[BaseMessage], stop: Optional[List[str]], run_manager, kwargs: Dict[str, Any],
+              stream: bool) -> Iterator[ChatGenerationChunk]:
+        """Admitted, retried call; yields chunks (one chunk when not streaming)"""
+        priority = llm_priority.get()
+        cost = self._cost(messages)
+        models = self._models(priority)
+        for index, model in enumerate(models):
+            if index:
+                self.scheduler.record("fallback")
+            attempt = 0
+            while True:
+                # Quota applies to the primary; the fallback is assumed to have room
+                if model is self.primary:
+                    self.scheduler.acquire(priority, cost)
+                streamed = False
+                try:
+                    if stream and type(model)._stream is not BaseChatModel._stream:
+                        for chunk in model._stream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                            streamed = True
+                            yield chunk
+                    else:
+                        result = model._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                        generation = result.generations[0]
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=generation.message.content),
+                                                  generation_info=result.llm_output or None)
+                    return
+                except Exception as e:
+                    delay = None if streamed else self.scheduler.on_failure(e, attempt)
+                    if delay is None:
+                        if streamed or index == len(models) - 1 or classify_error(e) != "rate_limited":
+                            self.scheduler.record("failed")
+                            if classify_error(e) == "rate_limited":
+                                raise RateLimited(f"LLM quota exhausted: {e}") from e
+                            raise
+                        break
+                    self.scheduler.sleep(delay)
+                    attempt += 1
+
+    async def _acall(self, messages: List[BaseMessage], stop: Optional[List[str]], run_manager,
+                     kwargs: Dict[str, Any], stream: bool) -> AsyncIterator[ChatGenerationChunk]:
+        """Async counterpart of _call"""
+        priority = llm_priority.get()
+        cost = self._cost(messages)
+        models = self._models(priority)
+        for index, model in enumerate(models):
+            if index:
+                self.scheduler.record("fallback")
+            attempt = 0
+            while True:
+                if model is self.primary:
+                    await self.scheduler.aacquire(priority, cost)
+                streamed = False
+                try:
+                    if stream and type(model)._astream is not BaseChatModel._astream:
+                        async for chunk in model._astream(messages, stop=stop, run_manager=run_manager, **kwargs):
+                            streamed = True
+                            yield chunk
+                    else:
+                        result = await model._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+                        generation = result.generations[0]
+                        yield ChatGenerationChunk(message=AIMessageChunk(content=generation.message.content),
+                                                  generation_info=result.llm_output or None)
+                    return
+                except Exception as e:
+                    delay = None if streamed else self.scheduler.on_failure(e, attempt)
+                    if delay is None:
+                        if streamed or index == len(models) - 1 or classify_error(e) != "rate_limited":
+                            self.scheduler.record("failed")
+                            if classify_error(e) == "rate_limited":
+                                raise RateLimited(f"LLM quota exhausted: {e}") from e
+                            raise
+                        break
+                    await asyncio.sleep(delay)
+                    attempt += 1
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs: Any) -> ChatResult:
+        key = self._flight_key(messages, stop, kwargs)
+        future, leader = self.scheduler.join_flight(key)
+        if not leader:
+            return future.result()
+        try:
+            result = generate_from_stream(self._call(messages, stop, run_manager, kwargs, stream=False))
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._end_flight(key, future)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        key = self._flight_key(messages, stop, kwargs)
+        future, leader = self.scheduler.join_flight(key)
+        if not leader:
+            # Followers get the leader's whole answer as a single chunk
+            result = future.result()
+            yield ChatGenerationChunk(message=AIMessageChunk(content=result.generations[0].message.content))
+            return
+        chunks: List[ChatGenerationChunk] = []
+        try:
+            for chunk in self._call(messages, stop, run_manager, kwargs, stream=True):
+                chunks.append(chunk)
+                yield chunk
+            future.set_result(generate_from_stream(iter(chunks)))
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._end_flight(key, future)
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs: Any) -> ChatResult:
+        key = self._flight_key(messages, stop, kwargs)
+        future, leader = self.scheduler.join_flight(key)
+        if not leader:
+            # Shielded: a follower timing out must not cancel the leader's future
+            return await asyncio.shield(asyncio.wrap_future(future))
+        try:
+            result = await agenerate_from_stream(self._acall(messages, stop, run_manager, kwargs, stream=False))
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._end_flight(key, future)
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        key = self._flight_key(messages, stop, kwargs)
+        future, leader = self.scheduler.join_flight(key)
+        if not leader:
+            result = await asyncio.shield(asyncio.wrap_future(future))
+            yield ChatGenerationChunk(message=AIMessageChunk(content=result.generations[0].message.content))
+            return
+        chunks: List[ChatGenerationChunk] = []
+        try:
+            async for chunk in self._acall(messages, stop, run_manager, kwargs, stream=True):
+                chunks.append(chunk)
+                yield chunk
+            future.set_result(generate_from_stream(iter(chunks)))
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._end_flight(key, future)
+
+    def _end_flight(self, key: str, future: concurrent.futures.Future):
+        if not future.done():
+            # The leader was cancelled or its reader stopped early; followers must not hang
+            future.set_exception(ServiceSaturated("Coalesced LLM call was abandoned"))
+        self.scheduler.end_flight(key)
@@ -0,0 +1,336 @@
+import json
+import logging
+import threading
+import time
+from bisect import bisect_left
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+from history import estimate_tokens
+
+
+logger = logging.getLogger(__name__)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+COUNT_BUCKETS = (0, 1, 2, 3, 4, 5, 6, 8, 10)
+
+# AgentExecutor runs this pseudo-tool when handle_parsing_errors catches malformed model output
+PARSE_ERROR_TOOL = "_Exception"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(str(value))}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        # Unlabeled counters report 0 before the first increment
+        self._values: Dict[Tuple[str, ...], float] = {} if self.labelnames else {(): 0.0}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str):
+        key = tuple(labels[name] for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(tuple(labels[name] for name in self.labelnames), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_labels(self.labelnames, key)} {_number(value)}" for key, value in values]
+
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and three additions under a lock"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [per-bucket counts (last is +Inf), sum, count]
+        self._values: Dict[Tuple[str, ...], List[Any]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str):
+        key = tuple(labels[name] for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, **labels: str) -> int:
+        state = self._values.get(tuple(labels[name] for name in self.labelnames))
+        return state[2] if state else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = [(key, list(state[0]), state[1], state[2]) for key, state in self._values.items()]
+        lines = []
+        for key, counts, total, count in values:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_number(bound)}"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {_number(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class GaugeCallback:
+    """Gauge whose value is read from a callback at scrape time, so the hot path pays nothing"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Optional[float]]):
+        self.name = name
+        self.documentation = documentation
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception as e:
+            logger.warning(f"⚠️ Could not read gauge {self.name}: {e}")
+            return []
+        return [] if value is None else [f"{self.name} {_number(float(value))}"]
+
+
+class MetricsRegistry:
+    """Holds metrics and renders them in the Prometheus text exposition format"""
+
+    def __init__(self, prefix: str = ""):
+        self.prefix = prefix
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"Metric {metric.name} is already registered")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(self.prefix + name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self.prefix + name, documentation, labelnames, buckets))
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], Optional[float]]) -> GaugeCallback:
+        return self._register(GaugeCallback(self.prefix + name, documentation, read))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+
+class TurnTrace(BaseCallbackHandler):
+    """Collects what one chat turn spent its time on, from agent callbacks
+
+    Passed to the agent as a callback for the turn; `path` says who answered
+    (fast_path, cache, llm or error). Runs inline because it only appends to
+    lists, so async turns do not pay for an executor hop.
+    """
+
+    run_inline = True
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.path = "llm"
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.llm_latencies: List[float] = []
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.tools: List[Tuple[str, float, bool]] = []
+        self.parse_errors = 0
+        self._llm_runs: Dict[UUID, Tuple[float, int]] = {}
+        self._tool_runs: Dict[UUID, Tuple[str, float]] = {}
+
+    # LLM calls
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        prompt = sum(estimate_tokens(str(message.content)) for batch in messages for message in batch)
+        self._llm_runs[run_id] = (time.perf_counter(), prompt)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        self._llm_runs[run_id] = (time.perf_counter(), sum(estimate_tokens(prompt) for prompt in prompts))
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        started, prompt_estimate = self._llm_runs.pop(run_id, (None, 0))
+        if started is None:
+            return
+        self.llm_latencies.append(time.perf_counter() - started)
+
+        # Prefer provider-reported usage; Gemini via langchain-google-genai 0.0.6 reports none
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        if usage.get("prompt_tokens") is not None:
+            self.prompt_tokens += usage["prompt_tokens"]
+            self.completion_tokens += usage.get("completion_tokens", 0)
+            return
+        self.prompt_tokens += prompt_estimate
+        self.completion_tokens += sum(
+            estimate_tokens(generation.text) for generations in response.generations for generation in generations
+        )
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        started, _ = self._llm_runs.pop(run_id, (None, 0))
+        if started is not None:
+            self.llm_latencies.append(time.perf_counter() - started)
+
+    # Tools
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any):
+        name = (serialized or {}).get("name", "unknown")
+        if name == PARSE_ERROR_TOOL:
+            self.parse_errors += 1
+            return
+        self._tool_runs[run_id] = (name, time.perf_counter())
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        self._finish_tool(run_id, ok=True)
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._finish_tool(run_id, ok=False)
+
+    def _finish_tool(self, run_id: UUID, ok: bool):
+        run = self._tool_runs.pop(run_id, None)
+        if run:
+            self.tools.append((run[0], time.perf_counter() - run[1], ok))
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'session_id': self.session_id,
+            'path': self.path,
+            'duration_ms': round(self.duration * 1000, 1),
+            'llm_calls': len(self.llm_latencies),
+            'llm_ms': [round(latency * 1000, 1) for latency in self.llm_latencies],
+            'prompt_tokens': self.prompt_tokens,
+            'completion_tokens': self.completion_tokens,
+            'tools': [{'name': name, 'ms': round(seconds * 1000, 1), 'ok': ok} for name, seconds, ok in self.tools],
+            'parse_errors': self.parse_errors,
+        }
+
+
+class AgentMetrics:
+    """Metrics for the appointment agent's hot path, rendered on /metrics"""
+
+    def __init__(self, registry: Optional[MetricsRegistry] = None):
+        self.registry = registry or MetricsRegistry(prefix="appointment_bot_")
+        r = self.registry
+        self.turns = r.counter("turns_total", "Chat turns by who answered them", ["path"])
+        self.turn_duration = r.histogram("turn_duration_seconds", "Wall time per chat turn", ["path"])
+        self.llm_calls_per_turn = r.histogram("llm_calls_per_turn", "LLM calls made by one agent turn",
+                                              buckets=COUNT_BUCKETS)
+        self.llm_duration = r.histogram("llm_request_duration_seconds", "Latency of a single LLM call")
+        self.prompt_tokens = r.counter("llm_prompt_tokens_total", "Prompt tokens sent to the LLM (estimated if unreported)")
+        self.completion_tokens = r.counter("llm_completion_tokens_total", "Completion tokens received from the LLM")
+        self.tool_duration = r.histogram("tool_duration_seconds", "Agent tool run time", ["tool", "outcome"])
+        self.parse_errors = r.counter("agent_parse_errors_total", "Malformed model outputs retried by the agent")
+        self.sheets_append_duration = r.histogram("sheets_append_duration_seconds",
+                                                  "Google Sheets append_rows call time", ["outcome"])
+        self.sheets_rows = r.counter("sheets_rows_written_total", "Rows appended to Google Sheets")
+        self.llm_queue_wait = r.histogram("llm_queue_wait_seconds", "Time an LLM call waited for rate-limit quota",
+                                          ["priority"])
+        self.llm_scheduler_events = r.counter("llm_scheduler_events_total",
+                                              "LLM scheduler decisions: coalesced, retried, fallback, rejected...",
+                                              ["event"])
+        self.duplicate_deliveries = r.counter("duplicate_deliveries_total",
+                                              "Retried chat deliveries answered without running the turn again",
+                                              ["outcome"])
+        self.reminders_sent = r.counter("reminders_total", "Appointment reminders handed to a sink",
+                                        ["channel", "outcome"])
+        self.reminder_batch_duration = r.histogram("reminder_batch_duration_seconds",
+                                                   "Time to deliver one batch of reminders", ["channel"])
+
+    def start_turn(self, session_id: str) -> TurnTrace:
+        return TurnTrace(session_id)
+
+    def finish_turn(self, trace: TurnTrace):
+        trace.duration = time.perf_counter() - trace.started
+        self.turns.inc(path=trace.path)
+        self.turn_duration.observe(trace.duration, path=trace.path)
+
+        if trace.path == "llm":
+            self.llm_calls_per_turn.observe(len(trace.llm_latencies))
+        for latency in trace.llm_latencies:
+            self.llm_duration.observe(latency)
+        if trace.prompt_tokens:
+            self.prompt_tokens.inc(trace.prompt_tokens)
+            self.completion_tokens.inc(trace.completion_tokens)
+        for name, seconds, ok in trace.tools:
+            self.tool_duration.observe(seconds, tool=name, outcome="ok" if ok else "error")
+        if trace.parse_errors:
+            self.parse_errors.inc(trace.parse_errors)
+
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(f"📊 Turn trace {json.dumps(trace.as_dict())}")
+
+    def observe_sheets_append(self, rows: int, seconds: float, ok: bool):
+        self.sheets_append_duration.observe(seconds, outcome="ok" if ok else "error")
+        if ok:
+            self.sheets_rows.inc(rows)
+
+    def observe_llm_wait(self, priority: str, seconds: float):
+        self.llm_queue_wait.observe(seconds, priority=priority)
+
+    def count_llm_event(self, event: str):
+        self.llm_scheduler_events.inc(event=event)
+
+    def count_duplicate(self, outcome: str):
+        self.duplicate_deliveries.inc(outcome=outcome)
+
+    def observe_reminder_batch(self, channel: str, sent: int, failed: int, seconds: float):
+        self.reminder_batch_duration.observe(seconds, channel=channel)
+        if sent:
+            self.reminders_sent.inc(sent, channel=channel, outcome="sent")
+        if failed:
+            self.reminders_sent.inc(failed, channel=channel, outcome="failed")
+
+    def gauge(self, name: str, documentation: str, read: Callable[[], Optional[float]]):
+        self.registry.gauge(name, documentation, read)
+
+    def render(self) -> str:
+        return self.registry.render()
@@ -0,0 +1,205 @@
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+import zlib
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+
+
+logger = logging.getLogger(__name__)
+
+RECORD_VERSION = 1
+# Fields a replay must book identically for a conversation to count as correct
+BOOKED_FIELDS = ('name', 'appointment_type', 'date', 'time', 'email', 'phone')
+
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+
+
+def prompt_digest(messages: Iterable[Any]) -> str:
+    """Short fingerprint of a rendered prompt; replays compare it to spot prompt changes"""
+    text = "\n".join(f"{message.type}:{message.content}" for message in messages)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
+
+
+class TurnRecording(BaseCallbackHandler):
+    """Collects the LLM responses and tool calls of one turn from agent callbacks
+
+    Like TurnTrace it runs inline and only appends to lists.
+    """
+
+    run_inline = True
+
+    def __init__(self, session_id: str, user_message: str, agent_mode: str):
+        self.session_id = session_id
+        self.user_message = user_message
+        self.agent_mode = agent_mode
+        self.at = datetime.now()
+        self.llm: List[Dict[str, Any]] = []
+        self.tools: List[Dict[str, str]] = []
+        self._llm_runs: Dict[UUID, Tuple[float, str]] = {}
+        self._tool_runs: Dict[UUID, Tuple[str, str]] = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._llm_runs[run_id] = (time.perf_counter(), prompt_digest(messages[0]) if messages else "")
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        started, digest = self._llm_runs.pop(run_id, (None, ""))
+        if started is None:
+            return
+        text = response.generations[0][0].text if response.generations and response.generations[0] else ""
+        self.llm.append({'text': text, 'ms': round((time.perf_counter() - started) * 1000, 1), 'prompt': digest})
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        self._llm_runs.pop(run_id, None)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, *, run_id: UUID, **kwargs: Any):
+        self._tool_runs[run_id] = ((serialized or {}).get("name", "unknown"), input_str)
+
+    def on_tool_end(self, output: Any, *, run_id: UUID, **kwargs: Any):
+        name, tool_input = self._tool_runs.pop(run_id, (None, ""))
+        if name:
+            self.tools.append({'name': name, 'input': tool_input, 'output': str(output)})
+
+    def on_tool_error(self, error: BaseException, *, run_id: UUID, **kwargs: Any):
+        name, tool_input = self._tool_runs.pop(run_id, (None, ""))
+        if name:
+            self.tools.append({'name': name, 'input': tool_input, 'error': str(error)})
+
+
+class ConversationRecorder:
+    """Captures chat turns as a JSON-lines corpus for replay (see benchmarks/replay.py)
+
+    One line per turn: the patient's message, the reply, who answered, wall
+    time, every LLM response (with a fingerprint of its prompt rather than the
+    prompt itself) and tool call, plus any appointment booked during the turn.
+    A reset writes a marker so a reused session id starts a new conversation.
+    `sample_rate` picks whole sessions by a hash of their id, so every process
+    records the same conversations. Records go to `path` and/or `on_record`.
+
+    The corpus holds patient names, emails and phones; store it accordingly.
+    """
+
+    def __init__(self, path: Optional[str] = None, sample_rate: float = 1.0,
+                 on_record: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.on_record = on_record
+        self._file = open(path, "a", encoding="utf-8") if path else None
+        self._lock = threading.Lock()
+        self._booked: Dict[str, List[Dict[str, Any]]] = {}
+        self.turns = 0
+
+    def records(self, session_id: str) -> bool:
+        if self.sample_rate >= 1:
+            return True
+        return zlib.crc32(session_id.encode("utf-8")) % 10000 < self.sample_rate * 10000
+
+    def start_turn(self, session_id: str, user_message: str, agent_mode: str) -> Optional[TurnRecording]:
+        """Callback handler for this turn, or None if the session is not sampled"""
+        if not self.records(session_id):
+            return None
+        return TurnRecording(session_id, user_message, agent_mode)
+
+    def booked(self, session_id: Optional[str], appointment: Dict[str, Any]):
+        """Note an appointment saved during the session's current turn"""
+        if session_id is None or not self.records(session_id):
+            return
+        fields = {field: appointment.get(field) for field in BOOKED_FIELDS + ('provider',)}
+        with self._lock:
+            self._booked.setdefault(session_id, []).append(fields)
+
+    def finish_turn(self, recording: TurnRecording, output: Optional[str], path: str, seconds: float):
+        with self._lock:
+            booked = self._booked.pop(recording.session_id, [])
+        self._write({
+            'v': RECORD_VERSION,
+            'session': recording.session_id,
+            'at': recording.at.isoformat(timespec="seconds"),
+            'mode': recording.agent_mode,
+            'input': recording.user_message,
+            'output': output,
+            'path': path,
+            'ms': round(seconds * 1000, 1),
+            'llm': recording.llm,
+            'tools': recording.tools,
+            'booked': booked
+        })
+
+    def reset(self, session_id: str):
+        if self.records(session_id):
+            self._write({'v': RECORD_VERSION, 'session': session_id, 'reset': True})
+
+    def _write(self, record: Dict[str, Any]):
+        with self._lock:
+            if not record.get('reset'):
+                self.turns += 1
+            if self._file:
+                try:
+                    self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    self._file.flush()
+                except OSError as e:
+                    logger.error(f"❌ Could not write conversation record: {e}")
+        if self.on_record:
+            self.on_record(record)
+
+    def close(self):
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+
+
+def load_conversations(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """Group a recorded corpus into conversations: {'id', 'session', 'turns'}, in order of their first turn
+
+    A conversation ends at its session's reset marker; one still open at the
+    end of the corpus is included as is.
+    """
+    open_conversations: Dict[str, Dict[str, Any]] = {}
+    order: List[Dict[str, Any]] = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        session = record['session']
+        if record.get('reset'):
+            open_conversations.pop(session, None)
+            continue
+        conversation = open_conversations.get(session)
+        if conversation is None:
+            conversation = open_conversations[session] = {
+                'id': f"{session}#{len(order)}", 'session': session, 'turns': []
+            }
+            order.append(conversation)
+        conversation['turns'].append(record)
+    return order
+
+
+def date_shift(recorded_on: date, today: Optional[date] = None) -> int:
+    """Whole weeks that move a recorded conversation's dates to today or later
+
+    Weeks keep weekdays (and so opening hours and "next Monday") intact.
+    """
+    behind = ((today or date.today()) - recorded_on).days
+    return 7 * -(-behind // 7) if behind > 0 else 0
+
+
+def shift_dates(text: Optional[str], days: int) -> Optional[str]:
+    """Move every YYYY-MM-DD date in `text` by `days`"""
+    if not text or not days:
+        return text
+
+    def shift(match: "re.Match") -> str:
+        try:
+            return (date.fromisoformat(match.group(0)) + timedelta(days=days)).isoformat()
+        except ValueError:
+            return match.group(0)
+
+    return _ISO_DATE_RE.sub(shift, text)
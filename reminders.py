@@ -0,0 +1,594 @@
+import heapq
+import json
+import logging
+import smtplib
+import sqlite3
+import threading
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from email.message import EmailMessage
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from availability import parse_time
+
+
+logger = logging.getLogger(__name__)
+
+# Minutes before the appointment: the day before and two hours before
+DEFAULT_OFFSETS_MINUTES = (1440, 120)
+# Appointment field holding each channel's recipient
+CHANNEL_FIELDS = {'email': 'email', 'sms': 'phone'}
+DETAIL_FIELDS = ('name', 'appointment_type', 'date', 'time', 'provider')
+# Longest the dispatcher sleeps without re-reading the clock, so wall-clock changes are noticed
+MAX_SLEEP_SECONDS = 300.0
+
+
+def appointment_key(appointment: Dict[str, Any]) -> str:
+    """Same identity as the store's unique slot index: provider, date and time"""
+    return f"{appointment.get('provider') or ''}|{appointment['date']}|{appointment['time']}"
+
+
+def appointment_start(appointment: Dict[str, Any]) -> datetime:
+    day = date.fromisoformat(str(appointment['date']))
+    return datetime.combine(day, datetime.min.time()) + timedelta(minutes=parse_time(str(appointment['time'])))
+
+
+class Reminder:
+    """One notification for one appointment on one channel, due at `due_at` (epoch seconds)"""
+
+    __slots__ = ('id', 'appointment_key', 'channel', 'recipient', 'due_at', 'starts_at', 'offset_minutes',
+                 'details', 'attempts')
+
+    def __init__(self, id: str, appointment_key: str, channel: str, recipient: str, due_at: float,
+                 starts_at: float, offset_minutes: float, details: Dict[str, Any], attempts: int = 0):
+        self.id = id
+        self.appointment_key = appointment_key
+        self.channel = channel
+        self.recipient = recipient
+        self.due_at = due_at
+        self.starts_at = starts_at
+        self.offset_minutes = offset_minutes
+        self.details = details
+        self.attempts = attempts
+
+    def subject(self) -> str:
+        return (f"Reminder: {self.details.get('appointment_type')} appointment on "
+                f"{self.details.get('date')} at {self.details.get('time')}")
+
+    def text(self) -> str:
+        if self.channel == 'sms':
+            return f"{self.subject()}. Contact us if you need to reschedule."
+        return (f"Hi {self.details.get('name') or 'there'},\n\n"
+                f"This is a reminder of your {self.details.get('appointment_type')} appointment on "
+                f"{self.details.get('date')} at {self.details.get('time')}.\n"
+                f"If you can no longer make it, please contact us to reschedule.\n")
+
+    def as_message(self) -> Dict[str, Any]:
+        return {
+            'id': self.id,
+            'channel': self.channel,
+            'to': self.recipient,
+            'subject': self.subject(),
+            'text': self.text(),
+            'due_at': datetime.fromtimestamp(self.due_at).isoformat(timespec="seconds"),
+            'attempt': self.attempts + 1
+        }
+
+
+# Delivery
+
+class NotificationSink(ABC):
+    """Delivers batches of reminders on one channel ('email' or 'sms')"""
+
+    channel = 'email'
+
+    @abstractmethod
+    def send(self, reminders: List[Reminder]) -> List[Reminder]:
+        """Deliver a batch; returns the reminders that failed on their own, raises if the whole batch failed"""
+
+    def close(self):
+        pass
+
+
+class FileSink(NotificationSink):
+    """Appends every notification to a JSON-lines file instead of sending it, for tests and staging"""
+
+    def __init__(self, path: str, channel: str = 'email'):
+        self.path = path
+        self.channel = channel
+        self._lock = threading.Lock()
+
+    def send(self, reminders: List[Reminder]) -> List[Reminder]:
+        lines = "".join(json.dumps(reminder.as_message(), ensure_ascii=False) + "\n" for reminder in reminders)
+        with self._lock, open(self.path, "a", encoding="utf-8") as outbox:
+            outbox.write(lines)
+        return []
+
+
+class SMTPEmailSink(NotificationSink):
+    """Sends email reminders over one SMTP connection per batch
+
+    Tests can point it at a local stand-in server, e.g. benchmarks/fakes.py's
+    FakeSMTPServer or `python -m aiosmtpd -n -l localhost:1025`.
+    """
+
+    channel = 'email'
+
+    def __init__(self, host: str = "localhost", port: int = 25, sender: str = "appointments@localhost",
+                 username: Optional[str] = None, password: Optional[str] = None, starttls: bool = False,
+                 timeout: float = 10.0):
+        self.host = host
+        self.port = port
+        self.sender = sender
+        self.username = username
+        self.password = password
+        self.starttls = starttls
+        self.timeout = timeout
+
+    def send(self, reminders: List[Reminder]) -> List[Reminder]:
+        failed = []
+        with smtplib.SMTP(self.host, self.port, timeout=self.timeout) as smtp:
+            if self.starttls:
+                smtp.starttls()
+            if self.username:
+                smtp.login(self.username, self.password or "")
+            for reminder in reminders:
+                try:
+                    message = EmailMessage()
+                    message['From'] = self.sender
+                    message['To'] = reminder.recipient
+                    message['Subject'] = reminder.subject()
+                    message.set_content(reminder.text())
+                    smtp.send_message(message)
+                except (smtplib.SMTPRecipientsRefused, smtplib.SMTPDataError, ValueError) as e:
+                    logger.warning(f"⚠️ Reminder email to {reminder.recipient} refused: {e}")
+                    failed.append(reminder)
+        return failed
+
+
+class WebhookSMSSink(NotificationSink):
+    """Posts SMS reminders to an HTTP gateway, one JSON request per batch
+
+    The body is {"messages": [{"id", "to", "text"}]}. Any 2xx response means
+    every message was accepted, except the ids it lists as {"failed": [...]}.
+    """
+
+    channel = 'sms'
+
+    def __init__(self, url: str, token: Optional[str] = None, timeout: float = 10.0):
+        self.url = url
+        self.token = token
+        self.timeout = timeout
+
+    def send(self, reminders: List[Reminder]) -> List[Reminder]:
+        body = json.dumps({'messages': [{'id': reminder.id, 'to': reminder.recipient, 'text': reminder.text()}
+                                        for reminder in reminders]}).encode("utf-8")
+        headers = {'Content-Type': 'application/json'}
+        if self.token:
+            headers['Authorization'] = f"Bearer {self.token}"
+        request = urllib.request.Request(self.url, data=body, headers=headers, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = response.read()
+
+        try:
+            failed_ids = set(json.loads(payload).get('failed') or []) if payload else set()
+        except (ValueError, AttributeError, TypeError):
+            failed_ids = set()
+        return [reminder for reminder in reminders if reminder.id in failed_ids]
+
+
+# Persistence
+
+class ReminderStore(ABC):
+    """Durable copy of scheduled reminders so a restart neither loses nor repeats them"""
+
+    @abstractmethod
+    def add_many(self, reminders: List[Reminder]) -> List[Reminder]:
+        """Persist new reminders; returns the ones not stored before (in any status)"""
+
+    @abstractmethod
+    def pending(self) -> Iterator[Reminder]:
+        """Every reminder still waiting to be sent, in no particular order"""
+
+    @abstractmethod
+    def finish(self, ids: List[str], status: str):
+        """Mark reminders 'sent', 'failed' or 'expired'"""
+
+    @abstractmethod
+    def reschedule(self, reminders: List[Reminder]):
+        """Store the new due time and attempt count of reminders being retried"""
+
+    def close(self):
+        pass
+
+
+class SQLiteReminderStore(ReminderStore):
+    """Reminders table in WAL mode; only pending rows are read back, once, at startup"""
+
+    COLUMNS = ['id', 'appointment_key', 'channel', 'recipient', 'due_at', 'starts_at', 'offset_minutes',
+               'details', 'attempts']
+
+    def __init__(self, path: str = "reminders.db"):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA busy_timeout=5000")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS reminders (
+                    id TEXT PRIMARY KEY,
+                    appointment_key TEXT NOT NULL,
+                    channel TEXT NOT NULL,
+                    recipient TEXT NOT NULL,
+                    due_at REAL NOT NULL,
+                    starts_at REAL NOT NULL,
+                    offset_minutes REAL NOT NULL,
+                    details TEXT NOT NULL,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    updated_at REAL
+                );
+                CREATE INDEX IF NOT EXISTS idx_reminders_pending ON reminders(due_at) WHERE status = 'pending';
+            """)
+
+    def add_many(self, reminders: List[Reminder], chunk_size: int = 500) -> List[Reminder]:
+        insert = (f"INSERT OR IGNORE INTO reminders ({', '.join(self.COLUMNS)}, updated_at) "
+                  f"VALUES ({', '.join('?' for _ in self.COLUMNS)}, ?)")
+        now = time.time()
+        added = []
+        with self._lock:
+            # One transaction for the whole batch, e.g. a bulk import
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                for start in range(0, len(reminders), chunk_size):
+                    chunk = reminders[start:start + chunk_size]
+                    known = {row[0] for row in self._conn.execute(
+                        f"SELECT id FROM reminders WHERE id IN ({', '.join('?' for _ in chunk)})",
+                        [reminder.id for reminder in chunk]
+                    )}
+                    fresh = [reminder for reminder in chunk if reminder.id not in known]
+                    self._conn.executemany(insert, [
+                        (r.id, r.appointment_key, r.channel, r.recipient, r.due_at, r.starts_at, r.offset_minutes,
+                         json.dumps(r.details, ensure_ascii=False), r.attempts, now) for r in fresh
+                    ])
+                    added.extend(fresh)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return added
+
+    def pending(self, batch_size: int = 5000) -> Iterator[Reminder]:
+        # Own connection on a read-only pass, like SQLiteAppointmentStore.iter_slots
+        conn = sqlite3.connect(self.path)
+        try:
+            cursor = conn.execute(f"SELECT {', '.join(self.COLUMNS)} FROM reminders WHERE status = 'pending'")
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                for row in rows:
+                    yield Reminder(row[0], row[1], row[2], row[3], row[4], row[5], row[6], json.loads(row[7]), row[8])
+        finally:
+            conn.close()
+
+    def finish(self, ids: List[str], status: str):
+        if not ids:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE reminders SET status = ?, updated_at = ? WHERE id = ?",
+                                   [(status, now, reminder_id) for reminder_id in ids])
+
+    def reschedule(self, reminders: List[Reminder]):
+        if not reminders:
+            return
+        now = time.time()
+        with self._lock:
+            self._conn.executemany("UPDATE reminders SET due_at = ?, attempts = ?, updated_at = ? WHERE id = ?",
+                                   [(r.due_at, r.attempts, now, r.id) for r in reminders])
+
+    def count(self, status: str = 'pending') -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM reminders WHERE status = ?", (status,)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+# Scheduling
+
+class ReminderScheduler:
+    """Sends appointment reminders at fixed offsets before each confirmed appointment
+
+    Pending reminders sit in a heap ordered by due time, so scheduling is
+    O(log n) and the dispatcher thread only ever looks at the head: it sleeps
+    until the earliest reminder is due (or an earlier one is scheduled), pops
+    up to `batch_size` due reminders and hands them, grouped by channel, to
+    the matching sink on a pool of `max_concurrency` threads. When every
+    thread is busy the dispatcher waits, so a slow mail server holds
+    reminders in the heap rather than in memory queues.
+
+    A failed send is retried with exponential backoff from `retry_delay`
+    up to `max_attempts`; reminders whose appointment has already started
+    are dropped as expired. With a `store`, reminders are persisted when
+    scheduled and marked when finished; pending ones are read back once on
+    start. Delivery is at least once: a reminder in flight during a crash
+    is sent again after the restart. Offsets already past when an
+    appointment is booked are skipped, and so are channels without a sink.
+    `on_dispatch(channel, sent, failed, seconds)` is called after every batch.
+    """
+
+    def __init__(self, sinks: Iterable[NotificationSink], store: Optional[ReminderStore] = None,
+                 offsets_minutes: Sequence[float] = DEFAULT_OFFSETS_MINUTES, batch_size: int = 100,
+                 max_concurrency: int = 4, max_attempts: int = 5, retry_delay: float = 60.0,
+                 on_dispatch: Optional[Callable[[str, int, int, float], None]] = None,
+                 clock: Callable[[], float] = time.time):
+        self.sinks = {sink.channel: sink for sink in sinks}
+        self.store = store
+        self.offsets_minutes = sorted(offsets_minutes, reverse=True)
+        self.batch_size = batch_size
+        self.max_concurrency = max_concurrency
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.on_dispatch = on_dispatch
+        self.clock = clock
+
+        # (due_at, id); entries whose reminder was sent or rescheduled are skipped when popped
+        self._heap: List[Tuple[float, str]] = []
+        self._pending: Dict[str, Reminder] = {}
+        self._cond = threading.Condition()
+        self._slots = threading.Semaphore(max_concurrency)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+        self.in_flight = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        self.expired = 0
+        self.batches = 0
+        self.last_error: Optional[str] = None
+
+    # Lifecycle
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="reminder-sink")
+        self._thread = threading.Thread(target=self._run, name="reminder-dispatcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10.0):
+        """Finish the batches in flight; pending reminders stay in the store for the next start"""
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread:
+            self._thread.join(timeout)
+        if self._executor:
+            self._executor.shutdown(wait=True)
+        for sink in self.sinks.values():
+            sink.close()
+        if self.store:
+            self.store.close()
+
+    # Producer side
+
+    def reminders_for(self, appointment: Dict[str, Any], now: Optional[float] = None) -> List[Reminder]:
+        """Reminders still ahead for a confirmed appointment, one per offset and channel with a sink"""
+        if (appointment.get('status') or 'Confirmed') != 'Confirmed':
+            return []
+        try:
+            starts_at = appointment_start(appointment).timestamp()
+        except (KeyError, ValueError):
+            return []
+        now = self.clock() if now is None else now
+        key = appointment_key(appointment)
+        details = {field: appointment.get(field) for field in DETAIL_FIELDS}
+
+        reminders = []
+        for minutes in self.offsets_minutes:
+            due_at = starts_at - minutes * 60
+            if due_at <= now:
+                continue
+            for channel, field in CHANNEL_FIELDS.items():
+                recipient = appointment.get(field)
+                if recipient and channel in self.sinks:
+                    reminders.append(Reminder(f"{key}|{minutes:g}|{channel}", key, channel, str(recipient),
+                                              due_at, starts_at, minutes, details))
+        return reminders
+
+    def schedule(self, appointment: Dict[str, Any]) -> int:
+        return self.schedule_many([appointment])
+
+    def schedule_many(self, appointments: Iterable[Dict[str, Any]]) -> int:
+        """Schedule reminders for saved appointments; returns how many were new
+
+        Scheduling the same appointment again is a no-op, so replays and
+        re-imports never send twice. Never raises for a persistence error:
+        the booking already succeeded, so the reminder is kept in memory.
+        """
+        now = self.clock()
+        reminders = [reminder for appointment in appointments for reminder in self.reminders_for(appointment, now)]
+        if not reminders:
+            return 0
+        if self.store:
+            try:
+                reminders = self.store.add_many(reminders)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"❌ Could not persist {len(reminders)} reminders, keeping them in memory only: {e}")
+        return self._push(reminders)
+
+    def _push(self, reminders: List[Reminder]) -> int:
+        with self._cond:
+            head = self._heap[0][0] if self._heap else None
+            added = 0
+            for reminder in reminders:
+                if reminder.id in self._pending:
+                    continue
+                self._pending[reminder.id] = reminder
+                heapq.heappush(self._heap, (reminder.due_at, reminder.id))
+                added += 1
+            # Only an earlier head changes how long the dispatcher should sleep
+            if added and (head is None or self._heap[0][0] < head):
+                self._cond.notify()
+        return added
+
+    # Dispatcher
+
+    def _load(self):
+        loaded = []
+        try:
+            loaded = list(self.store.pending())
+        except Exception as e:
+            self.last_error = str(e)
+            logger.error(f"❌ Could not load pending reminders: {e}")
+        with self._cond:
+            for reminder in loaded:
+                if reminder.id not in self._pending:
+                    self._pending[reminder.id] = reminder
+                    self._heap.append((reminder.due_at, reminder.id))
+            heapq.heapify(self._heap)
+        if loaded:
+            logger.info(f"🔁 Loaded {len(loaded)} pending reminders")
+
+    def _run(self):
+        if self.store:
+            self._load()
+        while True:
+            with self._cond:
+                due = self._wait_for_due()
+            if due is None:
+                return
+            batches, expired = due
+            if expired:
+                with self._cond:
+                    self.expired += len(expired)
+                self._finish([reminder.id for reminder in expired], 'expired')
+            for channel, reminders in batches.items():
+                # Blocks while max_concurrency batches are already being delivered
+                self._slots.acquire()
+                with self._cond:
+                    self.in_flight += 1
+                self._executor.submit(self._deliver, channel, reminders)
+
+    def _wait_for_due(self) -> Optional[Tuple[Dict[str, List[Reminder]], List[Reminder]]]:
+        """Sleep until reminders are due, then pop up to batch_size of them; None on stop"""
+        while not self._stopping:
+            now = self.clock()
+            if self._heap and self._heap[0][0] <= now:
+                batches: Dict[str, List[Reminder]] = {}
+                expired = []
+                taken = 0
+                while self._heap and self._heap[0][0] <= now and taken < self.batch_size:
+                    due_at, reminder_id = heapq.heappop(self._heap)
+                    reminder = self._pending.get(reminder_id)
+                    if reminder is None or reminder.due_at != due_at:
+                        continue
+                    del self._pending[reminder_id]
+                    taken += 1
+                    if reminder.starts_at <= now:
+                        expired.append(reminder)
+                    else:
+                        batches.setdefault(reminder.channel, []).append(reminder)
+                if taken:
+                    return batches, expired
+                continue
+            timeout = min(self._heap[0][0] - now, MAX_SLEEP_SECONDS) if self._heap else MAX_SLEEP_SECONDS
+            self._cond.wait(timeout)
+        return None
+
+    def _deliver(self, channel: str, reminders: List[Reminder]):
+        started = time.perf_counter()
+        try:
+            try:
+                failed = self.sinks[channel].send(reminders)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.warning(f"⚠️ {channel} reminder batch of {len(reminders)} failed: {e}")
+                failed = reminders
+            seconds = time.perf_counter() - started
+            failed_ids = {reminder.id for reminder in failed}
+            sent = [reminder.id for reminder in reminders if reminder.id not in failed_ids]
+            self._finish(sent, 'sent')
+            self._retry(failed)
+            with self._cond:
+                self.sent += len(sent)
+                self.batches += 1
+            if self.on_dispatch:
+                self.on_dispatch(channel, len(sent), len(failed), seconds)
+        except Exception as e:
+            logger.error(f"❌ Reminder dispatch error: {e}")
+        finally:
+            with self._cond:
+                self.in_flight -= 1
+            self._slots.release()
+
+    def _retry(self, failed: List[Reminder]):
+        if not failed:
+            return
+        now = self.clock()
+        retry, given_up = [], []
+        for reminder in failed:
+            reminder.attempts += 1
+            reminder.due_at = now + self.retry_delay * 2 ** (reminder.attempts - 1)
+            if reminder.attempts >= self.max_attempts or reminder.due_at >= reminder.starts_at:
+                given_up.append(reminder)
+            else:
+                retry.append(reminder)
+        with self._cond:
+            self.retried += len(retry)
+            self.failed += len(given_up)
+        if self.store:
+            try:
+                self.store.reschedule(failed)
+            except Exception as e:
+                logger.error(f"❌ Could not persist reminder retries: {e}")
+        if given_up:
+            logger.error(f"❌ Giving up on {len(given_up)} reminders after {given_up[0].attempts} attempts")
+            self._finish([reminder.id for reminder in given_up], 'failed')
+        if retry:
+            self._push(retry)
+
+    def _finish(self, ids: List[str], status: str):
+        if self.store and ids:
+            try:
+                self.store.finish(ids, status)
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"❌ Could not mark {len(ids)} reminders {status}: {e}")
+
+    # Introspection
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            next_due = self._heap[0][0] if self._heap else None
+            return {
+                'pending': len(self._pending),
+                'next_due': datetime.fromtimestamp(next_due).isoformat(timespec="seconds") if next_due else None,
+                'in_flight_batches': self.in_flight,
+                'sent': self.sent,
+                'retried': self.retried,
+                'failed': self.failed,
+                'expired': self.expired,
+                'batches': self.batches,
+                'channels': sorted(self.sinks),
+                'offsets_minutes': self.offsets_minutes,
+                'max_concurrency': self.max_concurrency,
+                'last_error': self.last_error
+            }
@@ -0,0 +1,428 @@
+import json
+import threading
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from availability import DEFAULT_DURATION_MINUTES, AvailabilityIndex, SlotUnavailable, format_time, parse_date, parse_time
+from fast_path import normalize_field
+
+
+WEEKDAYS = ("mon", "tue", "wed", "thu", "fri", "sat", "sun")
+MINUTES_PER_DAY = 24 * 60
+
+
+def _normalize_type(appointment_type: Optional[str]) -> Optional[str]:
+    return normalize_field('appointment_type', appointment_type) if appointment_type else None
+
+
+def _parse_period(value: Any) -> Tuple[int, int]:
+    """'09:00-12:30' (or ['09:00', '12:30']) as minutes after midnight"""
+    start, end = value.split("-", 1) if isinstance(value, str) else value
+    start, end = parse_time(str(start)), parse_time(str(end))
+    if end <= start:
+        raise ValueError(f"Working period ends before it starts: {value!r}")
+    return start, end
+
+
+def _format_periods(periods: Iterable[Tuple[int, int]]) -> str:
+    return ", ".join(f"{format_time(start)}-{format_time(end)}" for start, end in periods)
+
+
+class Provider:
+    """One bookable calendar (a clinician or a room) with its own hours and closures"""
+
+    __slots__ = ('id', 'name', 'appointment_types', 'hours', 'blackout_dates')
+
+    def __init__(self, id: str, name: Optional[str] = None, appointment_types: Iterable[str] = (),
+                 hours: Optional[Dict[int, List[Tuple[int, int]]]] = None, blackout_dates: Iterable[date] = ()):
+        self.id = id
+        self.name = name or id
+        # Empty means every appointment type
+        self.appointment_types = frozenset(_normalize_type(t) for t in appointment_types)
+        # weekday (0 = Monday) -> sorted working periods in minutes after midnight
+        self.hours = hours or {}
+        self.blackout_dates = frozenset(blackout_dates)
+
+    def offers(self, appointment_type: Optional[str]) -> bool:
+        return not self.appointment_types or appointment_type is None or appointment_type in self.appointment_types
+
+    def periods(self, day: date) -> List[Tuple[int, int]]:
+        if day in self.blackout_dates:
+            return []
+        return self.hours.get(day.weekday(), [])
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Provider":
+        hours: Dict[int, List[Tuple[int, int]]] = {}
+        for weekday, periods in (data.get('hours') or {}).items():
+            key = str(weekday).strip().lower()[:3]
+            if key not in WEEKDAYS:
+                raise ValueError(f"Unknown weekday {weekday!r}")
+            if isinstance(periods, str):
+                periods = [periods]
+            hours[WEEKDAYS.index(key)] = sorted(_parse_period(period) for period in periods)
+        return cls(
+            id=str(data['id']),
+            name=data.get('name'),
+            appointment_types=data.get('appointment_types') or (),
+            hours=hours,
+            blackout_dates=[parse_date(str(day)) for day in data.get('blackout_dates') or ()]
+        )
+
+
+class ScheduleConfig:
+    """Providers, working hours, appointment lengths and closures
+
+    Loaded from JSON (see sample_schedule.json). `slot_minutes` is the grid
+    resolution and `slot_step` the spacing of offered start times; appointment
+    lengths come from `durations` by appointment type.
+    """
+
+    __slots__ = ('providers', 'durations', 'default_duration', 'slot_minutes', 'slot_step', 'blackout_dates')
+
+    def __init__(self, providers: List[Provider], durations: Optional[Dict[str, int]] = None,
+                 default_duration: int = DEFAULT_DURATION_MINUTES, slot_minutes: int = 15, slot_step: int = 30,
+                 blackout_dates: Iterable[date] = ()):
+        if not providers:
+            raise ValueError("A schedule needs at least one provider")
+        if len({provider.id for provider in providers}) != len(providers):
+            raise ValueError("Provider ids must be unique")
+        if slot_minutes <= 0 or MINUTES_PER_DAY % slot_minutes or slot_step % slot_minutes:
+            raise ValueError("slot_minutes must divide a day and slot_step must be a multiple of it")
+        self.providers = list(providers)
+        self.durations = {_normalize_type(t): int(minutes) for t, minutes in (durations or {}).items()}
+        self.default_duration = default_duration
+        self.slot_minutes = slot_minutes
+        self.slot_step = slot_step
+        self.blackout_dates = frozenset(blackout_dates)
+
+    def duration_for(self, appointment_type: Optional[str]) -> int:
+        return self.durations.get(_normalize_type(appointment_type), self.default_duration)
+
+    def is_closed(self, day: date) -> bool:
+        return day in self.blackout_dates
+
+    @classmethod
+    def default(cls, day_start: int = 9 * 60, day_end: int = 17 * 60) -> "ScheduleConfig":
+        """One provider working the same hours every day, as the bot behaved before schedules"""
+        every_day = {weekday: [(day_start, day_end)] for weekday in range(7)}
+        return cls([Provider("default", "Clinic", hours=every_day)])
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ScheduleConfig":
+        return cls(
+            providers=[Provider.from_dict(provider) for provider in data.get('providers') or ()],
+            durations=data.get('durations'),
+            default_duration=int(data.get('default_duration', DEFAULT_DURATION_MINUTES)),
+            slot_minutes=int(data.get('slot_minutes', 15)),
+            slot_step=int(data.get('slot_step', 30)),
+            blackout_dates=[parse_date(str(day)) for day in data.get('blackout_dates') or ()]
+        )
+
+    @classmethod
+    def from_file(cls, path: str) -> "ScheduleConfig":
+        with open(path, "r", encoding="utf-8") as f:
+            return cls.from_dict(json.load(f))
+
+
+class SlotGrid:
+    """Busy/open bitmaps per provider per day; bit i covers minutes [i * unit, (i + 1) * unit)
+
+    Open hours are turned into a bitmap once per provider and day, and each
+    booking sets its bits as it lands. Where an appointment of k units fits is
+    then `free & free >> 1 & ... & free >> (k - 1)` on a 96-bit integer (for a
+    15-minute grid), and the earliest fit is its lowest set bit.
+    """
+
+    def __init__(self, config: ScheduleConfig, max_cached_days: int = 10000):
+        self.config = config
+        self.unit = config.slot_minutes
+        self.max_cached_days = max_cached_days
+        self._providers = {provider.id: provider for provider in config.providers}
+        self._open: Dict[Tuple[str, date], int] = {}
+        self._busy: Dict[Tuple[str, date], int] = {}
+        self._lock = threading.Lock()
+        step = config.slot_step // self.unit
+        # Offered start times sit on the slot_step grid, counted from midnight
+        self._start_mask = sum(1 << i for i in range(0, MINUTES_PER_DAY // self.unit, step))
+
+    def mask(self, start: int, end: int) -> int:
+        """Bits of every unit the interval touches"""
+        first, last = start // self.unit, -(-end // self.unit)
+        return ((1 << (last - first)) - 1) << first
+
+    def open_mask(self, provider_id: str, day: date) -> int:
+        key = (provider_id, day)
+        mask = self._open.get(key)
+        if mask is None:
+            mask = 0
+            if not self.config.is_closed(day):
+                for start, end in self._providers[provider_id].periods(day):
+                    # Only units entirely inside a working period are bookable
+                    first, last = -(-start // self.unit), end // self.unit
+                    mask |= ((1 << (last - first)) - 1) << first
+            with self._lock:
+                if len(self._open) >= self.max_cached_days:
+                    self._open.clear()
+                self._open[key] = mask
+        return mask
+
+    def within_hours(self, provider_id: str, day: date, start: int, end: int) -> bool:
+        wanted = self.mask(start, end)
+        return self.open_mask(provider_id, day) & wanted == wanted
+
+    def is_free(self, provider_id: str, day: date, start: int, end: int) -> bool:
+        return (self.within_hours(provider_id, day, start, end)
+                and not self._busy.get((provider_id, day), 0) & self.mask(start, end))
+
+    def mark(self, provider_id: str, day: date, start: int, end: int):
+        key = (provider_id, day)
+        with self._lock:
+            self._busy[key] = self._busy.get(key, 0) | self.mask(start, end)
+
+    def rebuild(self, provider_id: str, day: date, intervals: Iterable[Tuple[int, int]]):
+        """Recompute a day's busy bits from its bookings, e.g. after a cancellation"""
+        busy = 0
+        for start, end in intervals:
+            busy |= self.mask(start, end)
+        with self._lock:
+            if busy:
+                self._busy[(provider_id, day)] = busy
+            else:
+                self._busy.pop((provider_id, day), None)
+
+    def fits(self, provider_id: str, day: date, duration: int, after: int = 0) -> int:
+        """Bitmap of offered start times at or after `after` where `duration` minutes are open and free"""
+        free = self.open_mask(provider_id, day) & ~self._busy.get((provider_id, day), 0)
+        fit = free
+        for shift in range(1, -(-duration // self.unit)):
+            fit &= free >> shift
+        return fit & self._start_mask & ~((1 << -(-after // self.unit)) - 1)
+
+    def starts(self, bits: int) -> Iterator[int]:
+        """Start minutes of the set bits in a fits() bitmap, earliest first"""
+        while bits:
+            lowest = bits & -bits
+            yield (lowest.bit_length() - 1) * self.unit
+            bits ^= lowest
+
+
+class ProviderSchedule:
+    """Availability across providers, in place of a single AvailabilityIndex
+
+    Every provider has its own ledger (an AvailabilityIndex, or a
+    SharedAvailabilityIndex when state is shared between processes) that
+    stays the authority on holds and compare-and-set bookings. The SlotGrid
+    mirrors working hours and bookings, so slot search is bit arithmetic and
+    only the candidates it yields are checked against the ledgers. A booking
+    goes to the first provider, in configuration order, who offers the
+    appointment type, works at that time and is free.
+    """
+
+    def __init__(self, config: ScheduleConfig, ledger_factory: Optional[Callable[[Provider], Any]] = None,
+                 hold_ttl: float = 120):
+        self.config = config
+        self.providers = list(config.providers)
+        self.default_duration = config.default_duration
+        self.grid = SlotGrid(config)
+        factory = ledger_factory or (lambda provider: AvailabilityIndex(
+            default_duration=config.default_duration, slot_step=config.slot_step, hold_ttl=hold_ttl
+        ))
+        self.ledgers = {provider.id: factory(provider) for provider in self.providers}
+
+    def duration_for(self, appointment_type: Optional[str]) -> int:
+        return self.config.duration_for(appointment_type)
+
+    def _provider_ids(self, provider: Optional[str]) -> List[str]:
+        if provider is None:
+            return [p.id for p in self.providers]
+        if provider not in self.ledgers:
+            raise ValueError(f"Unknown provider {provider!r}")
+        return [provider]
+
+    def _candidates(self, day: date, start: int, end: int, appointment_type: Optional[str],
+                    provider: Optional[str] = None) -> List[str]:
+        appointment_type = _normalize_type(appointment_type)
+        offering = {p.id for p in self.providers if p.offers(appointment_type)}
+        return [provider_id for provider_id in self._provider_ids(provider)
+                if provider_id in offering and self.grid.within_hours(provider_id, day, start, end)]
+
+    def _learn(self, provider_id: str, day: date, start: int, duration: int):
+        """Copy bookings the grid did not know about (e.g. made by another process) into it"""
+        for booked_start, booked_end in self.ledgers[provider_id].conflicts(day, start, duration):
+            self.grid.mark(provider_id, day, booked_start, booked_end)
+
+    def _release_others(self, day: date, owner: str, keep: str):
+        for provider_id, ledger in self.ledgers.items():
+            if provider_id != keep:
+                ledger.release(day, owner)
+
+    def closed_reason(self, day: date, start: int, duration: Optional[int] = None,
+                      appointment_type: Optional[str] = None) -> Optional[str]:
+        """Why nobody can take this appointment regardless of bookings, or None"""
+        appointment_type = _normalize_type(appointment_type)
+        end = start + (duration or self.duration_for(appointment_type))
+        if self.config.is_closed(day):
+            return f"We're closed on {day.isoformat()}."
+        offering = [p for p in self.providers if p.offers(appointment_type)]
+        if not offering:
+            return f"We don't offer {appointment_type} appointments."
+        if any(self.grid.within_hours(p.id, day, start, end) for p in offering):
+            return None
+        periods = sorted({period for p in offering for period in p.periods(day)})
+        if not periods:
+            if appointment_type and any(p.periods(day) for p in self.providers):
+                return f"No one sees {appointment_type} appointments on {day.strftime('%A')} {day.isoformat()}."
+            return f"We're closed on {day.strftime('%A')} {day.isoformat()}."
+        return (f"{format_time(start)}-{format_time(end)} is outside our hours on {day.strftime('%A')} "
+                f"({_format_periods(periods)}).")
+
+    def conflicts(self, day: date, start: int, duration: Optional[int] = None,
+                  provider: Optional[str] = None) -> List[Tuple[int, int]]:
+        """Booked (start, end) intervals overlapping the slot, for one provider or all of them"""
+        found = set()
+        for provider_id in self._provider_ids(provider):
+            found.update(self.ledgers[provider_id].conflicts(day, start, duration or self.default_duration))
+        return sorted(found)
+
+    def is_available(self, day: date, start: int, duration: Optional[int] = None, owner: Optional[str] = None,
+                     appointment_type: Optional[str] = None) -> bool:
+        duration = duration or self.duration_for(appointment_type)
+        return any(self.ledgers[provider_id].is_available(day, start, duration, owner=owner)
+                   for provider_id in self._candidates(day, start, start + duration, appointment_type))
+
+    def hold(self, day: date, start: int, duration: Optional[int] = None, owner: str = "", ttl: Optional[float] = None,
+             appointment_type: Optional[str] = None) -> bool:
+        """Hold the slot with the first provider who can take it; False if nobody can"""
+        duration = duration or self.duration_for(appointment_type)
+        for provider_id in self._candidates(day, start, start + duration, appointment_type):
+            if self.ledgers[provider_id].hold(day, start, duration, owner=owner, ttl=ttl):
+                self._release_others(day, owner, provider_id)
+                return True
+            self._learn(provider_id, day, start, duration)
+        return False
+
+    def release(self, day: date, owner: str):
+        for ledger in self.ledgers.values():
+            ledger.release(day, owner)
+
+    def confirm(self, day: date, start: int, duration: Optional[int] = None, owner: Optional[str] = None,
+                appointment_type: Optional[str] = None, provider: Optional[str] = None) -> str:
+        """Compare-and-set booking with the first provider who can take it; returns the provider id
+
+        Raises SlotUnavailable (with the closure reason, if any) when nobody can.
+        """
+        duration = duration or self.duration_for(appointment_type)
+        for provider_id in self._candidates(day, start, start + duration, appointment_type, provider):
+            try:
+                self.ledgers[provider_id].confirm(day, start, duration, owner=owner)
+            except SlotUnavailable:
+                self._learn(provider_id, day, start, duration)
+                continue
+            self.grid.mark(provider_id, day, start, start + duration)
+            if owner is not None:
+                self._release_others(day, owner, provider_id)
+            return provider_id
+        raise SlotUnavailable(self.closed_reason(day, start, duration, appointment_type)
+                              or f"{day.isoformat()} {format_time(start)} is no longer available")
+
+    def _place(self, day: date, start: int, end: int, provider: Optional[str]) -> str:
+        """Provider for an existing booking: the one given, else the first free one, else the first working one"""
+        if provider in self.ledgers:
+            return provider
+        working = [p.id for p in self.providers if self.grid.within_hours(p.id, day, start, end)]
+        for provider_id in working:
+            if self.grid.is_free(provider_id, day, start, end):
+                return provider_id
+        return working[0] if working else self.providers[0].id
+
+    def add(self, day: date, start: int, duration: Optional[int] = None, force: bool = False,
+            provider: Optional[str] = None) -> str:
+        """Record a booking; raises SlotUnavailable on overlap unless force is set"""
+        duration = duration or self.default_duration
+        provider_id = self._place(day, start, start + duration, provider)
+        self.ledgers[provider_id].add(day, start, duration, force=force)
+        self.grid.mark(provider_id, day, start, start + duration)
+        return provider_id
+
+    def add_many(self, slots: Iterable[Tuple[Any, ...]], batch_size: int = 5000) -> int:
+        """Record existing (day, start, duration[, provider]) bookings without overlap checks
+
+        Bookings without a known provider go to the first one free at that time.
+        """
+        loaded = 0
+        pending: Dict[str, List[Tuple[date, int, Optional[int]]]] = {p.id: [] for p in self.providers}
+        for slot in slots:
+            day, start, duration = slot[:3]
+            duration = duration or self.default_duration
+            provider_id = self._place(day, start, start + duration, slot[3] if len(slot) > 3 else None)
+            self.grid.mark(provider_id, day, start, start + duration)
+            pending[provider_id].append((day, start, duration))
+            loaded += 1
+            if len(pending[provider_id]) >= batch_size:
+                self.ledgers[provider_id].add_many(pending[provider_id])
+                pending[provider_id] = []
+        for provider_id, rest in pending.items():
+            if rest:
+                self.ledgers[provider_id].add_many(rest)
+        return loaded
+
+    def remove(self, day: date, start: int, provider: Optional[str] = None) -> bool:
+        """Drop the booking that starts at the given time, with `provider` or the first that has one"""
+        for provider_id in self._provider_ids(provider):
+            ledger = self.ledgers[provider_id]
+            if ledger.remove(day, start):
+                self.grid.rebuild(provider_id, day, ledger.conflicts(day, 0, MINUTES_PER_DAY))
+                return True
+        return False
+
+    def add_appointment(self, appointment: dict, force: bool = False) -> str:
+        """Index an appointment dict with 'date', 'time' and optional 'duration_minutes' and 'provider'"""
+        day = parse_date(str(appointment['date']))
+        start = parse_time(str(appointment['time']))
+        duration = int(appointment.get('duration_minutes') or self.duration_for(appointment.get('appointment_type')))
+        return self.add(day, start, duration, force=force, provider=appointment.get('provider'))
+
+    def next_free_slots(self, after: datetime, count: int = 3, duration: Optional[int] = None, max_days: int = 30,
+                        owner: Optional[str] = None, appointment_type: Optional[str] = None) -> List[datetime]:
+        """Earliest start times at or after `after` when some provider offering the type is free
+
+        Per day, the providers' fit bitmaps are OR-ed and walked lowest bit
+        first; each candidate is confirmed against the ledgers, which also
+        account for holds.
+        """
+        appointment_type = _normalize_type(appointment_type)
+        duration = duration or self.duration_for(appointment_type)
+        offering = [p.id for p in self.providers if p.offers(appointment_type)]
+        found: List[datetime] = []
+        first_day = after.date()
+        first_minute = after.hour * 60 + after.minute
+
+        for offset in range(max_days):
+            day = first_day + timedelta(days=offset)
+            if self.config.is_closed(day):
+                continue
+            after_minute = first_minute if offset == 0 else 0
+            fits = {provider_id: self.grid.fits(provider_id, day, duration, after_minute) for provider_id in offering}
+            union = 0
+            for bits in fits.values():
+                union |= bits
+
+            for start in self.grid.starts(union):
+                bit = 1 << (start // self.grid.unit)
+                for provider_id, bits in fits.items():
+                    if not bits & bit:
+                        continue
+                    if self.ledgers[provider_id].is_available(day, start, duration, owner=owner):
+                        found.append(datetime.combine(day, datetime.min.time()) + timedelta(minutes=start))
+                        break
+                    self._learn(provider_id, day, start, duration)
+                if len(found) >= count:
+                    return found
+        return found
+
+    def holds_count(self) -> int:
+        return sum(ledger.holds_count() for ledger in self.ledgers.values())
+
+    def __len__(self) -> int:
+        return sum(len(ledger) for ledger in self.ledgers.values())
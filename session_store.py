@@ -0,0 +1,217 @@
+import asyncio
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Optional
+
+from concurrency import ServiceSaturated
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SESSION_ID = "default"
+
+# Session of the turn being processed; tools use it to attribute slot holds
+current_session_id: ContextVar[Optional[str]] = ContextVar("current_session_id", default=None)
+
+
+class SessionContext:
+    """Per-conversation state: chat memory plus collected appointment fields"""
+
+    __slots__ = ("session_id", "memory", "appointment_data", "last_seen", "lock", "async_lock", "turns", "lease")
+
+    def __init__(self, session_id: str, memory: Any):
+        self.session_id = session_id
+        self.memory = memory
+        self.appointment_data: Dict[str, Any] = {}
+        self.last_seen = time.monotonic()
+        # Serializes turns within one conversation; different sessions never contend
+        self.lock = threading.Lock()
+        self.async_lock = asyncio.Lock()
+        # Turns between SessionStore.begin_turn and end_turn; a context in use is never evicted
+        self.turns = 0
+        # Token for the shared backend's turn lock, held from load until unlock
+        self.lease: Optional[str] = None
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def busy(self) -> bool:
+        return self.turns > 0 or self.lock.locked() or self.async_lock.locked()
+
+    def reset(self):
+        """Clear history and collected fields for this conversation only"""
+        self.memory.clear()
+        self.appointment_data = {}
+
+
+class SessionStore:
+    """Bounded LRU of conversation contexts with idle TTL eviction
+
+    With a shared `backend` (see state_backend.py), the local contexts only
+    hold locks and a working copy: `load` refreshes a context from the backend
+    at the start of a turn and `save` writes it back at the end, so a
+    conversation can continue on any bot process. `load` also takes the
+    session's turn lock in the backend (released by `unlock`), so two
+    replicas never run turns of one conversation at once, and `save` is
+    fenced by it: a turn that outlived its lease cannot overwrite a newer one.
+
+    Contexts with a turn in progress are never evicted, even over
+    `max_sessions`: evicting one would let a concurrent request for the same
+    session build a second context with its own lock and race the first.
+    """
+
+    def __init__(self, memory_factory: Callable[[], Any], max_sessions: int = 10000, ttl_seconds: float = 1800,
+                 backend: Optional[Any] = None, lock_timeout: float = 10.0, lease_seconds: float = 120.0):
+        self.memory_factory = memory_factory
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+        self.lock_timeout = lock_timeout
+        # Longer than any turn, so a lease only lapses when its process died mid-turn
+        self.lease_seconds = lease_seconds
+        self._sessions: "OrderedDict[str, SessionContext]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: Optional[str] = None) -> SessionContext:
+        """Return the context for session_id, creating it if needed"""
+        with self._lock:
+            return self._get_locked(session_id or DEFAULT_SESSION_ID)
+
+    def begin_turn(self, session_id: Optional[str] = None) -> SessionContext:
+        """get() for a turn: the context stays in the store until end_turn"""
+        with self._lock:
+            context = self._get_locked(session_id or DEFAULT_SESSION_ID)
+            context.turns += 1
+            return context
+
+    def end_turn(self, context: SessionContext):
+        with self._lock:
+            context.turns -= 1
+
+    def peek(self, session_id: str) -> Optional[SessionContext]:
+        """Return an existing context without creating or refreshing it"""
+        with self._lock:
+            return self._sessions.get(session_id)
+
+    def load(self, context: SessionContext):
+        """Lock the conversation in the shared backend and replace the context with the shared copy
+
+        A conversation missing from the backend (reset or expired on another
+        replica) starts over here too. Raises ServiceSaturated if another replica keeps the conversation
+        locked for longer than `lock_timeout`.
+        """
+        if self.backend is None:
+            return
+        self._lock_shared(context)
+        state = self.backend.load_session(context.session_id)
+        if state is None:
+            context.reset()
+            return
+        context.memory.load_state(state.get('turns') or [])
+        context.appointment_data = dict(state.get('appointment_data') or {})
+
+    def save(self, context: SessionContext) -> bool:
+        """Write a context's history and fields to the shared backend
+
+        Returns False, leaving the shared copy alone, if the turn's lease
+        lapsed and another replica may have taken the conversation over.
+        """
+        if self.backend is None:
+            return True
+        saved = self.backend.save_session(context.session_id, {
+            'turns': context.memory.to_state(),
+            'appointment_data': context.appointment_data
+        }, self.ttl_seconds, lease=context.lease)
+        if not saved:
+            logger.warning(f"⚠️ Session {context.session_id} lost its lock during the turn; save skipped")
+        return saved
+
+    def unlock(self, context: SessionContext):
+        """Release the shared turn lock taken by load, if any"""
+        lease, context.lease = context.lease, None
+        if self.backend is not None and lease is not None:
+            self.backend.unlock_session(context.session_id, lease)
+
+    def _lock_shared(self, context: SessionContext):
+        lease = uuid.uuid4().hex
+        deadline = time.monotonic() + self.lock_timeout
+        delay = 0.005
+        while not self.backend.lock_session(context.session_id, lease, self.lease_seconds):
+            if time.monotonic() >= deadline:
+                raise ServiceSaturated(f"session {context.session_id} is busy on another replica")
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        context.lease = lease
+
+    def reset(self, session_id: Optional[str] = None) -> bool:
+        """Reset a single conversation; returns False if it did not exist"""
+        session_id = session_id or DEFAULT_SESSION_ID
+        existed = self.backend.delete_session(session_id) if self.backend is not None else False
+        context = self.peek(session_id)
+        if context is None:
+            return existed
+        with context.lock:
+            context.reset()
+        return True
+
+    def discard(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def _get_locked(self, session_id: str) -> SessionContext:
+        now = time.monotonic()
+        self._evict_expired(now)
+
+        context = self._sessions.get(session_id)
+        if context is not None:
+            self._sessions.move_to_end(session_id)
+        else:
+            context = SessionContext(session_id, self.memory_factory())
+            self._sessions[session_id] = context
+            while len(self._sessions) > self.max_sessions and self._evict_idle(keep=session_id):
+                pass
+
+        context.last_seen = now
+        return context
+
+    def _evict_expired(self, now: float):
+        # Entries are in LRU order, so expired ones are always at the front
+        cutoff = now - self.ttl_seconds
+        for _ in range(len(self._sessions)):
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if oldest.last_seen >= cutoff:
+                break
+            if oldest.busy():
+                # A long turn is still running: it counts as recently used
+                self._sessions.move_to_end(oldest_id)
+                continue
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    def _evict_idle(self, keep: str) -> bool:
+        """Evict the least recently used context without a turn in progress; False if all are busy"""
+        for _ in range(len(self._sessions)):
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if oldest_id == keep or oldest.busy():
+                self._sessions.move_to_end(oldest_id)
+                continue
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+            return True
+        return False
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'active_sessions': len(self._sessions),
+            'max_sessions': self.max_sessions,
+            'ttl_seconds': self.ttl_seconds,
+            'evictions': self.evictions,
+            'shared': self.backend is not None
+        }
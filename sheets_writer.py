@@ -0,0 +1,316 @@
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+class SheetsWriteBehind:
+    """Background writer that batches appointment rows into Google Sheets
+
+    Rows are queued by the request thread and flushed by a single worker with
+    `append_rows`. Rows that cannot be delivered (queue full, retries exhausted,
+    shutdown) go to a JSON-lines spool file. When a flush fails, everything
+    still queued is spooled too and new rows go straight to disk until a
+    replay, retried with backoff, gets the spool into Sheets. Spooled rows are
+    only deleted once appended, so delivery is at least once.
+    `on_append(rows, seconds, ok)` is called after every append_rows attempt.
+
+    `client` may also be a zero-argument callable returning the gspread client;
+    it is called on the worker thread, which then opens the sheet right away so
+    authorization and the first connection stay off the startup path.
+    """
+
+    def __init__(self, client: Any, sheet_url: str, spool_path: Optional[str] = "sheets_spool.jsonl",
+                 max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 0.5,
+                 max_retries: int = 5, backoff_base: float = 0.5, backoff_max: float = 30.0,
+                 on_append: Optional[Callable[[int, float, bool], None]] = None, bulk_batch_size: int = 2000):
+        self._client_factory = client if callable(client) else None
+        self.client = None if self._client_factory else client
+        self.sheet_url = sheet_url
+        self.spool_path = spool_path
+        self.batch_size = batch_size
+        self.bulk_batch_size = bulk_batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.on_append = on_append
+
+        self._queue: "queue.Queue[List[Any]]" = queue.Queue(maxsize=max_queue)
+        self._worksheet = None
+        self._worksheet_lock = threading.Lock()
+        self._spool_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self.rows_written = 0
+        self.batches_written = 0
+        self.failures = 0
+        self.rows_spooled = 0
+        # Set while Sheets is failing: new rows are spooled until the next replay at this monotonic time
+        self._retry_at: Optional[float] = None
+        self._replay_failures = 0
+        self.last_flush_latency_ms: Optional[float] = None
+        self._flush_latency_total_ms = 0.0
+        self.last_error: Optional[str] = None
+
+    # Lifecycle
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sheets-write-behind", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        """Flush what we can, then spool anything still queued"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout)
+        leftover = self._drain(self._queue.qsize())
+        if leftover:
+            self._spool(leftover)
+
+    # Producer side
+
+    def enqueue(self, row: List[Any]) -> bool:
+        """Queue a row for delivery; returns False if it had to be spooled instead"""
+        try:
+            self._queue.put_nowait(row)
+            return True
+        except queue.Full:
+            logger.warning("⚠️ Sheets queue full, spooling row to disk")
+            self._spool([row])
+            return False
+
+    def write_rows(self, rows: List[List[Any]]) -> bool:
+        """Hand over a large batch, e.g. from a bulk import, without waiting for Sheets
+
+        Rows go to the spool file rather than the queue, so a big import is
+        durable right away and cannot crowd out conversational bookings; the
+        worker appends it in `bulk_batch_size` chunks. Without a spool the rows
+        are queued like single bookings. Returns False if any row was dropped.
+        """
+        if not self.spool_path:
+            return all([self.enqueue(row) for row in rows])
+        self._spool(rows, failed=False)
+        return True
+
+    # Worker side
+
+    def _run(self):
+        self.warm_up()
+        self._replay_spool()
+
+        while not self._stop.is_set():
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+                batch = [first] + self._drain(self.batch_size - 1)
+            except queue.Empty:
+                batch = []
+
+            if self._retry_at is not None:
+                # Sheets is failing: keep new rows on disk until a replay gets through
+                self._spool(batch)
+                if time.monotonic() >= self._retry_at:
+                    self._replay_spool()
+                continue
+            if batch:
+                self._flush_batch(batch)
+            if self._retry_at is None and self._spool_pending():
+                # Bulk rows, or Sheets is reachable again after a failure
+                self._replay_spool()
+
+    def _drain(self, limit: int) -> List[List[Any]]:
+        rows = []
+        while len(rows) < limit:
+            try:
+                rows.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def warm_up(self):
+        """Authorize and open the worksheet before the first row arrives"""
+        try:
+            self._get_worksheet()
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"⚠️ Could not open Google Sheet yet, will retry on first write: {e}")
+
+    def _get_worksheet(self):
+        with self._worksheet_lock:
+            if self.client is None:
+                self.client = self._client_factory()
+            # Opening by URL is a full round trip, so keep the handle between batches
+            if self._worksheet is None:
+                self._worksheet = self.client.open_by_url(self.sheet_url).sheet1
+            return self._worksheet
+
+    def _flush_batch(self, rows: List[List[Any]]) -> bool:
+        """Write rows in batch_size chunks; on failure spool the rest and everything queued"""
+        for i in range(0, len(rows), self.batch_size):
+            chunk = rows[i:i + self.batch_size]
+            if not self._write_with_retry(chunk):
+                self._spool(rows[i:] + self._drain(self._queue.qsize()))
+                self._schedule_replay()
+                return False
+        return True
+
+    def _write_with_retry(self, rows: List[List[Any]], retries: Optional[int] = None) -> bool:
+        retries = self.max_retries if retries is None else retries
+        for attempt in range(retries + 1):
+            started = time.perf_counter()
+            try:
+                self._get_worksheet().append_rows(rows, value_input_option="USER_ENTERED")
+                self._record_flush(time.perf_counter() - started, len(rows), ok=True)
+                return True
+            except Exception as e:
+                self._record_flush(time.perf_counter() - started, len(rows), ok=False)
+                self.failures += 1
+                self.last_error = str(e)
+                # A stale handle is a common cause of failures, reopen next time
+                self._worksheet = None
+                if attempt == retries or self._stop.is_set():
+                    logger.error(f"❌ Failed to append {len(rows)} rows to Google Sheets: {e}")
+                    return False
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                logger.warning(f"⚠️ Sheets append failed ({e}), retrying in {delay:.1f}s")
+                self._stop.wait(delay * random.uniform(0.5, 1.0))
+        return False
+
+    def _record_flush(self, seconds: float, row_count: int, ok: bool):
+        if self.on_append:
+            self.on_append(row_count, seconds, ok)
+        if not ok:
+            return
+        latency_ms = seconds * 1000
+        self.last_flush_latency_ms = latency_ms
+        self._flush_latency_total_ms += latency_ms
+        self.batches_written += 1
+        self.rows_written += row_count
+        logger.info(f"✅ Appended {row_count} appointment rows to Google Sheets.")
+
+    # Spool
+
+    def _spool(self, rows: List[List[Any]], failed: bool = True):
+        if not rows:
+            return
+        if not self.spool_path:
+            logger.error(f"❌ Dropping {len(rows)} Sheets rows, no spool configured")
+            return
+        with self._spool_lock:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for row in rows:
+                    f.write(json.dumps(row) + "\n")
+                f.flush()
+                os.fsync(f.fileno())
+            if failed:
+                self.rows_spooled += len(rows)
+
+    @staticmethod
+    def _has_rows(path: str) -> bool:
+        return os.path.exists(path) and os.path.getsize(path) > 0
+
+    def _spool_pending(self) -> bool:
+        return bool(self.spool_path) and (self._has_rows(self.spool_path) or self._has_rows(self._replaying_path))
+
+    @property
+    def _replaying_path(self) -> str:
+        return f"{self.spool_path}.replaying"
+
+    @property
+    def _offset_path(self) -> str:
+        return f"{self.spool_path}.replaying.offset"
+
+    def _replayed_offset(self) -> int:
+        """Bytes of the replaying file already appended to Sheets"""
+        try:
+            with open(self._offset_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (OSError, ValueError):
+            return 0
+
+    def _record_offset(self, offset: int):
+        partial = f"{self._offset_path}.tmp"
+        with open(partial, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, self._offset_path)
+
+    def _clear_offset(self):
+        if os.path.exists(self._offset_path):
+            os.remove(self._offset_path)
+
+    def _schedule_replay(self):
+        self._replay_failures += 1
+        delay = min(self.backoff_max, self.backoff_base * (2 ** (self._replay_failures - 1)))
+        self._retry_at = time.monotonic() + delay * random.uniform(0.5, 1.0)
+
+    def _replay_spool(self) -> bool:
+        """Append spooled rows to Sheets, deleting them from disk only once they are written
+
+        The spool is renamed to `<spool>.replaying` first, so rows spooled in
+        the meantime go to a fresh file. The renamed file is read and appended
+        `bulk_batch_size` rows at a time, recording after each append how far
+        it got in `<spool>.replaying.offset`. A failed append or a crash leaves
+        both files in place, and the next replay resumes after the rows
+        already written.
+        """
+        if not self._spool_pending():
+            self._retry_at = None
+            self._replay_failures = 0
+            return True
+        replaying = self._replaying_path
+        with self._spool_lock:
+            if not self._has_rows(replaying):
+                os.replace(self.spool_path, replaying)
+                # Left over from a crash after the previous file was finished
+                self._clear_offset()
+        offset = self._replayed_offset()
+        logger.info(f"🔁 Replaying spooled Sheets rows from byte {offset} of {os.path.getsize(replaying)}")
+
+        with open(replaying, "rb") as f:
+            f.seek(offset)
+            while True:
+                rows = []
+                while len(rows) < self.bulk_batch_size:
+                    line = f.readline()
+                    if not line:
+                        break
+                    if line.strip():
+                        rows.append(json.loads(line))
+                if not rows:
+                    break
+                # One attempt per chunk; the backoff between replays does the waiting
+                if not self._write_with_retry(rows, retries=0):
+                    self._schedule_replay()
+                    return False
+                self._record_offset(f.tell())
+        os.remove(replaying)
+        self._clear_offset()
+        self._retry_at = None
+        self._replay_failures = 0
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'queue_depth': self._queue.qsize(),
+            'rows_written': self.rows_written,
+            'batches_written': self.batches_written,
+            'failures': self.failures,
+            'rows_spooled': self.rows_spooled,
+            'spool_pending': self._spool_pending(),
+            'last_flush_latency_ms': self.last_flush_latency_ms,
+            'avg_flush_latency_ms': (self._flush_latency_total_ms / self.batches_written) if self.batches_written else None,
+            'last_error': self.last_error
+        }
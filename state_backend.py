@@ -0,0 +1,579 @@
+import json
+import math
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import Counter
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from availability import DEFAULT_DURATION_MINUTES, SlotUnavailable, format_time, parse_date, parse_time
+
+
+# A day's state: booked (start, end) intervals sorted by start, and owner -> (start, end, expires_at) holds
+DayState = Tuple[List[Tuple[int, int]], Dict[str, Tuple[int, int, float]]]
+
+
+def _namespace(day: str) -> str:
+    """Calendar namespace of a day key ("" for plain ISO dates)"""
+    return day.rpartition(":")[0]
+
+
+def _blocked(booked: Iterable[Tuple[int, int]], holds: Dict[str, Tuple[int, int, float]], start: int, end: int,
+             owner: Optional[str], now: float) -> bool:
+    """True if a booking or someone else's live hold overlaps [start, end)"""
+    if any(booked_start < end and booked_end > start for booked_start, booked_end in booked):
+        return True
+    return any(holder != owner and hold_start < end and hold_end > start and expires_at > now
+               for holder, (hold_start, hold_end, expires_at) in holds.items())
+
+
+class StateBackend(ABC):
+    """Conversation state, booked slots and holds shared by every bot process
+
+    Days are ISO date strings, optionally prefixed with a calendar namespace
+    ("provider:YYYY-MM-DD"), and times are minutes after midnight. Hold
+    expiry uses wall-clock time, since replicas share no monotonic clock.
+    Every write that can conflict is a single atomic operation, so two
+    processes can never both book or hold the same slot.
+    """
+
+    # Sessions
+
+    @abstractmethod
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        pass
+
+    @abstractmethod
+    def save_session(self, session_id: str, state: Dict[str, Any], ttl_seconds: float,
+                     lease: Optional[str] = None) -> bool:
+        """Write a session; with a lease, only while that lease still holds the session's lock"""
+
+    @abstractmethod
+    def delete_session(self, session_id: str) -> bool:
+        pass
+
+    @abstractmethod
+    def lock_session(self, session_id: str, lease: str, ttl_seconds: float) -> bool:
+        """Take the session's turn lock for `lease` unless another lease holds it"""
+
+    @abstractmethod
+    def unlock_session(self, session_id: str, lease: str):
+        """Release the turn lock if `lease` still holds it"""
+
+    # Slots and holds
+
+    @abstractmethod
+    def read_days(self, days: List[str], now: float) -> Dict[str, DayState]:
+        """State of several days in one round trip"""
+
+    @abstractmethod
+    def hold(self, day: str, start: int, end: int, owner: str, expires_at: float, now: float) -> bool:
+        """Hold a free slot for owner (replacing owner's other hold that day); False if taken"""
+
+    @abstractmethod
+    def confirm(self, day: str, start: int, end: int, owner: Optional[str], now: float) -> bool:
+        """Book the slot unless a booking or a foreign hold overlaps; consumes owner's hold"""
+
+    @abstractmethod
+    def add(self, day: str, start: int, end: int, force: bool = False) -> bool:
+        """Record a booking; False on overlap unless force is set"""
+
+    @abstractmethod
+    def add_many(self, slots: Iterable[Tuple[str, int, int]]) -> int:
+        """Record existing bookings without overlap checks, batched; returns how many were sent"""
+
+    @abstractmethod
+    def release(self, day: str, owner: str):
+        pass
+
+    @abstractmethod
+    def remove(self, day: str, start: int) -> bool:
+        pass
+
+    @abstractmethod
+    def count_slots(self, namespace: str = "") -> int:
+        """Bookings in one calendar namespace"""
+
+    @abstractmethod
+    def count_holds(self, now: float, namespace: str = "") -> int:
+        """Live holds in one calendar namespace"""
+
+
+class InMemoryStateBackend(StateBackend):
+    """Process-local stand-in with the same semantics as the Redis backend
+
+    Share one instance between several agents to simulate replicas in tests.
+    Sessions are stored as JSON, like in Redis, so unserializable state fails
+    here too.
+    """
+
+    def __init__(self):
+        self._sessions: Dict[str, Tuple[str, float]] = {}
+        self._session_locks: Dict[str, Tuple[str, float]] = {}
+        self._booked: Dict[str, Dict[int, int]] = {}
+        self._holds: Dict[str, Dict[str, Tuple[int, int, float]]] = {}
+        self._lock = threading.Lock()
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return None
+            if entry[1] <= time.time():
+                del self._sessions[session_id]
+                return None
+        return json.loads(entry[0])
+
+    def save_session(self, session_id: str, state: Dict[str, Any], ttl_seconds: float,
+                     lease: Optional[str] = None) -> bool:
+        blob = json.dumps(state)
+        with self._lock:
+            if lease is not None and not self._holds_lock(session_id, lease):
+                return False
+            self._sessions[session_id] = (blob, time.time() + ttl_seconds)
+            return True
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def lock_session(self, session_id: str, lease: str, ttl_seconds: float) -> bool:
+        with self._lock:
+            holder = self._session_locks.get(session_id)
+            if holder is not None and holder[1] > time.time():
+                return False
+            self._session_locks[session_id] = (lease, time.time() + ttl_seconds)
+            return True
+
+    def unlock_session(self, session_id: str, lease: str):
+        with self._lock:
+            if self._holds_lock(session_id, lease):
+                del self._session_locks[session_id]
+
+    def _holds_lock(self, session_id: str, lease: str) -> bool:
+        holder = self._session_locks.get(session_id)
+        return holder is not None and holder[0] == lease and holder[1] > time.time()
+
+    def read_days(self, days: List[str], now: float) -> Dict[str, DayState]:
+        with self._lock:
+            return {
+                day: (
+                    sorted(self._booked.get(day, {}).items()),
+                    {owner: hold for owner, hold in self._holds.get(day, {}).items() if hold[2] > now}
+                )
+                for day in days
+            }
+
+    def hold(self, day: str, start: int, end: int, owner: str, expires_at: float, now: float) -> bool:
+        with self._lock:
+            holds = self._holds.setdefault(day, {})
+            if _blocked(self._booked.get(day, {}).items(), holds, start, end, owner, now):
+                return False
+            holds[owner] = (start, end, expires_at)
+            return True
+
+    def confirm(self, day: str, start: int, end: int, owner: Optional[str], now: float) -> bool:
+        with self._lock:
+            holds = self._holds.setdefault(day, {})
+            booked = self._booked.setdefault(day, {})
+            if _blocked(booked.items(), holds, start, end, owner, now):
+                return False
+            booked[start] = end
+            if owner is not None:
+                holds.pop(owner, None)
+            return True
+
+    def add(self, day: str, start: int, end: int, force: bool = False) -> bool:
+        with self._lock:
+            booked = self._booked.setdefault(day, {})
+            if not force and _blocked(booked.items(), {}, start, end, None, 0):
+                return False
+            booked[start] = end
+            return True
+
+    def add_many(self, slots: Iterable[Tuple[str, int, int]]) -> int:
+        sent = 0
+        with self._lock:
+            for day, start, end in slots:
+                self._booked.setdefault(day, {})[start] = end
+                sent += 1
+        return sent
+
+    def release(self, day: str, owner: str):
+        with self._lock:
+            self._holds.get(day, {}).pop(owner, None)
+
+    def remove(self, day: str, start: int) -> bool:
+        with self._lock:
+            return self._booked.get(day, {}).pop(start, None) is not None
+
+    def count_slots(self, namespace: str = "") -> int:
+        with self._lock:
+            return sum(len(booked) for day, booked in self._booked.items() if _namespace(day) == namespace)
+
+    def count_holds(self, now: float, namespace: str = "") -> int:
+        with self._lock:
+            return sum(1 for day, holds in self._holds.items() if _namespace(day) == namespace
+                       for hold in holds.values() if hold[2] > now)
+
+
+# Shared by the hold and confirm scripts: return 0 if a booking or a live foreign
+# hold overlaps ARGV[1]..ARGV[2]; expired holds are pruned on the way.
+# KEYS: booked hash, holds hash. ARGV: start, end, owner ('' for none), now
+_LUA_CHECK = """
+local start, finish, owner, now = tonumber(ARGV[1]), tonumber(ARGV[2]), ARGV[3], tonumber(ARGV[4])
+local booked = redis.call('HGETALL', KEYS[1])
+for i = 1, #booked, 2 do
+  if tonumber(booked[i]) < finish and tonumber(booked[i + 1]) > start then return 0 end
+end
+local holds = redis.call('HGETALL', KEYS[2])
+for i = 1, #holds, 2 do
+  local s, e, expires = string.match(holds[i + 1], '^(%d+):(%d+):(.+)$')
+  if tonumber(expires) <= now then
+    redis.call('HDEL', KEYS[2], holds[i])
+  elseif holds[i] ~= owner and tonumber(s) < finish and tonumber(e) > start then
+    return 0
+  end
+end
+"""
+
+# ARGV[5]: expires_at, ARGV[6]: key TTL in seconds (garbage collection only)
+_LUA_HOLD = _LUA_CHECK + """
+redis.call('HSET', KEYS[2], owner, ARGV[1] .. ':' .. ARGV[2] .. ':' .. ARGV[5])
+redis.call('EXPIRE', KEYS[2], ARGV[6])
+return 1
+"""
+
+_LUA_CONFIRM = _LUA_CHECK + """
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if owner ~= '' then redis.call('HDEL', KEYS[2], owner) end
+return 1
+"""
+
+# KEYS: session, session lock. ARGV: state JSON, TTL in seconds, lease ('' to write unconditionally)
+_LUA_SAVE_SESSION = """
+if ARGV[3] ~= '' and redis.call('GET', KEYS[2]) ~= ARGV[3] then return 0 end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[2])
+return 1
+"""
+
+# KEYS: session lock. ARGV: lease
+_LUA_UNLOCK_SESSION = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then return redis.call('DEL', KEYS[1]) end
+return 0
+"""
+
+# KEYS: booked hash. ARGV: start, end
+_LUA_ADD = """
+local start, finish = tonumber(ARGV[1]), tonumber(ARGV[2])
+local booked = redis.call('HGETALL', KEYS[1])
+for i = 1, #booked, 2 do
+  if tonumber(booked[i]) < finish and tonumber(booked[i + 1]) > start then return 0 end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+return 1
+"""
+
+
+def _text(value: Any) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+class RedisStateBackend(StateBackend):
+    """State in Redis (or a compatible server such as Valkey or KeyDB)
+
+    Per day, bookings live in a hash `start -> end` and holds in a hash
+    `owner -> start:end:expires_at`. Hold, confirm and checked add run as Lua
+    scripts, so the overlap check and the write are one atomic step on the
+    server. Per-day keys share a hash tag, which keeps each script on a single
+    cluster slot. Multi-day reads and bulk loads are pipelined. A session and
+    its turn lock share a hash tag too, so the fenced save is one script.
+
+    Metrics never scan days: a hash keeps the number of bookings per
+    namespace, and a sorted set per namespace scores each live hold by its
+    expiry. Both are updated after the write they follow, so a process dying
+    in between can leave a count off by one until the next warm load.
+    """
+
+    def __init__(self, client: Any, prefix: str = "appointment_bot:", hold_key_ttl: int = 3600,
+                 batch_size: int = 1000):
+        self.client = client
+        self.prefix = prefix
+        self.hold_key_ttl = hold_key_ttl
+        self.batch_size = batch_size
+        self._slot_counts_key = f"{prefix}slot-counts"
+        self._hold_script = client.register_script(_LUA_HOLD)
+        self._confirm_script = client.register_script(_LUA_CONFIRM)
+        self._add_script = client.register_script(_LUA_ADD)
+        self._save_session_script = client.register_script(_LUA_SAVE_SESSION)
+        self._unlock_session_script = client.register_script(_LUA_UNLOCK_SESSION)
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs: Any) -> "RedisStateBackend":
+        import redis
+
+        return cls(redis.Redis.from_url(url, decode_responses=True), **kwargs)
+
+    def _session_key(self, session_id: str) -> str:
+        return f"{self.prefix}session:{{{session_id}}}"
+
+    def _session_lock_key(self, session_id: str) -> str:
+        return f"{self.prefix}session-lock:{{{session_id}}}"
+
+    def _day_keys(self, day: str) -> List[str]:
+        return [f"{self.prefix}booked:{{{day}}}", f"{self.prefix}holds:{{{day}}}"]
+
+    def _hold_expiry_key(self, namespace: str) -> str:
+        return f"{self.prefix}hold-expiry:{namespace}"
+
+    # Sessions
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        blob = self.client.get(self._session_key(session_id))
+        return json.loads(blob) if blob else None
+
+    def save_session(self, session_id: str, state: Dict[str, Any], ttl_seconds: float,
+                     lease: Optional[str] = None) -> bool:
+        keys = [self._session_key(session_id), self._session_lock_key(session_id)]
+        return bool(self._save_session_script(
+            keys=keys, args=[json.dumps(state), max(1, int(math.ceil(ttl_seconds))), lease or ""]
+        ))
+
+    def delete_session(self, session_id: str) -> bool:
+        return bool(self.client.delete(self._session_key(session_id)))
+
+    def lock_session(self, session_id: str, lease: str, ttl_seconds: float) -> bool:
+        return bool(self.client.set(self._session_lock_key(session_id), lease, nx=True,
+                                    px=max(1, int(ttl_seconds * 1000))))
+
+    def unlock_session(self, session_id: str, lease: str):
+        self._unlock_session_script(keys=[self._session_lock_key(session_id)], args=[lease])
+
+    # Slots and holds
+
+    def read_days(self, days: List[str], now: float) -> Dict[str, DayState]:
+        pipe = self.client.pipeline(transaction=False)
+        for day in days:
+            booked_key, holds_key = self._day_keys(day)
+            pipe.hgetall(booked_key)
+            pipe.hgetall(holds_key)
+        replies = pipe.execute()
+
+        result: Dict[str, DayState] = {}
+        for i, day in enumerate(days):
+            booked_raw, holds_raw = replies[2 * i], replies[2 * i + 1]
+            booked = sorted((int(_text(start)), int(_text(end))) for start, end in booked_raw.items())
+            holds = {}
+            for owner, value in holds_raw.items():
+                start, end, expires_at = _text(value).split(":")
+                if float(expires_at) > now:
+                    holds[_text(owner)] = (int(start), int(end), float(expires_at))
+            result[day] = (booked, holds)
+        return result
+
+    def hold(self, day: str, start: int, end: int, owner: str, expires_at: float, now: float) -> bool:
+        held = self._hold_script(keys=self._day_keys(day),
+                                 args=[start, end, owner, repr(now), repr(expires_at), self.hold_key_ttl])
+        if held:
+            self.client.zadd(self._hold_expiry_key(_namespace(day)), {f"{day}|{owner}": expires_at})
+        return bool(held)
+
+    def confirm(self, day: str, start: int, end: int, owner: Optional[str], now: float) -> bool:
+        if not self._confirm_script(keys=self._day_keys(day), args=[start, end, owner or "", repr(now)]):
+            return False
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hincrby(self._slot_counts_key, _namespace(day), 1)
+        if owner:
+            pipe.zrem(self._hold_expiry_key(_namespace(day)), f"{day}|{owner}")
+        pipe.execute()
+        return True
+
+    def add(self, day: str, start: int, end: int, force: bool = False) -> bool:
+        if force:
+            # HSET reports whether the start was new; overwriting a booking adds none
+            added = self.client.hset(self._day_keys(day)[0], start, end)
+        else:
+            added = self._add_script(keys=self._day_keys(day)[:1], args=[start, end])
+        if added:
+            self.client.hincrby(self._slot_counts_key, _namespace(day), 1)
+        return force or bool(added)
+
+    def add_many(self, slots: Iterable[Tuple[str, int, int]]) -> int:
+        sent = 0
+        pipe = self.client.pipeline(transaction=False)
+        namespaces: List[str] = []
+        for day, start, end in slots:
+            pipe.hset(self._day_keys(day)[0], start, end)
+            namespaces.append(_namespace(day))
+            sent += 1
+            if len(namespaces) == self.batch_size:
+                self._count_added(namespaces, pipe.execute())
+                namespaces = []
+        if namespaces:
+            self._count_added(namespaces, pipe.execute())
+        return sent
+
+    def _count_added(self, namespaces: List[str], replies: List[Any]):
+        added = Counter(namespace for namespace, new in zip(namespaces, replies) if new)
+        if added:
+            pipe = self.client.pipeline(transaction=False)
+            for namespace, count in added.items():
+                pipe.hincrby(self._slot_counts_key, namespace, count)
+            pipe.execute()
+
+    def release(self, day: str, owner: str):
+        pipe = self.client.pipeline(transaction=False)
+        pipe.hdel(self._day_keys(day)[1], owner)
+        pipe.zrem(self._hold_expiry_key(_namespace(day)), f"{day}|{owner}")
+        pipe.execute()
+
+    def remove(self, day: str, start: int) -> bool:
+        if not self.client.hdel(self._day_keys(day)[0], start):
+            return False
+        self.client.hincrby(self._slot_counts_key, _namespace(day), -1)
+        return True
+
+    def count_slots(self, namespace: str = "") -> int:
+        return int(_text(self.client.hget(self._slot_counts_key, namespace) or 0))
+
+    def count_holds(self, now: float, namespace: str = "") -> int:
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zremrangebyscore(self._hold_expiry_key(namespace), "-inf", now)
+        pipe.zcard(self._hold_expiry_key(namespace))
+        return pipe.execute()[1]
+
+
+class SharedAvailabilityIndex:
+    """AvailabilityIndex over a StateBackend, for several bot processes sharing bookings
+
+    Same interface as AvailabilityIndex. Holds, confirmations and removals go
+    straight to the backend, which decides atomically. Reads (availability
+    checks and slot suggestions) use a per-day local read-through cache that
+    lives for `cache_ttl` seconds and is dropped on every local write; a
+    stale read can only suggest a slot that the following hold then refuses.
+    """
+
+    def __init__(self, backend: StateBackend, default_duration: int = DEFAULT_DURATION_MINUTES,
+                 day_start: int = 9 * 60, day_end: int = 17 * 60, slot_step: int = 30, hold_ttl: float = 120,
+                 cache_ttl: float = 1.0, read_ahead_days: int = 7, namespace: str = ""):
+        self.backend = backend
+        self.default_duration = default_duration
+        self.day_start = day_start
+        self.day_end = day_end
+        self.slot_step = slot_step
+        self.hold_ttl = hold_ttl
+        self.cache_ttl = cache_ttl
+        self.read_ahead_days = read_ahead_days
+        # Separates calendars (e.g. one per provider) sharing a backend
+        self.namespace = namespace
+        self._cache: Dict[str, Tuple[float, DayState]] = {}
+        self._cache_lock = threading.Lock()
+
+    def _key(self, day: date) -> str:
+        return f"{self.namespace}:{day.isoformat()}" if self.namespace else day.isoformat()
+
+    def _days(self, days: List[date]) -> Dict[date, DayState]:
+        """Day states from the local cache, fetching all misses in one backend round trip"""
+        now = time.monotonic()
+        keys = [self._key(day) for day in days]
+        with self._cache_lock:
+            cached = {key: self._cache.get(key) for key in keys}
+        missing = [key for key, entry in cached.items() if entry is None or now - entry[0] > self.cache_ttl]
+        if missing:
+            fetched = self.backend.read_days(missing, time.time())
+            with self._cache_lock:
+                for key, state in fetched.items():
+                    self._cache[key] = (now, state)
+                    cached[key] = (now, state)
+        return {day: cached[key][1] for day, key in zip(days, keys)}
+
+    def _invalidate(self, day: date):
+        with self._cache_lock:
+            self._cache.pop(self._key(day), None)
+
+    def conflicts(self, day: date, start: int, duration: Optional[int] = None) -> List[Tuple[int, int]]:
+        """Booked (start, end) intervals overlapping the requested slot"""
+        end = start + (duration or self.default_duration)
+        booked, _ = self._days([day])[day]
+        return [(s, e) for s, e in booked if s < end and e > start]
+
+    def is_available(self, day: date, start: int, duration: Optional[int] = None, owner: Optional[str] = None) -> bool:
+        booked, holds = self._days([day])[day]
+        return not _blocked(booked, holds, start, start + (duration or self.default_duration), owner, time.time())
+
+    def hold(self, day: date, start: int, duration: Optional[int] = None, owner: str = "", ttl: Optional[float] = None) -> bool:
+        now = time.time()
+        self._invalidate(day)
+        return self.backend.hold(self._key(day), start, start + (duration or self.default_duration), owner,
+                                 now + (ttl or self.hold_ttl), now)
+
+    def release(self, day: date, owner: str):
+        self._invalidate(day)
+        self.backend.release(self._key(day), owner)
+
+    def confirm(self, day: date, start: int, duration: Optional[int] = None, owner: Optional[str] = None):
+        """Compare-and-set booking; raises SlotUnavailable if taken or held by someone else"""
+        self._invalidate(day)
+        if not self.backend.confirm(self._key(day), start, start + (duration or self.default_duration), owner, time.time()):
+            raise SlotUnavailable(f"{day.isoformat()} {format_time(start)} is no longer available")
+
+    def add(self, day: date, start: int, duration: Optional[int] = None, force: bool = False):
+        """Record a booking; raises SlotUnavailable on overlap unless force is set"""
+        self._invalidate(day)
+        if not self.backend.add(self._key(day), start, start + (duration or self.default_duration), force=force):
+            raise SlotUnavailable(f"{day.isoformat()} {format_time(start)} overlaps an existing appointment")
+
+    def add_many(self, slots: Iterable[Tuple[date, int, Optional[int]]]) -> int:
+        """Record existing bookings without overlap checks, e.g. when warm-loading from the store"""
+        with self._cache_lock:
+            self._cache.clear()
+        return self.backend.add_many(
+            (self._key(day), start, start + (duration or self.default_duration)) for day, start, duration in slots
+        )
+
+    def remove(self, day: date, start: int) -> bool:
+        self._invalidate(day)
+        return self.backend.remove(self._key(day), start)
+
+    def add_appointment(self, appointment: dict, force: bool = False):
+        """Index an appointment dict with 'date', 'time' and optional 'duration_minutes'"""
+        day = parse_date(str(appointment['date']))
+        start = parse_time(str(appointment['time']))
+        duration = int(appointment.get('duration_minutes') or self.default_duration)
+        self.add(day, start, duration, force=force)
+
+    def next_free_slots(self, after: datetime, count: int = 3, duration: Optional[int] = None,
+                        max_days: int = 30, owner: Optional[str] = None) -> List[datetime]:
+        """Earliest free, unheld slots on the business-hours grid at or after `after`"""
+        duration = duration or self.default_duration
+        found: List[datetime] = []
+        first_day = after.date()
+        first_minute = after.hour * 60 + after.minute
+        now = time.time()
+
+        # Fetch a week of days per round trip rather than one day at a time
+        for chunk_start in range(0, max_days, self.read_ahead_days):
+            days = [first_day + timedelta(days=offset)
+                    for offset in range(chunk_start, min(max_days, chunk_start + self.read_ahead_days))]
+            states = self._days(days)
+            for current in days:
+                booked, holds = states[current]
+                start = self.day_start
+                if current == first_day and first_minute > start:
+                    # Round up to the next grid line
+                    steps = -(-(first_minute - self.day_start) // self.slot_step)
+                    start = self.day_start + steps * self.slot_step
+                while start + duration <= self.day_end:
+                    if not _blocked(booked, holds, start, start + duration, owner, now):
+                        found.append(datetime.combine(current, datetime.min.time()) + timedelta(minutes=start))
+                        if len(found) >= count:
+                            return found
+                    start += self.slot_step
+        return found
+
+    def holds_count(self) -> int:
+        return self.backend.count_holds(time.time(), self.namespace)
+
+    def __len__(self) -> int:
+        return self.backend.count_slots(self.namespace)
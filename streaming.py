@@ -0,0 +1,108 @@
+import json
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from uuid import UUID
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel, generate_from_stream
+from langchain_core.outputs import ChatResult
+
+
+FINAL_ANSWER_MARKER = "Final Answer:"
+
+TOOL_STATUS = {
+    'check_availability': "🔎 Checking availability...",
+    'find_available_slots': "📅 Looking for open slots...",
+    'save_appointment': "💾 Saving your appointment...",
+    'get_current_datetime': "🕐 Checking today's date...",
+}
+
+
+class StreamingChatModel(BaseChatModel):
+    """Wraps a chat model so plain invoke() calls stream tokens to callbacks
+
+    LangChain 0.1 agents call `invoke` on the model, which never reaches the
+    model's `_stream`, so on_llm_new_token never fires. Routing `_generate`
+    through `_stream` keeps the final result identical while letting a
+    callback handler see tokens as Gemini produces them.
+    """
+
+    inner: BaseChatModel
+
+    @property
+    def _llm_type(self) -> str:
+        return f"streaming-{self.inner._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.inner._identifying_params
+
+    def _supports_streaming(self) -> bool:
+        return type(self.inner)._stream is not BaseChatModel._stream
+
+    def _generate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if not self._supports_streaming():
+            return self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return generate_from_stream(self.inner._stream(messages, stop=stop, run_manager=run_manager, **kwargs))
+
+    async def _agenerate(self, messages, stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        if type(self.inner)._astream is BaseChatModel._astream:
+            return await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+
+        chunks = [chunk async for chunk in self.inner._astream(messages, stop=stop, run_manager=run_manager, **kwargs)]
+        if not chunks:
+            return await self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs)
+        return generate_from_stream(iter(chunks))
+
+
+class StreamingAnswerHandler(BaseCallbackHandler):
+    """Turns agent callbacks into chat events: tool status and final-answer tokens
+
+    Events are `(event, data)` tuples handed to `emit`, which must be safe to
+    call from any thread. Only text after "Final Answer:" is forwarded, so the
+    ReAct Thought/Action scaffolding never reaches the user.
+    """
+
+    def __init__(self, emit: Callable[[str, Dict[str, Any]], None]):
+        self.emit = emit
+        self._buffers: Dict[UUID, str] = {}
+        self._emitted: Dict[UUID, int] = {}
+        self.streamed_text = ""
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, **kwargs: Any):
+        self._buffers[run_id] = ""
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, **kwargs: Any):
+        self._buffers[run_id] = ""
+
+    def on_llm_new_token(self, token: str, *, run_id: UUID, **kwargs: Any):
+        buffer = self._buffers.get(run_id, "") + token
+        self._buffers[run_id] = buffer
+
+        marker = buffer.find(FINAL_ANSWER_MARKER)
+        if marker < 0:
+            return
+        start = max(self._emitted.get(run_id, 0), marker + len(FINAL_ANSWER_MARKER))
+        text = buffer[start:]
+        if run_id not in self._emitted:
+            text = text.lstrip()
+        if text:
+            self._emitted[run_id] = len(buffer)
+            self.streamed_text += text
+            self.emit('token', {'text': text})
+
+    def on_llm_end(self, response, *, run_id: UUID, **kwargs: Any):
+        self._buffers.pop(run_id, None)
+        self._emitted.pop(run_id, None)
+
+    def on_tool_start(self, serialized: Dict[str, Any], input_str: str, **kwargs: Any):
+        name = (serialized or {}).get('name', '')
+        self.emit('status', {'tool': name, 'message': TOOL_STATUS.get(name, "⏳ Working on it...")})
+
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def iter_sse(events: Iterator) -> Iterator[str]:
+    for event, data in events:
+        yield format_sse(event, data)
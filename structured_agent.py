@@ -0,0 +1,130 @@
+import json
+import logging
+import re
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from langchain_core.prompts import PromptTemplate
+
+from fast_path import APPOINTMENT_TYPES, REQUIRED_FIELDS, Extraction, FastPath, normalize_field
+
+
+logger = logging.getLogger(__name__)
+
+STRUCTURED_PROMPT = """You are a friendly healthcare appointment scheduling assistant. Today is {today}.
+
+Read the patient's latest message and answer with ONE JSON object and nothing else:
+{{"fields": {{"name": "", "appointment_type": "", "date": "YYYY-MM-DD", "time": "HH:MM", "email": "", "phone": ""}}, "confirm": null, "intent": "details", "reply": ""}}
+
+Rules:
+- fields: only details the patient gives in this message; leave out the rest. Resolve relative dates against today and use 24-hour time.
+- appointment_type is one of: {appointment_types}.
+- confirm: true if the patient agrees to book the summarized appointment, false if they want to change something, otherwise null.
+- intent: "details" when giving booking details or answering a question, "find_slots" when asking which times are free, "question" for anything else.
+- reply: a short, warm answer when intent is "question", otherwise "".
+
+CONVERSATION SO FAR:
+{chat_history}
+Last question asked: {awaiting}
+
+Patient: {input}
+JSON:"""
+
+_JSON_OBJECT_RE = re.compile(r"\{.*\}", re.S)
+
+
+def parse_structured_reply(text: str) -> Dict[str, Any]:
+    """The JSON object in a model reply; prose replies become a plain answer"""
+    match = _JSON_OBJECT_RE.search(text)
+    if match:
+        try:
+            data = json.loads(match.group(0))
+            if isinstance(data, dict):
+                return data
+        except ValueError:
+            pass
+    logger.warning(f"⚠️ Structured reply was not JSON: {text[:200]!r}")
+    return {'intent': 'question', 'reply': '' if match else text.strip()}
+
+
+def to_extraction(data: Dict[str, Any], today: Optional[date] = None) -> Extraction:
+    """Validated fields and confirmation from a structured reply, in the fast path's shape"""
+    extraction = Extraction()
+    fields = data.get('fields')
+    for field in REQUIRED_FIELDS:
+        value = fields.get(field) if isinstance(fields, dict) else None
+        if value in (None, "") or str(value).upper() in ("YYYY-MM-DD", "HH:MM"):
+            continue
+        try:
+            extraction.fields[field] = normalize_field(field, value, today)
+        except ValueError as e:
+            extraction.errors.append(str(e))
+    if isinstance(data.get('confirm'), bool):
+        extraction.confirmation = data['confirm']
+    return extraction
+
+
+class StructuredBookingAgent:
+    """Single-call agent mode: one JSON reply per turn, availability and booking run locally
+
+    The model only extracts fields, confirmation and intent; the fast path's
+    booking flow then checks the slot, asks the next question or saves, all
+    in the same turn. Stands in for the ReAct AgentExecutor: `invoke` and
+    `ainvoke` take the same inputs plus the session's `appointment_data` and
+    return `output` and `intermediate_steps`.
+    """
+
+    def __init__(self, llm, flow: FastPath, find_slots: Callable[[str], str]):
+        self.llm = llm
+        self.flow = flow
+        self.find_slots = find_slots
+        self.prompt = PromptTemplate.from_template(STRUCTURED_PROMPT)
+        self.verbose = False
+
+    def invoke(self, inputs: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        today = date.today()
+        reply = self.llm.invoke(self._render(inputs, today), config=config)
+        return self._act(inputs, str(reply.content), today)
+
+    async def ainvoke(self, inputs: Dict[str, Any], config: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        today = date.today()
+        reply = await self.llm.ainvoke(self._render(inputs, today), config=config)
+        return self._act(inputs, str(reply.content), today)
+
+    def _render(self, inputs: Dict[str, Any], today: date) -> str:
+        return self.prompt.format(
+            today=f"{today.isoformat()} ({today.strftime('%A')})",
+            appointment_types=", ".join(APPOINTMENT_TYPES),
+            chat_history=inputs.get("chat_history", ""),
+            awaiting=inputs.get("appointment_data", {}).get('_awaiting') or "none",
+            input=inputs["input"]
+        )
+
+    def _act(self, inputs: Dict[str, Any], text: str, today: date) -> Dict[str, Any]:
+        state = inputs.setdefault("appointment_data", {})
+        awaiting = state.get('_awaiting')
+        data = parse_structured_reply(text)
+        extraction = to_extraction(data, today)
+        steps: List[Tuple[str, str]] = []
+
+        for field, value in extraction.fields.items():
+            state[field] = value
+
+        if extraction.fields or extraction.errors or extraction.confirmation is not None:
+            output = self.flow.respond(state, extraction, awaiting)
+            if output is not None:
+                # Slot checks and saves happened inside the flow, so the answer is state-dependent
+                steps.append(("booking_flow", output))
+                return {"output": output, "intermediate_steps": steps}
+
+        if data.get('intent') == 'find_slots':
+            output = self.find_slots(state.get('date') or today.isoformat())
+            steps.append(("find_available_slots", output))
+            return {"output": output, "intermediate_steps": steps}
+
+        output = str(data.get('reply') or "").strip()
+        if not output:
+            # Nothing to say beyond the next question in the booking flow
+            output = self.flow.respond(state, Extraction(), awaiting)
+            steps.append(("booking_flow", output))
+        return {"output": output, "intermediate_steps": steps}
@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Modules live at the repository root; the offline fakes live with the benchmarks
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+
+
+@pytest.fixture
+def make_agent():
+    """Build offline agents: scripted LLM, in-memory store, no Sheets"""
+    from appointment_bot import OptimizedAppointmentAgent
+    from appointment_store import InMemoryAppointmentStore
+    from fakes import ScriptedChatModel
+
+    def build(**options):
+        options.setdefault('llm', ScriptedChatModel(latency=0.0))
+        options.setdefault('store', InMemoryAppointmentStore())
+        return OptimizedAppointmentAgent("test", sheets_spool_path=None, **options)
+
+    return build
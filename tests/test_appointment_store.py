@@ -0,0 +1,62 @@
+import pytest
+
+from appointment_store import InMemoryAppointmentStore, SQLiteAppointmentStore
+from availability import SlotUnavailable
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    store = InMemoryAppointmentStore() if request.param == "memory" else SQLiteAppointmentStore(
+        str(tmp_path / "appointments.db"))
+    yield store
+    store.close()
+
+
+def _appointment(time, duration=30, provider="dr-lee", status="Confirmed"):
+    return {'name': "Jane Doe", 'appointment_type': "checkup", 'date': "2030-05-02", 'time': time,
+            'duration_minutes': duration, 'email': "jane@example.com", 'phone': "5551234567",
+            'created_at': "2030-05-01 09:00:00", 'status': status, 'provider': provider}
+
+
+def test_overlapping_ranges_are_rejected_not_just_equal_starts(store):
+    store.save(_appointment("10:00", duration=60))
+
+    for time in ("10:00", "10:30", "09:45"):
+        with pytest.raises(SlotUnavailable):
+            store.save(_appointment(time))
+    assert store.count() == 1
+
+
+def test_adjacent_slots_and_other_providers_are_free(store):
+    store.save(_appointment("10:00", duration=60))
+
+    store.save(_appointment("09:30"))
+    store.save(_appointment("11:00"))
+    store.save(_appointment("10:30", provider="dr-patel"))
+    assert store.count() == 4
+
+
+def test_only_confirmed_appointments_block_a_range(store):
+    store.save(_appointment("10:00", duration=60, status="Cancelled"))
+
+    store.save(_appointment("10:30"))
+    assert len(list(store.iter_appointments())) == 2
+
+
+def test_a_batch_rejects_rows_overlapping_earlier_rows_of_the_same_batch(store):
+    first, overlapping, later = _appointment("10:00", duration=45), _appointment("10:30"), _appointment("11:00")
+
+    assert store.save_many([first, overlapping, later]) == [overlapping]
+    assert [appointment['time'] for appointment in store.iter_appointments()] == ["10:00", "11:00"]
+
+
+def test_processes_sharing_a_database_cannot_book_overlapping_ranges(tmp_path):
+    path = str(tmp_path / "appointments.db")
+    first, second = SQLiteAppointmentStore(path), SQLiteAppointmentStore(path)
+    try:
+        first.save(_appointment("10:00", duration=60))
+        with pytest.raises(SlotUnavailable):
+            second.save(_appointment("10:15"))
+    finally:
+        first.close()
+        second.close()
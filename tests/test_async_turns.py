@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+
+def _slow(func, seconds):
+    def wrapper(*args, **kwargs):
+        time.sleep(seconds)
+        return func(*args, **kwargs)
+    return wrapper
+
+
+async def _count_ticks(coro):
+    """Run `coro` while counting how often the event loop gets to run another task"""
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            await asyncio.sleep(0.005)
+            ticks += 1
+
+    task = asyncio.create_task(ticker())
+    try:
+        return await coro, ticks
+    finally:
+        task.cancel()
+
+
+def test_blocking_session_io_runs_off_the_event_loop(make_agent, monkeypatch):
+    agent = make_agent()
+    agent.warm_up()
+    monkeypatch.setattr(agent.sessions, "load", _slow(agent.sessions.load, 0.15))
+    monkeypatch.setattr(agent.sessions, "save", _slow(agent.sessions.save, 0.15))
+
+    output, ticks = asyncio.run(_count_ticks(agent.aprocess_message("Hello, do you take walk-ins?", "s")))
+
+    assert output
+    assert ticks >= 20
+
+
+def test_first_turn_builds_the_agent_off_the_event_loop(make_agent, monkeypatch):
+    agent = make_agent()
+    monkeypatch.setattr(agent, "_create_agent", _slow(agent._create_agent, 0.3))
+
+    output, ticks = asyncio.run(_count_ticks(agent.aprocess_message("Hello, do you take walk-ins?", "s")))
+
+    assert output
+    assert ticks >= 20
+
+
+def test_timeout_during_save_still_returns_the_saved_turn(make_agent, monkeypatch):
+    agent = make_agent()
+    monkeypatch.setattr(agent.sessions, "save", _slow(agent.sessions.save, 0.2))
+
+    output = asyncio.run(asyncio.wait_for(agent.aprocess_message("My name is Jane Doe", "s"), timeout=0.05))
+
+    assert "appointment" in output
+    session = agent.sessions.get("s")
+    assert len(session.memory) == 1
+    assert session.appointment_data['name'] == "Jane Doe"
+
+
+def test_reset_waits_for_the_turn_in_progress_without_blocking_the_loop():
+    import httpx
+    from asgi_app import create_async_appointment_bot
+    from fakes import ScriptedChatModel
+
+    app = create_async_appointment_bot("test", sheets_spool_path=None, appointments_db_path=None,
+                                       reminder_db_path=None, llm=ScriptedChatModel(latency=0.3))
+    agent = app.state.agent
+    agent.warm_up()
+
+    async def run():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            turn = asyncio.create_task(client.post("/webhook/chat", json={'message': "Do you take walk-ins?",
+                                                                          'session_id': "s"}))
+            await asyncio.sleep(0.1)
+            reset = await client.post("/reset", json={'session_id': "s"})
+            return (await turn).status_code, reset.status_code
+
+    (chat_status, reset_status), ticks = asyncio.run(_count_ticks(run()))
+
+    assert (chat_status, reset_status) == (200, 200)
+    assert ticks >= 20
+    # The reset ran after the turn saved, so nothing of it survives
+    assert len(agent.sessions.get("s").memory) == 0
@@ -0,0 +1,50 @@
+import json
+from datetime import date, timedelta
+
+from session_store import current_session_id
+
+
+def _slot(days: int = 3, time: str = "10:00") -> str:
+    return f"{(date.today() + timedelta(days=days)).isoformat()} {time}"
+
+
+def test_check_availability_holds_a_free_slot_and_refuses_it_to_others(make_agent):
+    agent = make_agent()
+    check = agent.tool_map['check_availability'].func
+
+    current_session_id.set("first")
+    assert check(_slot()).startswith("✅")
+    current_session_id.set("second")
+    assert check(_slot()).startswith("❌")
+
+
+def test_check_availability_never_reports_available_on_an_index_error(make_agent):
+    agent = make_agent()
+
+    def broken(*args, **kwargs):
+        raise ConnectionError("state backend unreachable")
+
+    agent.availability.hold = broken
+    reply = agent.tool_map['check_availability'].func(_slot())
+    assert not reply.startswith("✅")
+    assert "Could not check availability" in reply
+
+
+def _appointment(**fields) -> str:
+    day, time = _slot().split()
+    return json.dumps({'name': "Jane Doe", 'appointment_type': "checkup", 'date': day, 'time': time,
+                       'email': "jane@example.com", 'phone': "5551234567", **fields})
+
+
+def test_save_appointment_accepts_a_duration_given_as_text(make_agent):
+    agent = make_agent()
+    assert agent.tool_map['save_appointment'].func(_appointment(duration_minutes="45")).startswith("✅")
+    assert next(agent.store.iter_appointments())['duration_minutes'] == 45
+
+
+def test_save_appointment_falls_back_to_the_default_length_for_a_bad_duration(make_agent):
+    for value in ("half an hour", -30, 10 ** 6, [30]):
+        agent = make_agent()
+        assert agent.tool_map['save_appointment'].func(_appointment(duration_minutes=value)).startswith("✅")
+        saved = next(agent.store.iter_appointments())
+        assert saved['duration_minutes'] == agent.schedule.duration_for("checkup")
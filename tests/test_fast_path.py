@@ -0,0 +1,73 @@
+from datetime import date
+
+from fast_path import FastPath, QUESTIONS
+
+TODAY = date(2030, 5, 1)
+
+
+def _fast_path(saved=None):
+    return FastPath(check_slot=lambda day, time: None,
+                    save=lambda payload: (saved.append(payload) if saved is not None else None) or "✅ Appointment booked!")
+
+
+def test_unresolved_turn_does_not_store_guessed_fields():
+    state = {}
+    reply = _fast_path().handle(state, "I'm hoping to get a checkup sometime soon", today=TODAY)
+
+    assert reply is None
+    assert 'name' not in state
+    assert 'appointment_type' not in state
+
+
+def test_unresolved_turn_keeps_only_the_answer_to_the_question_asked():
+    state = {'name': "Jane Doe", '_awaiting': 'email'}
+    reply = _fast_path().handle(state, "it's jane@example.com but my husband might come tomorrow instead",
+                                today=TODAY)
+
+    assert reply is None
+    assert state['email'] == "jane@example.com"
+    assert 'date' not in state
+    assert '_awaiting' not in state
+
+
+def test_resolved_turns_collect_fields_and_book():
+    saved = []
+    fast_path = _fast_path(saved)
+    state = {}
+
+    assert fast_path.handle(state, "My name is Jane Doe", today=TODAY).endswith(QUESTIONS['appointment_type'])
+    fast_path.handle(state, "checkup on 2030-05-03 at 2pm", today=TODAY)
+    fast_path.handle(state, "jane@example.com", today=TODAY)
+    summary = fast_path.handle(state, "555-123-4567", today=TODAY)
+
+    assert "Shall I confirm" in summary
+    assert state['name'] == "Jane Doe" and state['time'] == "14:00" and state['phone'] == "5551234567"
+    assert fast_path.handle(state, "yes", today=TODAY).startswith("✅")
+    assert len(saved) == 1 and state == {}
+
+
+def test_fields_from_an_llm_turn_carry_over_to_local_turns(make_agent):
+    agent = make_agent()
+    agent.process_message("Hi there, I'm John Smith and I need a checkup", session_id="s")
+    assert agent.sessions.get("s").appointment_data['name'] == "John Smith"
+
+    reply = agent.process_message("tomorrow at 2pm", session_id="s")
+
+    assert reply.endswith(QUESTIONS['email'])
+    data = agent.sessions.get("s").appointment_data
+    assert data['name'] == "John Smith" and data['appointment_type'] == "checkup" and data['time'] == "14:00"
+
+
+def test_learn_takes_checked_slots_and_clears_after_a_save():
+    fast_path = _fast_path()
+    state = {'name': "Jane Doe"}
+
+    fast_path.learn(state, "could you check the 3rd for me", [
+        ('check_availability', "2030-05-02 09:00", "❌ Time slot 2030-05-02 09:00 is not available."),
+        ('check_availability', "2030-05-03 2:00 PM", "✅ Time slot 2030-05-03 14:00 appears available"),
+    ], today=TODAY)
+    assert state == {'name': "Jane Doe", 'date': "2030-05-03", 'time': "14:00"}
+
+    fast_path.learn(state, "yes please", [('save_appointment', "{}", "✅ Appointment successfully saved for Jane Doe!")],
+                    today=TODAY)
+    assert state == {}
@@ -0,0 +1,44 @@
+from history import HistoryManager, estimate_tokens
+
+
+def test_only_the_newest_turns_that_fit_the_budget_are_rendered():
+    history = HistoryManager(token_budget=30)
+    for i in range(4):
+        history.add_turn(f"question {i}", f"answer {i} " + "x" * 20)
+
+    rendered = history.render()
+
+    assert "question 3" in rendered and "question 2" in rendered
+    assert "question 1" not in rendered
+    assert rendered.index("question 2") < rendered.index("question 3")
+    assert estimate_tokens(rendered) <= 30
+
+
+def test_turns_beyond_max_turns_and_long_messages_are_truncated():
+    history = HistoryManager(token_budget=10000, max_turns=2, max_message_chars=10)
+    history.add_turn("first", "reply")
+    history.add_turn("second", "reply")
+    history.add_turn("a" * 50, "b" * 50)
+
+    assert len(history) == 2
+    assert history.to_state() == [["second", "reply"], ["a" * 10, "b" * 10]]
+
+
+def test_collected_fields_survive_as_a_summary_line():
+    history = HistoryManager(token_budget=20)
+    history.add_turn("My name is Jane Doe and I would like to book a checkup please", "What date works for you?")
+
+    rendered = history.render({'name': "Jane Doe", 'appointment_type': "checkup"})
+
+    assert rendered == "Collected: Name=Jane Doe, Type=checkup; still needed: Date, Time, Email, Phone"
+    assert HistoryManager().render() == "(new conversation)"
+
+
+def test_rendering_is_refreshed_after_a_new_turn_or_field():
+    history = HistoryManager()
+    history.add_turn("hi", "hello")
+    assert history.render() == "User: hi\nAssistant: hello"
+
+    assert history.render({'email': "jane@example.com"}).startswith("Collected: Email=jane@example.com")
+    history.add_turn("bye", "goodbye")
+    assert history.render().endswith("User: bye\nAssistant: goodbye")
@@ -0,0 +1,95 @@
+from datetime import date, timedelta
+
+import pytest
+
+from concurrency import ServiceSaturated
+from idempotency import IdempotencyCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _ready_to_book(agent, session_id, time):
+    """Put a session at the fast path's confirmation question"""
+    agent.sessions.get(session_id).appointment_data.update({
+        'name': "Jane Doe", 'appointment_type': "checkup",
+        'date': (date.today() + timedelta(days=1)).isoformat(), 'time': time,
+        'email': "jane@example.com", 'phone': "5551234567", '_awaiting': 'confirmation'
+    })
+
+
+def test_keyed_redeliveries_attach_then_replay():
+    cache = IdempotencyCache()
+    leader = cache.claim("s", "yes", "m1")
+    running = cache.claim("s", "yes", "m1")
+    assert leader.leader and not running.leader and not running.future.done()
+
+    cache.complete(leader, "Booked!")
+
+    assert running.result() == "Booked!"
+    later = cache.claim("s", "yes", "m1")
+    assert not later.leader and later.result() == "Booked!"
+    assert cache.stats()['duplicates_attached'] == 1 and cache.stats()['duplicates_replayed'] == 1
+
+
+def test_failed_first_delivery_fails_waiters_and_lets_the_retry_run():
+    cache = IdempotencyCache()
+    leader = cache.claim("s", "yes", "m1")
+    waiting = cache.claim("s", "yes", "m1")
+
+    cache.complete(leader, None)
+
+    with pytest.raises(ServiceSaturated):
+        waiting.result()
+    assert cache.claim("s", "yes", "m1").leader
+
+
+def test_replies_expire_after_the_ttl():
+    clock = Clock()
+    cache = IdempotencyCache(ttl_seconds=10, clock=clock)
+    cache.complete(cache.claim("s", "yes", "m1"), "Booked!")
+
+    clock.now = 11
+    assert cache.claim("s", "yes", "m1").leader
+
+
+def test_text_matching_is_off_unless_configured():
+    assert not IdempotencyCache().covers(None)
+    assert IdempotencyCache().covers("m1")
+
+    clock = Clock()
+    cache = IdempotencyCache(content_ttl_seconds=60, clock=clock)
+    cache.complete(cache.claim("s", "yes"), "Booked!")
+    assert not cache.claim("s", " yes ").leader
+    # Only the session's latest message is matched
+    cache.complete(cache.claim("s", "no"), "Which detail would you like to change?")
+    assert cache.claim("s", "yes").leader
+
+
+def test_consecutive_yes_answers_both_run(make_agent):
+    agent = make_agent(idempotency=IdempotencyCache())
+
+    _ready_to_book(agent, "s", "10:00")
+    assert agent.process_message("yes", session_id="s").startswith("✅")
+    _ready_to_book(agent, "s", "11:00")
+    assert agent.process_message("yes", session_id="s").startswith("✅")
+
+    assert agent.store.count() == 2
+
+
+def test_redelivered_stream_replays_without_booking_twice(make_agent):
+    agent = make_agent(idempotency=IdempotencyCache())
+    _ready_to_book(agent, "s", "10:00")
+
+    first = list(agent.stream_message("yes", session_id="s", idempotency_key="m1"))
+    again = list(agent.stream_message("yes", session_id="s", idempotency_key="m1"))
+
+    assert first[-1] == again[-1]
+    assert first[-1][0] == 'done' and first[-1][1]['response'].startswith("✅")
+    assert agent.store.count() == 1
+    assert agent.idempotency.stats()['duplicates_replayed'] == 1
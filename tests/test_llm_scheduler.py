@@ -0,0 +1,179 @@
+import asyncio
+from typing import Any, List, Optional
+
+import pytest
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from llm_scheduler import (PRIORITY_BOOKING, PRIORITY_NEW, PRIORITY_NORMAL, LLMScheduler, ScheduledChatModel,
+                           llm_priority)
+from streaming import StreamingChatModel
+
+
+class WordsChatModel(BaseChatModel):
+    """Answers `reply` word by word after `latency` seconds, or raises `error`"""
+
+    reply: str = "Final Answer: happy to help"
+    latency: float = 0.0
+    error: Optional[str] = None
+    _calls: Any = None
+
+    class Config:
+        underscore_attrs_are_private = True
+
+    def __init__(self, **kwargs: Any):
+        super().__init__(**kwargs)
+        # Shared by the copies pydantic makes when the model is wrapped
+        self._calls = []
+
+    @property
+    def calls(self) -> int:
+        return len(self._calls)
+
+    @property
+    def _llm_type(self) -> str:
+        return "words-fake"
+
+    def _answer(self, messages: List[BaseMessage]) -> str:
+        self._calls.append(messages[-1].content)
+        if self.error:
+            raise RuntimeError(self.error)
+        return self.reply
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self._answer(messages)))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.latency)
+        for word in self._answer(messages).split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class TokenCollector(BaseCallbackHandler):
+    def __init__(self):
+        self.tokens = []
+
+    def on_llm_new_token(self, token: str, **kwargs: Any):
+        self.tokens.append(token)
+
+
+def test_async_streaming_is_scheduled_and_reaches_callbacks():
+    scheduler = LLMScheduler(requests_per_minute=600)
+    primary = WordsChatModel()
+    model = StreamingChatModel(inner=ScheduledChatModel(primary=primary, scheduler=scheduler))
+    collector = TokenCollector()
+
+    result = asyncio.run(model.ainvoke("hello", config={"callbacks": [collector]}))
+
+    assert result.content.strip() == "Final Answer: happy to help"
+    assert collector.tokens == ["Final ", "Answer: ", "happy ", "to ", "help "]
+    assert scheduler.counts['admitted'] == 1 and primary.calls == 1
+
+
+def test_overflow_goes_to_the_fallback_while_the_bucket_is_exhausted():
+    scheduler = LLMScheduler(requests_per_minute=600, fallback_queue_depth=1)
+    primary, fallback = WordsChatModel(reply="primary"), WordsChatModel(reply="fallback")
+    model = ScheduledChatModel(primary=primary, fallback=fallback, scheduler=scheduler)
+
+    async def run():
+        scheduler.requests.pause(5)
+        queued = asyncio.create_task(model.ainvoke("first"))
+        await asyncio.sleep(0.05)
+        assert scheduler.waiting == 1
+        overflow = await model.ainvoke("second")
+        llm_priority.set(PRIORITY_BOOKING)
+        booking = asyncio.create_task(model.ainvoke("third"))
+        await asyncio.sleep(0.05)
+        # Turns about to book wait for the primary rather than fall back
+        assert scheduler.waiting == 2
+        queued.cancel()
+        booking.cancel()
+        return overflow
+
+    assert asyncio.run(run()).content == "fallback"
+    assert primary.calls == 0 and fallback.calls == 1
+    assert scheduler.counts['fallback'] == 1
+    assert scheduler.waiting == 0
+
+
+def test_rate_limited_primary_falls_back_once_retries_run_out():
+    scheduler = LLMScheduler(max_retries=0)
+    primary = WordsChatModel(error="429 Quota exceeded")
+    model = ScheduledChatModel(primary=primary, fallback=WordsChatModel(reply="fallback"), scheduler=scheduler)
+
+    assert asyncio.run(model.ainvoke("hello")).content == "fallback"
+    assert primary.calls == 1
+    assert scheduler.counts['fallback'] == 1
+
+
+def test_waiting_calls_are_admitted_by_priority_then_arrival():
+    scheduler = LLMScheduler(requests_per_minute=600)
+    admitted = []
+
+    async def call(name, priority):
+        await scheduler.aacquire(priority)
+        admitted.append(name)
+
+    async def run():
+        scheduler.requests.pause(0.2)
+        await asyncio.gather(call("new", PRIORITY_NEW), call("normal", PRIORITY_NORMAL),
+                             call("booking", PRIORITY_BOOKING), call("normal-2", PRIORITY_NORMAL))
+
+    asyncio.run(run())
+    assert admitted == ["booking", "normal", "normal-2", "new"]
+
+
+def test_a_follower_timing_out_does_not_cancel_the_leader():
+    scheduler = LLMScheduler()
+    primary = WordsChatModel(latency=0.2)
+    model = ScheduledChatModel(primary=primary, scheduler=scheduler)
+
+    async def run():
+        leader = asyncio.create_task(model.ainvoke("same prompt"))
+        await asyncio.sleep(0.05)
+        with pytest.raises(asyncio.TimeoutError):
+            await asyncio.wait_for(model.ainvoke("same prompt"), 0.05)
+        return await leader
+
+    assert asyncio.run(run()).content == "Final Answer: happy to help"
+    assert primary.calls == 1
+    assert scheduler.counts['coalesced'] == 1
+
+
+def test_streaming_followers_share_the_leaders_answer():
+    scheduler = LLMScheduler()
+    primary = WordsChatModel(latency=0.1)
+    model = ScheduledChatModel(primary=primary, scheduler=scheduler)
+
+    async def collect():
+        return "".join([chunk.content async for chunk in model.astream("same prompt")])
+
+    async def run():
+        return await asyncio.gather(collect(), collect())
+
+    assert asyncio.run(run()) == ["Final Answer: happy to help "] * 2
+    assert primary.calls == 1
+
+
+def test_react_turns_rank_by_what_earlier_llm_turns_collected(make_agent):
+    scheduler = LLMScheduler(requests_per_minute=6000)
+    agent = make_agent(llm_scheduler=scheduler)
+    priorities = []
+    scheduler.on_wait = lambda priority, waited: priorities.append(priority)
+
+    agent.process_message("Hi there, I'm John Smith and I need a checkup", session_id="s")
+    agent.process_message("tomorrow at 2pm", session_id="s")
+    agent.process_message("john@example.com", session_id="s")
+    agent.process_message("Is there parking near the clinic?", session_id="s")
+
+    # Only the first and last turns reach the model; the last one is a step from booking
+    assert priorities == ["new", "booking"]
@@ -0,0 +1,53 @@
+from metrics import MetricsRegistry
+
+
+def _samples(text):
+    return {line.rsplit(" ", 1)[0]: float(line.rsplit(" ", 1)[1])
+            for line in text.splitlines() if line and not line.startswith("#")}
+
+
+def test_counters_histograms_and_gauges_render_in_the_text_format():
+    registry = MetricsRegistry(prefix="test_")
+    turns = registry.counter("turns_total", "Turns", ["path"])
+    latency = registry.histogram("latency_seconds", "Latency", ["path"], buckets=(0.1, 1.0))
+    registry.gauge("broken", "Raises", lambda: 1 / 0)
+    registry.gauge("depth", "Depth", lambda: 3)
+
+    turns.inc(path="llm")
+    turns.inc(2, path='fast "path"\n')
+    latency.observe(0.05, path="llm")
+    latency.observe(0.5, path="llm")
+    latency.observe(5, path="llm")
+
+    text = registry.render()
+    samples = _samples(text)
+    assert "# TYPE test_turns_total counter" in text and "# HELP test_latency_seconds Latency" in text
+    assert samples['test_turns_total{path="llm"}'] == 1
+    assert samples['test_turns_total{path="fast \\"path\\"\\n"}'] == 2
+    assert samples['test_latency_seconds_bucket{path="llm",le="0.1"}'] == 1
+    assert samples['test_latency_seconds_bucket{path="llm",le="1"}'] == 2
+    assert samples['test_latency_seconds_bucket{path="llm",le="+Inf"}'] == 3
+    assert samples['test_latency_seconds_sum{path="llm"}'] == 5.55
+    assert samples['test_depth'] == 3
+    assert not any(name.startswith("test_broken") for name in samples)
+
+
+def test_turns_are_labelled_by_path_and_tools_by_outcome(make_agent):
+    agent = make_agent()
+    agent.process_message("Hi there, I'm John Smith and I need a checkup", session_id="s")
+    agent.process_message("tomorrow at 2pm", session_id="s")
+
+    react = make_agent(enable_fast_path=False)
+    react.process_message("Hi there, I'm John Smith and I need a checkup", session_id="s")
+    react.process_message("tomorrow at 2pm", session_id="s")
+
+    samples = _samples(agent.metrics.render())
+    assert samples['appointment_bot_turns_total{path="llm"}'] == 1
+    assert samples['appointment_bot_turns_total{path="fast_path"}'] == 1
+    assert samples['appointment_bot_llm_calls_per_turn_count'] == 1
+
+    samples = _samples(react.metrics.render())
+    assert samples['appointment_bot_turns_total{path="llm"}'] == 2
+    assert samples['appointment_bot_tool_duration_seconds_count{tool="check_availability",outcome="ok"}'] == 1
+    assert samples['appointment_bot_llm_prompt_tokens_total'] > 0
+    assert samples['appointment_bot_slot_holds'] == 1
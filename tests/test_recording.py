@@ -0,0 +1,69 @@
+import json
+from datetime import date
+
+import replay
+from recording import ConversationRecorder, date_shift, load_conversations, shift_dates
+
+BOOKING = ["Hi there, I'm John Smith and I need a checkup", "tomorrow at 2pm", "john@example.com",
+           "555-123-4567", "yes"]
+
+
+def _record(make_agent, records, messages, session_id="s", **options):
+    agent = make_agent(recorder=ConversationRecorder(on_record=records.append), **options)
+    for message in messages:
+        agent.process_message(message, session_id=session_id)
+    return agent
+
+
+def test_turns_record_the_path_llm_responses_tools_and_bookings(make_agent):
+    records = []
+    _record(make_agent, records, BOOKING, enable_fast_path=False)
+
+    assert [record['input'] for record in records] == BOOKING
+    assert all(record['path'] == "llm" and record['llm'] for record in records)
+    assert {tool['name'] for record in records for tool in record['tools']} >= {'check_availability',
+                                                                                'save_appointment'}
+    assert records[-1]['booked'][0]['name'] == "John Smith"
+    assert not any(record['booked'] for record in records[:-1])
+
+
+def test_a_recorded_conversation_replays_with_the_same_booking(make_agent, monkeypatch):
+    records = []
+    _record(make_agent, records, BOOKING)
+    conversations = load_conversations(json.dumps(record) for record in records)
+    monkeypatch.setattr(replay, "_WORKER", {'llm': 'recorded', 'agent_mode': None, 'latency_scale': 0.0,
+                                            'fast_path': True, 'date_shift': True, 'gemini_api_key': "test"})
+
+    result = replay.replay_conversation(conversations[0])
+
+    assert result['correct'], result
+    assert result['booked'][0]['time'] == "14:00"
+    assert result['llm_calls']['recorded'] == result['llm_calls']['replayed'] == 1
+    assert result['prompt_changes'] == 0 and result['unscripted_llm_calls'] == 0
+    assert result['changed_replies'] == 0 and result['changed_paths'] == 0
+
+
+def test_resets_split_a_session_into_conversations():
+    lines = [json.dumps(record) for record in [
+        {'session': "a", 'input': "hi"}, {'session': "b", 'input': "hello"},
+        {'session': "a", 'reset': True}, {'session': "a", 'input': "hi again"}
+    ]]
+
+    conversations = load_conversations(lines)
+
+    assert [conversation['id'] for conversation in conversations] == ["a#0", "b#1", "a#2"]
+    assert [len(conversation['turns']) for conversation in conversations] == [1, 1, 1]
+
+
+def test_recorded_dates_move_forward_by_whole_weeks():
+    assert date_shift(date(2030, 5, 1), today=date(2030, 5, 10)) == 14
+    assert date_shift(date(2030, 5, 1), today=date(2030, 4, 1)) == 0
+    assert shift_dates("Booked 2030-05-02 at 14:00", 14) == "Booked 2030-05-16 at 14:00"
+
+
+def test_sampling_picks_whole_sessions():
+    recorder = ConversationRecorder(sample_rate=0.5)
+    sampled = [session for session in (f"s{i}" for i in range(200)) if recorder.records(session)]
+
+    assert 50 < len(sampled) < 150
+    assert all(recorder.records(session) for session in sampled)
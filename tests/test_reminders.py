@@ -0,0 +1,187 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta
+
+from reminders import FileSink, ReminderScheduler, SQLiteReminderStore
+
+# Appointment three days out, on the hour, so reminder due times are easy to reason about
+STARTS = (datetime.now() + timedelta(days=3)).replace(minute=0, second=0, microsecond=0)
+APPOINTMENT = {'name': "Jane Doe", 'appointment_type': "checkup", 'provider': "dr-a",
+               'date': STARTS.date().isoformat(), 'time': STARTS.strftime("%H:%M"),
+               'email': "jane@example.com", 'phone': "5551234567", 'status': 'Confirmed'}
+
+
+class Clock:
+    """Wall clock that tests can move forward; the dispatcher still sleeps in real time"""
+
+    def __init__(self):
+        self.skew = 0.0
+
+    def __call__(self) -> float:
+        return time.time() + self.skew
+
+    def move_to(self, moment: datetime):
+        self.skew = moment.timestamp() - time.time()
+
+
+class FlakySink(FileSink):
+    """FileSink whose first `failures` batches raise"""
+
+    def __init__(self, path, channel='email', failures=0):
+        super().__init__(path, channel)
+        self.failures = failures
+        self.calls = 0
+
+    def send(self, reminders):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError("gateway down")
+        return super().send(reminders)
+
+
+class SlowSink(FileSink):
+    """FileSink that takes a while per batch and records how many batches overlapped"""
+
+    def __init__(self, path, delay):
+        super().__init__(path, 'email')
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self._count_lock = threading.Lock()
+
+    def send(self, reminders):
+        with self._count_lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self._count_lock:
+            self.active -= 1
+        return super().send(reminders)
+
+
+def _outbox(path):
+    try:
+        with open(path, encoding="utf-8") as outbox:
+            return [json.loads(line) for line in outbox]
+    except FileNotFoundError:
+        return []
+
+
+def _wait_until(predicate, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_reminders_are_scheduled_per_offset_and_channel_and_sent_when_due(tmp_path):
+    outbox = str(tmp_path / "outbox.jsonl")
+    clock = Clock()
+    scheduler = ReminderScheduler([FileSink(outbox, 'email'), FileSink(outbox, 'sms')], clock=clock)
+
+    assert scheduler.schedule(APPOINTMENT) == 4
+    assert scheduler.schedule({**APPOINTMENT, 'time': "23:59", 'status': 'Cancelled'}) == 0
+    due = sorted(reminder.due_at for reminder in scheduler.reminders_for(APPOINTMENT))
+    assert due == [(STARTS - timedelta(days=1)).timestamp()] * 2 + [(STARTS - timedelta(hours=2)).timestamp()] * 2
+
+    clock.move_to(STARTS - timedelta(hours=23))
+    scheduler.start()
+    try:
+        _wait_until(lambda: scheduler.stats()['sent'] == 2)
+        assert scheduler.pending_count == 2
+    finally:
+        scheduler.stop()
+    sent = _outbox(outbox)
+    assert sorted(message['to'] for message in sent) == ["5551234567", "jane@example.com"]
+    assert all("|1440|" in message['id'] for message in sent)
+
+
+def test_offsets_already_past_and_channels_without_a_sink_are_skipped(tmp_path):
+    clock = Clock()
+    clock.move_to(STARTS - timedelta(hours=5))
+    scheduler = ReminderScheduler([FileSink(str(tmp_path / "outbox.jsonl"), 'email')], clock=clock)
+
+    assert [reminder.id.split("|")[-2:] for reminder in scheduler.reminders_for(APPOINTMENT)] == [["120", "email"]]
+
+
+def test_failed_batches_are_retried_with_backoff_then_given_up(tmp_path):
+    outbox = str(tmp_path / "outbox.jsonl")
+    clock = Clock()
+    store = SQLiteReminderStore(str(tmp_path / "reminders.db"))
+    sink = FlakySink(outbox, failures=2)
+    scheduler = ReminderScheduler([sink], store=store, offsets_minutes=[1440], retry_delay=0.02, clock=clock)
+
+    scheduler.schedule(APPOINTMENT)
+    clock.move_to(STARTS - timedelta(hours=23))
+    scheduler.start()
+    try:
+        _wait_until(lambda: scheduler.stats()['sent'] == 1)
+    finally:
+        scheduler.stop()
+    assert sink.calls == 3 and scheduler.stats()['retried'] == 2
+    assert _outbox(outbox)[0]['attempt'] == 3
+
+    gives_up = ReminderScheduler([FlakySink(outbox, failures=99)], store=SQLiteReminderStore(str(tmp_path / "other.db")),
+                                 offsets_minutes=[1440], retry_delay=0.01, max_attempts=3, clock=clock)
+    clock.skew = 0.0
+    gives_up.schedule(APPOINTMENT)
+    clock.move_to(STARTS - timedelta(hours=23))
+    gives_up.start()
+    try:
+        _wait_until(lambda: gives_up.stats()['failed'] == 1)
+    finally:
+        gives_up.stop()
+    assert SQLiteReminderStore(str(tmp_path / "other.db")).count('failed') == 1
+
+
+def test_restarts_neither_lose_nor_repeat_reminders(tmp_path):
+    outbox = str(tmp_path / "outbox.jsonl")
+    db = str(tmp_path / "reminders.db")
+    clock = Clock()
+
+    def scheduler():
+        return ReminderScheduler([FileSink(outbox, 'email'), FileSink(outbox, 'sms')], store=SQLiteReminderStore(db),
+                                 clock=clock)
+
+    first = scheduler()
+    assert first.schedule(APPOINTMENT) == 4
+    first.stop()
+
+    # After a restart the pending reminders come back from the store, and rescheduling adds nothing
+    clock.move_to(STARTS - timedelta(hours=1))
+    second = scheduler()
+    assert second.schedule(APPOINTMENT) == 0
+    second.start()
+    try:
+        _wait_until(lambda: second.stats()['sent'] == 4)
+    finally:
+        second.stop()
+
+    third = scheduler()
+    assert third.schedule(APPOINTMENT) == 0
+    third.start()
+    time.sleep(0.1)
+    third.stop()
+    assert third.stats()['sent'] == 0
+    assert len(_outbox(outbox)) == 4
+    assert SQLiteReminderStore(db).count('sent') == 4
+
+
+def test_no_more_batches_run_at_once_than_max_concurrency(tmp_path):
+    outbox = str(tmp_path / "outbox.jsonl")
+    clock = Clock()
+    sink = SlowSink(outbox, delay=0.05)
+    scheduler = ReminderScheduler([sink], offsets_minutes=[1440], batch_size=1, max_concurrency=2, clock=clock)
+
+    appointments = [{**APPOINTMENT, 'provider': f"dr-{i}"} for i in range(8)]
+    assert scheduler.schedule_many(appointments) == 8
+    clock.move_to(STARTS - timedelta(hours=23))
+    scheduler.start()
+    try:
+        _wait_until(lambda: scheduler.stats()['sent'] == 8)
+    finally:
+        scheduler.stop()
+    assert sink.max_active == 2
+    assert scheduler.stats()['batches'] == 8
+    assert len({message['id'] for message in _outbox(outbox)}) == 8
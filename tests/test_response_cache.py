@@ -0,0 +1,90 @@
+from datetime import date, timedelta
+
+import appointment_bot
+import llm_cache
+from fakes import booking_script
+from llm_cache import ResponseCache
+
+QUESTION = "Hello, do you take walk-ins?"
+
+
+def _counting_script(prompts):
+    def script(prompt):
+        prompts.append(prompt)
+        return booking_script(prompt)
+    return script
+
+
+def _agent(make_agent, prompts, cache, **options):
+    from fakes import ScriptedChatModel
+    return make_agent(llm=ScriptedChatModel(latency=0.0, script=_counting_script(prompts)),
+                      response_cache=cache, **options)
+
+
+def test_first_turn_answer_is_served_from_cache_for_other_sessions(make_agent):
+    prompts = []
+    agent = _agent(make_agent, prompts, ResponseCache())
+
+    first = agent.process_message(QUESTION, session_id="a")
+    assert agent.process_message(QUESTION.lower() + "  ", session_id="b") == first
+    assert len(prompts) == 1
+    stats = agent.response_cache.stats()
+    assert stats['hits'] == 1 and stats['misses'] == 1
+
+
+def test_later_turns_and_other_questions_miss(make_agent):
+    prompts = []
+    agent = _agent(make_agent, prompts, ResponseCache())
+
+    agent.process_message(QUESTION, session_id="a")
+    agent.process_message("What about parking nearby?", session_id="b")
+    # Session "a" now has history, so its answer depends on more than the message
+    agent.process_message(QUESTION, session_id="a")
+    assert len(prompts) == 3
+
+
+def test_expired_entries_are_not_served(make_agent, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now[0])
+    prompts = []
+    agent = _agent(make_agent, prompts, ResponseCache(ttl_seconds=60))
+
+    agent.process_message(QUESTION, session_id="a")
+    now[0] += 61
+    agent.process_message(QUESTION, session_id="b")
+    assert len(prompts) == 2
+
+
+def test_disk_tier_survives_a_restart(make_agent, tmp_path):
+    path = str(tmp_path / "cache.db")
+    prompts = []
+    first = _agent(make_agent, prompts, ResponseCache(sqlite_path=path)).process_message(QUESTION, session_id="a")
+
+    cache = ResponseCache(sqlite_path=path)
+    assert _agent(make_agent, prompts, cache).process_message(QUESTION, session_id="b") == first
+    assert len(prompts) == 1
+    assert cache.stats()['disk_hits'] == 1
+
+
+def test_key_changes_with_prompt_tools_and_date(make_agent, monkeypatch):
+    prompts = []
+    cache = ResponseCache()
+    react = _agent(make_agent, prompts, cache)
+    react.process_message(QUESTION, session_id="a")
+
+    monkeypatch.setattr(appointment_bot, "AGENT_PROMPT", appointment_bot.AGENT_PROMPT + "\nBe brief.")
+    _agent(make_agent, prompts, cache).process_message(QUESTION, session_id="b")
+    assert len(prompts) == 2
+
+    class Tomorrow(date):
+        @classmethod
+        def today(cls):
+            return date.today() + timedelta(days=1)
+
+    monkeypatch.setattr(appointment_bot, "date", Tomorrow)
+    react.process_message(QUESTION, session_id="c")
+    assert len(prompts) == 3
+
+    key = ResponseCache.make_key(QUESTION, model="m", temperature=0.1, context=llm_cache.prompt_fingerprint("p", ["a"]))
+    assert key != ResponseCache.make_key(QUESTION, model="m", temperature=0.1,
+                                         context=llm_cache.prompt_fingerprint("p", ["a", "b"]))
@@ -0,0 +1,105 @@
+import os
+from datetime import date, datetime
+
+import pytest
+
+from availability import SlotUnavailable, parse_time
+from schedule import Provider, ProviderSchedule, ScheduleConfig, SlotGrid
+
+MONDAY = date(2030, 5, 6)
+TUESDAY = date(2030, 5, 7)
+
+
+def _t(value):
+    return parse_time(value)
+
+
+def _provider(id, hours="09:00-12:00", weekdays=range(5), **options):
+    return Provider(id, hours={weekday: [tuple(map(_t, hours.split("-")))] for weekday in weekdays}, **options)
+
+
+def _times(grid, bits):
+    return [f"{start // 60:02d}:{start % 60:02d}" for start in grid.starts(bits)]
+
+
+def test_masks_cover_every_unit_an_interval_touches():
+    grid = SlotGrid(ScheduleConfig([_provider("dr-a")]))
+
+    assert grid.mask(_t("09:00"), _t("09:30")) == 0b11 << 36
+    assert grid.mask(_t("09:10"), _t("09:20")) == 0b11 << 36
+    assert grid.mask(_t("09:15"), _t("09:30")) == 0b1 << 37
+
+
+def test_open_hours_only_count_whole_units():
+    grid = SlotGrid(ScheduleConfig([_provider("dr-a", hours="09:10-10:00")]))
+
+    assert grid.open_mask("dr-a", MONDAY) == 0b111 << 37
+    assert grid.within_hours("dr-a", MONDAY, _t("09:15"), _t("10:00"))
+    assert not grid.within_hours("dr-a", MONDAY, _t("09:00"), _t("09:30"))
+
+
+def test_fits_skips_bookings_the_end_of_the_day_and_earlier_starts():
+    grid = SlotGrid(ScheduleConfig([_provider("dr-a")]))
+    grid.mark("dr-a", MONDAY, _t("10:00"), _t("10:30"))
+
+    assert _times(grid, grid.fits("dr-a", MONDAY, 60)) == ["09:00", "10:30", "11:00"]
+    assert _times(grid, grid.fits("dr-a", MONDAY, 60, after=_t("10:15"))) == ["10:30", "11:00"]
+    # A 45-minute appointment still needs three whole units
+    assert _times(grid, grid.fits("dr-a", MONDAY, 45, after=_t("11:00"))) == ["11:00"]
+
+    grid.rebuild("dr-a", MONDAY, [])
+    assert "09:30" in _times(grid, grid.fits("dr-a", MONDAY, 60))
+
+
+def test_clinic_and_provider_closures():
+    config = ScheduleConfig([_provider("dr-a", blackout_dates=[TUESDAY]), _provider("dr-b", weekdays=[0])],
+                            blackout_dates=[date(2030, 5, 8)])
+    schedule = ProviderSchedule(config)
+
+    assert schedule.grid.open_mask("dr-a", date(2030, 5, 8)) == 0
+    assert schedule.closed_reason(date(2030, 5, 8), _t("09:00")) == "We're closed on 2030-05-08."
+    # Dr A is away on Tuesday and Dr B only works Mondays
+    assert schedule.closed_reason(TUESDAY, _t("09:00")) == "We're closed on Tuesday 2030-05-07."
+    assert schedule.closed_reason(MONDAY, _t("11:45")) == (
+        "11:45-12:15 is outside our hours on Monday (09:00-12:00).")
+    assert schedule.closed_reason(MONDAY, _t("09:00")) is None
+
+    checkups_only = ProviderSchedule(ScheduleConfig([_provider("dr-a", appointment_types=["checkup"])]))
+    assert checkups_only.closed_reason(MONDAY, _t("09:00"), appointment_type="dental") == (
+        "We don't offer dental appointments.")
+
+
+def test_bookings_go_to_the_first_free_provider_offering_the_type():
+    config = ScheduleConfig([_provider("dr-a", appointment_types=["checkup"]), _provider("dr-b")],
+                            durations={"consultation": 60})
+    schedule = ProviderSchedule(config)
+
+    assert schedule.confirm(MONDAY, _t("09:00"), appointment_type="checkup") == "dr-a"
+    assert schedule.confirm(MONDAY, _t("09:00"), appointment_type="checkup") == "dr-b"
+    with pytest.raises(SlotUnavailable):
+        schedule.confirm(MONDAY, _t("09:00"), appointment_type="checkup")
+
+    # Only Dr B sees consultations, and they last an hour
+    assert schedule.confirm(MONDAY, _t("10:00"), appointment_type="consultation") == "dr-b"
+    assert schedule.conflicts(MONDAY, _t("10:30"), provider="dr-b") == [(_t("10:00"), _t("11:00"))]
+    assert schedule.next_free_slots(datetime(2030, 5, 6, 9, 0), count=2, appointment_type="consultation") == [
+        datetime(2030, 5, 6, 11, 0), datetime(2030, 5, 7, 9, 0)]
+
+
+def test_removing_a_booking_frees_its_range():
+    schedule = ProviderSchedule(ScheduleConfig([_provider("dr-a")]))
+    schedule.confirm(MONDAY, _t("09:00"), 60)
+    assert schedule.next_free_slots(datetime(2030, 5, 6, 9, 0), count=1) == [datetime(2030, 5, 6, 10, 0)]
+
+    assert schedule.remove(MONDAY, _t("09:00"))
+
+    assert schedule.next_free_slots(datetime(2030, 5, 6, 9, 0), count=1) == [datetime(2030, 5, 6, 9, 0)]
+
+
+def test_sample_schedule_loads():
+    path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "sample_schedule.json")
+    config = ScheduleConfig.from_file(path)
+
+    assert [provider.id for provider in config.providers] == ["dr-patel", "dr-garcia", "dental-room"]
+    assert config.duration_for("Specialist") == 60
+    assert config.providers[0].periods(date(2030, 5, 8)) == [(_t("09:00"), _t("12:30"))]
@@ -0,0 +1,59 @@
+from session_store import SessionStore
+
+
+class FakeMemory:
+    def clear(self):
+        pass
+
+
+def make_store(**kwargs) -> SessionStore:
+    return SessionStore(memory_factory=FakeMemory, **kwargs)
+
+
+def test_lru_eviction_drops_the_oldest_idle_session():
+    store = make_store(max_sessions=2)
+    store.get("a")
+    store.get("b")
+    store.get("c")
+    assert store.peek("a") is None
+    assert store.peek("b") is not None and store.peek("c") is not None
+    assert store.evictions == 1
+
+
+def test_eviction_skips_a_session_with_a_turn_in_progress():
+    store = make_store(max_sessions=2)
+    running = store.begin_turn("a")
+    store.get("b")
+    store.get("c")
+
+    # "b" goes instead of "a", and a request for "a" still shares the running turn's lock
+    assert store.peek("b") is None
+    assert store.get("a") is running
+    store.end_turn(running)
+
+
+def test_eviction_skips_a_session_whose_lock_is_held():
+    store = make_store(max_sessions=1)
+    context = store.get("a")
+    with context.lock:
+        store.get("b")
+        assert store.get("a") is context
+    assert len(store) == 2
+
+
+def test_idle_sessions_expire_but_running_ones_stay(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("session_store.time.monotonic", lambda: now[0])
+    store = make_store(ttl_seconds=10)
+    running = store.begin_turn("long-turn")
+    store.get("idle")
+
+    now[0] += 60
+    store.get("new")
+    assert store.peek("idle") is None
+    assert store.peek("long-turn") is running
+
+    store.end_turn(running)
+    now[0] += 60
+    store.get("newer")
+    assert store.peek("long-turn") is None
@@ -0,0 +1,152 @@
+import json
+import os
+import threading
+import time
+
+from fakes import FakeGspreadClient
+from sheets_writer import SheetsWriteBehind
+
+SHEET_URL = "https://docs.google.com/spreadsheets/d/test"
+
+
+def wait_for(condition, timeout: float = 5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def make_writer(tmp_path, client=None, **options) -> SheetsWriteBehind:
+    options.setdefault('flush_interval', 0.02)
+    options.setdefault('backoff_base', 0.01)
+    options.setdefault('backoff_max', 0.05)
+    return SheetsWriteBehind(client or FakeGspreadClient(latency=0.0), SHEET_URL,
+                             spool_path=str(tmp_path / "spool.jsonl"), **options)
+
+
+def spooled_rows(writer: SheetsWriteBehind):
+    """Rows on disk that have not reached Sheets yet"""
+    rows = []
+    for path, offset in ((writer.spool_path, 0), (writer.spool_path + ".replaying", writer._replayed_offset())):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                f.seek(offset)
+                rows.extend(json.loads(line) for line in f if line.strip())
+    return rows
+
+
+def write_spool(path, rows):
+    with open(path, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(row) + "\n" for row in rows)
+
+
+def test_queued_rows_are_appended_in_batches(tmp_path):
+    client = FakeGspreadClient(latency=0.0)
+    writer = make_writer(tmp_path, client, batch_size=100)
+    for i in range(250):
+        writer.enqueue([i])
+    writer.start()
+    wait_for(lambda: writer.rows_written == 250)
+    writer.stop()
+
+    assert client.worksheet.rows == [[i] for i in range(250)]
+    assert client.worksheet.calls == 3
+
+
+def test_failed_flush_spools_batch_and_queue_then_replays_with_backoff(tmp_path):
+    client = FakeGspreadClient(latency=0.0, failure_rate=1.0)
+    writer = make_writer(tmp_path, client, max_retries=1, batch_size=5)
+    for i in range(20):
+        writer.enqueue([i])
+    writer.start()
+    wait_for(lambda: len(spooled_rows(writer)) == 20)
+    assert writer._queue.qsize() == 0
+
+    # New rows go to disk while Sheets is down
+    writer.enqueue([20])
+    wait_for(lambda: len(spooled_rows(writer)) == 21)
+
+    client.worksheet.failure_rate = 0.0
+    wait_for(lambda: writer.rows_written == 21)
+    writer.stop()
+    assert sorted(client.worksheet.rows) == [[i] for i in range(21)]
+    assert not writer._spool_pending()
+
+
+def test_replay_keeps_the_spool_until_rows_are_written(tmp_path):
+    with open(tmp_path / "spool.jsonl", "w", encoding="utf-8") as f:
+        f.writelines(json.dumps([i]) + "\n" for i in range(10))
+    client = FakeGspreadClient(latency=0.0, failure_rate=1.0)
+    writer = make_writer(tmp_path, client, backoff_base=60, backoff_max=60)
+    writer.start()
+    wait_for(lambda: client.worksheet.calls >= 1)
+    writer.stop()
+
+    assert sorted(spooled_rows(writer)) == [[i] for i in range(10)]
+
+
+def test_a_replay_interrupted_by_a_crash_is_replayed_on_the_next_start(tmp_path):
+    with open(tmp_path / "spool.jsonl.replaying", "w", encoding="utf-8") as f:
+        f.writelines(json.dumps([i]) + "\n" for i in range(3))
+    with open(tmp_path / "spool.jsonl", "w", encoding="utf-8") as f:
+        f.write(json.dumps([3]) + "\n")
+    client = FakeGspreadClient(latency=0.0)
+    writer = make_writer(tmp_path, client)
+    writer.start()
+    wait_for(lambda: writer.rows_written == 4)
+    writer.stop()
+
+    assert sorted(client.worksheet.rows) == [[0], [1], [2], [3]]
+    assert spooled_rows(writer) == []
+
+
+def test_a_replay_resumes_after_the_chunks_already_written(tmp_path):
+    write_spool(tmp_path / "spool.jsonl", [[i] for i in range(10)])
+    client = FakeGspreadClient(latency=0.0)
+    appended = []
+    append_rows = client.worksheet.append_rows
+
+    def fail_after_two_chunks(rows, **kwargs):
+        if len(appended) == 2:
+            raise ConnectionError("Sheets went away")
+        appended.append(rows)
+        return append_rows(rows, **kwargs)
+
+    client.worksheet.append_rows = fail_after_two_chunks
+    writer = make_writer(tmp_path, client, bulk_batch_size=3)
+    assert not writer._replay_spool()
+    assert spooled_rows(writer) == [[i] for i in range(6, 10)]
+
+    # A new process picks up where the crashed one stopped
+    client.worksheet.append_rows = append_rows
+    restarted = make_writer(tmp_path, client, bulk_batch_size=3)
+    assert restarted._replay_spool()
+
+    assert client.worksheet.rows == [[i] for i in range(10)]
+    assert not restarted._spool_pending()
+    assert not os.path.exists(restarted._offset_path)
+
+
+def test_write_rows_never_calls_sheets_on_the_callers_thread(tmp_path):
+    client = FakeGspreadClient(latency=0.0)
+    callers = []
+    append_rows = client.worksheet.append_rows
+    client.worksheet.append_rows = lambda rows, **kwargs: (callers.append(threading.current_thread()),
+                                                           append_rows(rows, **kwargs))
+    writer = make_writer(tmp_path, client, bulk_batch_size=40)
+    writer.start()
+
+    assert writer.write_rows([[i] for i in range(100)])
+    wait_for(lambda: writer.rows_written == 100)
+    writer.stop()
+
+    assert threading.current_thread() not in callers
+    assert client.worksheet.calls == 3
+    assert writer.rows_spooled == 0
+
+
+def test_stop_spools_rows_still_queued(tmp_path):
+    writer = make_writer(tmp_path)
+    writer.enqueue(["never started"])
+    writer.stop()
+    assert spooled_rows(writer) == [["never started"]]
@@ -0,0 +1,150 @@
+import time
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from availability import SlotUnavailable
+from concurrency import ServiceSaturated
+from history import HistoryManager
+from schedule import Provider, ProviderSchedule, ScheduleConfig
+from session_store import SessionStore
+from state_backend import InMemoryStateBackend, SharedAvailabilityIndex
+
+DAY = date.today() + timedelta(days=3)
+
+
+def _replica(backend, **options):
+    return SessionStore(memory_factory=HistoryManager, backend=backend, **options)
+
+
+def test_conversation_continues_on_another_replica(make_agent):
+    backend = InMemoryStateBackend()
+    first, second = make_agent(state_backend=backend), make_agent(state_backend=backend)
+
+    first.process_message("My name is Jane Doe", session_id="s")
+    second.process_message("checkup please", session_id="s")
+
+    session = first.sessions.get("s")
+    first.sessions.load(session)
+    first.sessions.unlock(session)
+    assert session.appointment_data['name'] == "Jane Doe"
+    assert session.appointment_data['appointment_type'] == "checkup"
+    assert len(session.memory) == 2
+
+
+def test_session_round_trip_and_reset():
+    backend = InMemoryStateBackend()
+    store = _replica(backend)
+    context = store.get("s")
+    store.load(context)
+    context.memory.add_turn("hi", "hello")
+    context.appointment_data['email'] = "jane@example.com"
+    assert store.save(context)
+    store.unlock(context)
+
+    other = _replica(backend).get("s")
+    _replica(backend).load(other)
+    assert other.memory.to_state() == [["hi", "hello"]]
+    assert other.appointment_data == {'email': "jane@example.com"}
+
+    assert store.reset("s")
+    assert backend.load_session("s") is None
+
+
+def test_a_reset_on_another_replica_clears_the_local_copy():
+    backend = InMemoryStateBackend()
+    first, second = _replica(backend), _replica(backend)
+    context = first.get("s")
+    first.load(context)
+    context.memory.add_turn("My name is Jane Doe", "What date would you like to come in?")
+    context.appointment_data['name'] = "Jane Doe"
+    first.save(context)
+    first.unlock(context)
+
+    assert second.reset("s")
+
+    first.load(context)
+    first.unlock(context)
+    assert len(context.memory) == 0
+    assert context.appointment_data == {}
+
+
+def test_a_turn_in_progress_locks_the_session_on_other_replicas():
+    backend = InMemoryStateBackend()
+    first, second = _replica(backend), _replica(backend, lock_timeout=0.05)
+    running = first.get("s")
+    first.load(running)
+
+    with pytest.raises(ServiceSaturated):
+        second.load(second.get("s"))
+
+    first.unlock(running)
+    waiting = second.get("s")
+    second.load(waiting)
+    assert waiting.lease is not None
+
+
+def test_a_turn_that_outlived_its_lease_cannot_overwrite_a_newer_save():
+    backend = InMemoryStateBackend()
+    slow, fast = _replica(backend, lease_seconds=0.01), _replica(backend)
+    stale = slow.get("s")
+    slow.load(stale)
+    time.sleep(0.02)
+
+    fresh = fast.get("s")
+    fast.load(fresh)
+    fresh.appointment_data['name'] = "Jane Doe"
+    assert fast.save(fresh)
+    fast.unlock(fresh)
+
+    stale.appointment_data['name'] = "Someone Else"
+    assert not slow.save(stale)
+    assert backend.load_session("s")['appointment_data'] == {'name': "Jane Doe"}
+
+
+def test_holds_and_bookings_conflict_across_indexes_sharing_a_backend():
+    backend = InMemoryStateBackend()
+    first = SharedAvailabilityIndex(backend, cache_ttl=0)
+    second = SharedAvailabilityIndex(backend, cache_ttl=0)
+
+    assert first.hold(DAY, 600, owner="a")
+    assert not second.hold(DAY, 600, owner="b")
+    assert not second.hold(DAY, 615, owner="b")
+    assert not second.is_available(DAY, 600, owner="b")
+    with pytest.raises(SlotUnavailable):
+        second.confirm(DAY, 600, owner="b")
+
+    first.confirm(DAY, 600, owner="a")
+    assert first.holds_count() == 0 and len(second) == 1
+    assert not second.hold(DAY, 600, owner="b")
+    after = datetime.combine(DAY, datetime.min.time()) + timedelta(hours=10)
+    assert second.next_free_slots(after, count=1) == [after + timedelta(minutes=30)]
+
+
+def test_expired_and_released_holds_free_the_slot_for_other_indexes():
+    backend = InMemoryStateBackend()
+    first = SharedAvailabilityIndex(backend, cache_ttl=0)
+    second = SharedAvailabilityIndex(backend, cache_ttl=0)
+
+    assert first.hold(DAY, 600, owner="a", ttl=0.01)
+    time.sleep(0.02)
+    assert second.hold(DAY, 600, owner="b")
+    second.release(DAY, "b")
+    first.confirm(DAY, 600, owner="a")
+    assert not second.is_available(DAY, 600)
+
+
+def test_provider_calendars_sharing_a_backend_count_their_own_holds_and_bookings():
+    backend = InMemoryStateBackend()
+    hours = {weekday: [(9 * 60, 17 * 60)] for weekday in range(7)}
+    config = ScheduleConfig([Provider("dr-a", hours=hours), Provider("dr-b", hours=hours), Provider("dr-c", hours=hours)])
+    schedule = ProviderSchedule(config, lambda provider: SharedAvailabilityIndex(backend, cache_ttl=0,
+                                                                                 namespace=provider.id))
+
+    assert schedule.hold(DAY, 600, owner="a")
+    assert schedule.hold(DAY, 600, owner="b")
+    assert schedule.holds_count() == 2
+    schedule.confirm(DAY, 600, owner="a")
+    assert schedule.holds_count() == 1 and len(schedule) == 1
+    assert backend.count_slots("dr-a") + backend.count_slots("dr-b") == 1
+    assert backend.count_slots() == 0
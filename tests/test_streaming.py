@@ -0,0 +1,76 @@
+import json
+import uuid
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk
+
+from fakes import ScriptedChatModel
+from streaming import StreamingAnswerHandler, format_sse, iter_sse
+
+
+class StreamingScriptedChatModel(ScriptedChatModel):
+    """ScriptedChatModel that streams its reply word by word"""
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        for word in self._reply(messages).split(" "):
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=word + " "))
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+def _parse_sse(body: str):
+    events = []
+    for frame in body.split("\n\n"):
+        if frame:
+            event, data = frame.split("\n")
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def test_sse_frames_carry_the_event_name_and_json_data():
+    frames = list(iter_sse(iter([('token', {'text': "Hi"}), ('done', {'response': "Hi", 'session_id': "s"})])))
+
+    assert frames[0] == 'event: token\ndata: {"text": "Hi"}\n\n'
+    assert _parse_sse("".join(frames))[-1] == ('done', {'response': "Hi", 'session_id': "s"})
+    assert format_sse('status', {'message': "é"}) == 'event: status\ndata: {"message": "\\u00e9"}\n\n'
+
+
+def test_only_text_after_the_final_answer_marker_is_forwarded():
+    events = []
+    handler = StreamingAnswerHandler(lambda event, data: events.append((event, data)))
+    run_id = uuid.uuid4()
+    handler.on_chat_model_start({}, [], run_id=run_id)
+    for token in ["Thought: no tool\nFinal ", "Ans", "wer:  Hello", " there"]:
+        handler.on_llm_new_token(token, run_id=run_id)
+    handler.on_tool_start({'name': 'save_appointment'}, "{}")
+
+    assert events == [('token', {'text': "Hello"}), ('token', {'text': " there"}),
+                      ('status', {'tool': 'save_appointment', 'message': "💾 Saving your appointment..."})]
+    assert handler.streamed_text == "Hello there"
+
+
+def test_stream_message_ends_with_the_full_reply(make_agent):
+    agent = make_agent(llm=StreamingScriptedChatModel(latency=0.0))
+
+    events = list(agent.stream_message("Hi there, I'm John Smith and I need a checkup", session_id="s"))
+
+    tokens = "".join(data['text'] for event, data in events if event == 'token')
+    assert events[-1] == ('done', {'response': "Thanks! 📅 What date would you like to come in?", 'session_id': "s"})
+    assert tokens.strip() == events[-1][1]['response']
+
+
+def test_flask_stream_endpoint_sends_sse_with_a_final_done_event(make_agent):
+    from appointment_bot import create_appointment_bot
+
+    app = create_appointment_bot("test", sheets_spool_path=None, appointments_db_path=None, reminder_db_path=None,
+                                 llm=StreamingScriptedChatModel(latency=0.0))
+    response = app.test_client().post("/webhook/chat/stream", json={'message': "Do you take walk-ins?",
+                                                                    'session_id': "s"})
+
+    assert response.mimetype == "text/event-stream"
+    events = _parse_sse(response.get_data(as_text=True))
+    assert [event for event, _ in events].count('done') == 1
+    assert events[-1][0] == 'done' and events[-1][1]['session_id'] == "s" and events[-1][1]['response']
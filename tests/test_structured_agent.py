@@ -0,0 +1,41 @@
+from datetime import date
+
+from fakes import ScriptedChatModel, structured_script
+from structured_agent import parse_structured_reply, to_extraction
+
+TODAY = date(2030, 5, 1)
+
+
+def test_replies_are_parsed_from_json_or_fall_back_to_prose():
+    assert parse_structured_reply('Sure! {"intent": "details", "confirm": true}') == {'intent': "details",
+                                                                                     'confirm': True}
+    assert parse_structured_reply("We open at nine.") == {'intent': "question", 'reply': "We open at nine."}
+    assert parse_structured_reply("{not json}") == {'intent': "question", 'reply': ""}
+
+
+def test_extraction_skips_placeholders_and_reports_invalid_fields():
+    extraction = to_extraction({
+        'fields': {'name': "Jane Doe", 'date': "YYYY-MM-DD", 'time': "2:30 PM", 'email': "not-an-email"},
+        'confirm': "yes"
+    }, today=TODAY)
+
+    assert extraction.fields == {'name': "Jane Doe", 'time': "14:30"}
+    assert len(extraction.errors) == 1
+    assert extraction.confirmation is None
+
+
+def test_a_booking_takes_one_model_call_per_turn(make_agent):
+    llm = ScriptedChatModel(latency=0.0, script=structured_script)
+    agent = make_agent(llm=llm, agent_mode="structured", enable_fast_path=False)
+
+    replies = [agent.process_message(message, session_id="s") for message in [
+        "Hi, I'm Jane Doe and I'd like a checkup", "tomorrow at 10am", "jane@example.com", "555-123-4567", "yes"
+    ]]
+
+    assert replies[-2].endswith("Shall I confirm this booking? ✅")
+    assert replies[-1].startswith("✅ Appointment successfully saved for Jane Doe!")
+    assert llm.calls == 5
+    assert agent.store.count() == 1
+    appointment = next(agent.store.iter_appointments())
+    assert (appointment['name'], appointment['time'], appointment['email']) == ("Jane Doe", "10:00", "jane@example.com")
+    assert agent.sessions.get("s").appointment_data == {}